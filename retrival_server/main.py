@@ -1,23 +1,42 @@
 import os
+import asyncio
+from contextlib import asynccontextmanager
 from functools import lru_cache
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Query, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 import time
+import threading
+from collections import OrderedDict
 from fastapi.middleware.cors import CORSMiddleware
-from openslide import OpenSlide
 import io
 from PIL import Image
-from openslide.deepzoom import DeepZoomGenerator
-import numpy as np
-from typing import Dict, Tuple, List
-from starlette.responses import StreamingResponse
+from typing import Dict, Tuple, List, TYPE_CHECKING
+from starlette.responses import StreamingResponse, JSONResponse, Response
+import base64
 import json
 import getpass
-from src.qdrant_db import TileVectorDB
+import tempfile
+from src.lazy_resource import LazyResource, ResourceUnavailable
 from src.wsi_db import WSI_DB
-from src.data_models import STAINS, MAGNIFICATIONS, WSI_ENTRY, WSITilePayload
+from src.sample_registry import SampleRegistry
+from src.slide_descriptor_cache import SlideDescriptorCache
+from src.file_index import DirectoryIndex
+from src.thumbnails import ThumbnailCache
+from src.tissue_mask import TissueMask, TissueMaskCache
+from src.heatmap import HeatmapCache, HeatmapRaster
+from src.tile_index import TileIndexCache
+from src.region_export import RegionExporter
+from src.admission import AdmissionController, AdmissionControlMiddleware
+from src.wsi_db_io import read_wsi_entries, iter_csv_lines
+from src.data_models import STAINS, MAGNIFICATIONS, WSI_ENTRY, WSITilePayload, GROUP_BY_FIELDS, ARCHIVE_FORMATS, RegionExportRequest, WSISearchResult, LabelCount, SlideDescriptor, SimilarSlide
 from dotenv import load_dotenv
 load_dotenv()
 
+# openslide and qdrant_client are slow to import; keep them off the startup path
+if TYPE_CHECKING:
+    from openslide import OpenSlide
+    from openslide.deepzoom import DeepZoomGenerator
+
 
 # Getting the application data path
 APPLICATION_DATA_LOCATION = os.getenv("APPLICATION_DATA_LOCATION")
@@ -29,18 +48,192 @@ else:
     print(f"Using the following application path: {APPLICATION_DATA_LOCATION}")
 
 
+QDRANT_ADDRESS = os.getenv("QDRANT_ADDRESS", "http://localhost:8080")
+QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "cosmic_uni_test_lung")
+SAMPLE_ID_TO_WSI_PATH = os.getenv("SAMPLE_ID_TO_WSI_PATH", "../TEST/DFCI_sample_ID_to_WSI.json")
+
+# Async query client: gRPC is optional (needs the Qdrant gRPC port exposed)
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() in ("1", "true", "yes")
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "30"))
+QDRANT_POOL_SIZE = int(os.getenv("QDRANT_POOL_SIZE", "64"))
+
+# Optional JSON list of further collections (cohorts, embedding models, Qdrant nodes)
+# similarity queries can fan out to, and the per-collection query timeout
+QDRANT_COLLECTIONS_CONFIG = os.getenv("QDRANT_COLLECTIONS_CONFIG")
+QDRANT_FANOUT_TIMEOUT = float(os.getenv("QDRANT_FANOUT_TIMEOUT", "10"))
+
+# Admission control: requests doing work share this many slots (keep it below the
+# threadpool size, 40 by default, so queuing happens by priority rather than FIFO)
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() in ("1", "true", "yes")
+ADMISSION_TOTAL_SLOTS = int(os.getenv("ADMISSION_TOTAL_SLOTS", "32"))
+# Slots only visible tiles and metadata may use, and the reverse proxies whose
+# X-Forwarded-For is trusted to identify clients (comma-separated addresses)
+ADMISSION_RESERVED_SLOTS = int(os.getenv("ADMISSION_RESERVED_SLOTS", "8"))
+ADMISSION_TRUSTED_PROXIES = [
+    address.strip() for address in os.getenv("ADMISSION_TRUSTED_PROXIES", "").split(",") if address.strip()
+]
+
+# Worker processes reading regions for /export_regions/
+REGION_EXPORT_WORKERS = int(os.getenv("REGION_EXPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# QDRANT_COLLECTION = "demo_collection_big"
+# SAMPLE_ID_TO_WSI_PATH = "/home/dmv626/WSI-Patch-Retrieval-Database/TEST/SAMPLE_ID_TO_WSI_BIG.json"
+
+
+def create_vector_db():
+    from src.qdrant_db import TileVectorDB
+    return TileVectorDB(QDRANT_ADDRESS, QDRANT_COLLECTION)
+
+
+async def create_async_vector_db():
+    from src.qdrant_db import AsyncTileVectorDB
+    return await AsyncTileVectorDB.create(
+        QDRANT_ADDRESS,
+        QDRANT_COLLECTION,
+        prefer_grpc=QDRANT_PREFER_GRPC,
+        grpc_port=QDRANT_GRPC_PORT,
+        timeout=QDRANT_TIMEOUT,
+        pool_size=QDRANT_POOL_SIZE,
+    )
+
+
+def create_collection_registry():
+    from src.collection_registry import CollectionRegistry
+    return CollectionRegistry.from_file(QDRANT_COLLECTIONS_CONFIG, primary=QDRANT_COLLECTION)
+
+
+async def create_collection_search():
+    from src.collection_registry import CollectionSearch
+    # Shares the async client of the primary collection; retried until it is up
+    return await CollectionSearch.create(
+        collection_registry.get_instance(),
+        async_vector_db.get_instance(),
+        QDRANT_ADDRESS,
+        query_timeout=QDRANT_FANOUT_TIMEOUT,
+        prefer_grpc=QDRANT_PREFER_GRPC,
+        grpc_port=QDRANT_GRPC_PORT,
+        timeout=QDRANT_TIMEOUT,
+        pool_size=QDRANT_POOL_SIZE,
+    )
+
+
+def create_slide_db():
+    from src.slide_embeddings import SlideVectorDB
+    # Shares the tile DB's client; retried until the tile DB is up
+    return SlideVectorDB(vector_db.get_instance().qdrant_client, QDRANT_COLLECTION)
+
+
+async def check_async_vector_db(db) -> bool:
+    return await db.is_client_alive()
+
+
+# All dependencies are initialized (and retried) in the background once the server is up.
+# Until then, routes using them answer 503; tiles and metadata do not need the vector DB.
+
 # Initializing tile vector database
-vector_db = TileVectorDB("http://localhost:8080", "cosmic_uni_test_lung")
-SAMPLE_ID_TO_WSI_PATH = "../TEST/DFCI_sample_ID_to_WSI.json"
+vector_db = LazyResource(
+    "vector_db",
+    create_vector_db,
+    required=False,
+    health_check=lambda db: db._is_client_alive(),
+)
 
-# vector_db = TileVectorDB("http://localhost:8080", "demo_collection_big")
-# SAMPLE_ID_TO_WSI_PATH = "/home/dmv626/WSI-Patch-Retrieval-Database/TEST/SAMPLE_ID_TO_WSI_BIG.json"
+# Async client used by the (async) similarity query routes
+async_vector_db = LazyResource(
+    "async_vector_db",
+    create_async_vector_db,
+    required=False,
+    health_check=check_async_vector_db,
+)
+
+# Collections similarity queries can search (QDRANT_COLLECTION is the primary one)
+collection_registry = LazyResource("collection_registry", create_collection_registry, required=False)
+
+# Fan-out similarity search over the registered collections
+collection_search = LazyResource("collection_search", create_collection_search, required=False)
+
+# Slide-level vectors (companion "<collection>_slides" collection) for slide-to-slide search
+slide_db = LazyResource("slide_db", create_slide_db, required=False)
 
 # Intializing the WSI pandas DB
-wsi_db = WSI_DB(db_dir_path=APPLICATION_DATA_LOCATION)
+wsi_db = LazyResource("wsi_db", lambda: WSI_DB(db_dir_path=APPLICATION_DATA_LOCATION))
+
+# Initializing the sample ID -> WSI path registry (source file is imported lazily on first lookup)
+sample_registry = LazyResource(
+    "sample_registry",
+    lambda: SampleRegistry(
+        db_dir_path=APPLICATION_DATA_LOCATION,
+        source_paths=[SAMPLE_ID_TO_WSI_PATH],
+    ),
+)
+
+# Initializing the persistent slide descriptor cache (lets /metadata/ answer without opening slides)
+descriptor_cache = LazyResource(
+    "descriptor_cache",
+    lambda: SlideDescriptorCache(db_dir_path=APPLICATION_DATA_LOCATION),
+)
+
+# Cached directory listings for the file browser
+directory_index = DirectoryIndex()
+
+# On-disk thumbnail cache
+thumbnail_cache = LazyResource(
+    "thumbnail_cache",
+    lambda: ThumbnailCache(cache_dir=os.path.join(APPLICATION_DATA_LOCATION, "thumbnails")),
+)
+
+# Per-slide tissue masks (tiles over glass are answered with a constant blank tile)
+tissue_masks = LazyResource(
+    "tissue_masks",
+    lambda: TissueMaskCache(cache_dir=os.path.join(APPLICATION_DATA_LOCATION, "tissue_masks")),
+    required=False,
+)
+
+# Spatial indexes over the tiles of recently viewed slides (rebuilt when tiles are ingested)
+tile_indexes = TileIndexCache(
+    load_tiles=lambda wsi_path: vector_db.get_wsi_tiles(wsi_path),
+    count_tiles=lambda wsi_path: vector_db.count_wsi_tiles(wsi_path),
+)
+
+# Rendered similarity heatmaps (rasters per query tile + magnification, and their PNG tiles)
+heatmap_cache = HeatmapCache()
+
+# Process pool reading full-resolution regions for archive exports (started on first use)
+region_exporter = RegionExporter(max_workers=REGION_EXPORT_WORKERS)
+
+RESOURCES = [vector_db, async_vector_db, collection_registry, collection_search, slide_db, wsi_db, sample_registry, descriptor_cache, thumbnail_cache, tissue_masks]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = [asyncio.create_task(resource.run()) for resource in RESOURCES]
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for resource in RESOURCES:
+        await resource.shutdown()
+    region_exporter.close()
+
 
 # Initializing server
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+
+@app.exception_handler(ResourceUnavailable)
+def resource_unavailable_handler(request: Request, exc: ResourceUnavailable) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "5"},
+    )
+
+# Prioritize visible tiles over thumbnails, queries and heatmaps; shed prefetches
+# when busy. Added before CORS so that rejections still carry CORS headers.
+admission = AdmissionController(total_slots=ADMISSION_TOTAL_SLOTS, reserved_slots=ADMISSION_RESERVED_SLOTS)
+if ADMISSION_CONTROL:
+    app.add_middleware(AdmissionControlMiddleware, controller=admission, trusted_proxies=ADMISSION_TRUSTED_PROXIES)
 
 # Allow frontend to access backend
 app.add_middleware(
@@ -49,23 +242,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Offset", "X-Collection-Status", "Retry-After"],
 )
 
-with open(SAMPLE_ID_TO_WSI_PATH, "r") as f:
-    SAMPLE_ID_TO_WSI = json.load(f)
-    WSI_TO_SAMPLE_ID = {v: k for k, v in SAMPLE_ID_TO_WSI.items()}
-
 @lru_cache(maxsize=1)
-def get_active_slide(sample_id: str) -> Tuple[OpenSlide, DeepZoomGenerator]:
-    slide = OpenSlide(SAMPLE_ID_TO_WSI[sample_id])
+def get_active_slide(sample_id: str) -> Tuple["OpenSlide", "DeepZoomGenerator"]:
+    from openslide import OpenSlide
+    from openslide.deepzoom import DeepZoomGenerator
+
+    wsi_path = sample_registry.resolve(sample_id)
+    if wsi_path is None:
+        raise HTTPException(status_code=400, detail=f"Not a valid WSI: {sample_id}")
+    slide = OpenSlide(wsi_path)
     deepzoom = DeepZoomGenerator(slide, tile_size=256, overlap=0, limit_bounds=False)
     return slide, deepzoom
 
 
-@lru_cache(maxsize=1)
 def retrive_wsi_tiles(wsi_path: str) -> List[WSITilePayload]:
-    print("getting tiles")
-    return vector_db.get_wsi_tiles(wsi_path)
+    return tile_indexes.get(wsi_path).tiles
 
 
 @app.get("/")
@@ -73,6 +267,36 @@ def root() -> bool:
     """Simple Ping"""
     return True
 
+
+@app.get("/healthz")
+def healthz() -> Dict:
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz() -> JSONResponse:
+    """Readiness with per-dependency status.
+
+    503 until every required dependency is up; "degraded" when only optional ones
+    (the vector DB, or some of the fan-out collections) are down, in which case
+    tiles and metadata are still served.
+    """
+    dependencies = {resource.name: resource.status() for resource in RESOURCES}
+    collections = collection_search.get_instance().status() if collection_search.ready else None
+    if not all(resource.ready for resource in RESOURCES if resource.required):
+        status, status_code = "not_ready", 503
+    elif not all(resource.ready for resource in RESOURCES) or (collections and collections["unavailable"]):
+        status, status_code = "degraded", 200
+    else:
+        status, status_code = "ready", 200
+    content = {"status": status, "dependencies": dependencies}
+    if collections is not None:
+        content["collections"] = collections
+    if ADMISSION_CONTROL:
+        content["admission"] = admission.status()
+    return JSONResponse(status_code=status_code, content=content)
+
 @app.get("/home_directory/")
 def home_directory() -> str:
     """Returns the path of the user's home directory."""
@@ -80,81 +304,101 @@ def home_directory() -> str:
 
 
 @app.get("/file_browse/")
-def file_browse(dir_path: str) -> Dict[str, List[str]]:
+def file_browse(
+    dir_path: str,
+    prefix: str = "",
+    cursor: str | None = None,
+    limit: int | None = Query(default=None, ge=1, le=10_000),
+    wsi_only: bool = True,
+    check_readable: bool = False,
+) -> Dict[str, List[str] | str | None]:
+    """List a directory for the file browser.
+
+    Only sub-directories and files with a supported WSI extension are returned unless
+    `wsi_only=false`. Pass `limit` to paginate and feed `next_cursor` back as `cursor`
+    for the next page; `prefix` restricts the listing to names starting with it. With
+    `check_readable=true`, `readable` lists the files of the page OpenSlide can open.
+    """
     if not dir_path.startswith("/"):
         user_name = getpass.getuser()
         dir_path = f"/home/{user_name}/{dir_path}"
-    
+
     if not os.path.isdir(dir_path):
         raise HTTPException(status_code=400, detail=f"Not a valid directory path: {dir_path}")
-    
-    try:
-        dirs = []
-        files = []
-        
-        for entry in os.listdir(dir_path):
-            full_path = os.path.join(dir_path, entry)
-            if os.path.isdir(full_path):
-                dirs.append(entry)
-            else:
-                files.append(entry)
-
-        # Sort directories and files alphabetically
-        dirs.sort()
-        files.sort()
-
-        if dir_path != '/':
-            dirs.insert(0, "..")
-        
-        return {"directories": dirs, "files": files}
 
+    try:
+        dirs, files, next_cursor = directory_index.page(
+            dir_path,
+            prefix=prefix,
+            cursor=cursor,
+            limit=limit,
+            wsi_only=wsi_only,
+        )
     except PermissionError:
         raise HTTPException(status_code=403, detail=f"Permission Denied: {dir_path}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if dir_path != '/' and cursor is None:
+        dirs.insert(0, "..")
+
+    response = {"directories": dirs, "files": files, "next_cursor": next_cursor}
+    if check_readable:
+        response["readable"] = [
+            name for name in files if directory_index.is_readable(os.path.join(dir_path, name))
+        ]
+    return response
 
 
 @app.get("/load_wsi/")
 def load_wsi(sample_id: str) -> bool:
 
-    if os.path.exists(sample_id):
-        SAMPLE_ID_TO_WSI[sample_id] = sample_id
-        WSI_TO_SAMPLE_ID[sample_id] = sample_id
+    wsi_path = sample_registry.resolve(sample_id)
+    if wsi_path is None:
+        return False
 
-    if sample_id not in SAMPLE_ID_TO_WSI:
+    # Only warm the descriptor; the slide itself is opened on the first tile request
+    try:
+        descriptor_cache.get(wsi_path)
+    except Exception as e:
+        print(f"Unable to read slide {wsi_path}: {e}")
         return False
-        
-    get_active_slide(sample_id)
     return True
     
 
 @app.get("/metadata/")
-def get_metadata(sample_id: str) -> Dict:
+def get_metadata(sample_id: str, include_tiles: bool = True) -> Dict:
+    """Slide geometry, properties, notes/labels and (unless `include_tiles=false`) all indexed tiles.
 
-    if os.path.exists(sample_id):
-        SAMPLE_ID_TO_WSI[sample_id] = sample_id
-        WSI_TO_SAMPLE_ID[sample_id] = sample_id
+    Viewers that fetch tiles per viewport (/viewport_tiles/) can skip the tile list.
+    """
 
     # get the wsi path
-    try:
-        wsi_path = SAMPLE_ID_TO_WSI[sample_id]
-    except KeyError as e:
+    wsi_path = sample_registry.resolve(sample_id)
+    if wsi_path is None:
         raise HTTPException(status_code=400, detail=f"Not a valid WSI: {sample_id}")
 
-    # load slide (possibly already in memmory)
-    slide, deepzoom = get_active_slide(sample_id=sample_id)
+    # slide geometry/properties (cached by path + mtime + size, slide is not opened on a hit)
+    try:
+        descriptor = descriptor_cache.get(wsi_path)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Unable to read WSI {wsi_path}: {e}")
 
     # dimentions of the lowest resolution
-    extent = deepzoom.level_dimensions[-1]
-    level_tiles = np.array(deepzoom.level_tiles)
+    extent = descriptor.level_dimensions[-1]
 
     # get the resolutions at each level
-    resolutions = [2**i for i in range(deepzoom.level_count)][::-1]
+    resolutions = [2**i for i in range(descriptor.level_count)][::-1]
 
     try:
-        tiles = retrive_wsi_tiles(wsi_path=wsi_path)
+        # also builds the slide's spatial tile index for /viewport_tiles/
+        tiles = retrive_wsi_tiles(wsi_path=wsi_path) if include_tiles else []
     except:
         print("UNABLE TO GET TILES FROM QDRANT")
         tiles = []
 
+    labels = []
+    note = None
     try:
         wsi_entry = wsi_db.get_wsi(wsi_path=wsi_path)
         print(wsi_entry)
@@ -166,12 +410,14 @@ def get_metadata(sample_id: str) -> Dict:
 
     return {
         "location": wsi_path,
-        "level_count": deepzoom.level_count,
-        "level_dimentions": deepzoom.level_dimensions,
+        "level_count": descriptor.level_count,
+        "level_dimentions": descriptor.level_dimensions,
         "extent": [0, 0, extent[0], extent[1]],
-        "level_tiles": level_tiles.tolist(),
-        "mpp_x": float(slide.properties.get("openslide.mpp-x", "0")),
-        "mpp_y": float(slide.properties.get("openslide.mpp-y", "0")),
+        "level_tiles": descriptor.level_tiles,
+        "mpp_x": descriptor.mpp_x,
+        "mpp_y": descriptor.mpp_y,
+        "vendor": descriptor.vendor,
+        "associated_images": descriptor.associated_images,
         "resolutions": resolutions,
         "tiles": tiles,
         "note": note,
@@ -187,6 +433,14 @@ def get_tile(sample_id: str, z: int, x: int, y: int) -> StreamingResponse:
     - x, y: Tile coordinates in DeepZoom format
     """
 
+    wsi_path, descriptor, mask = get_tile_context(sample_id)
+    if wsi_path is None:
+        raise HTTPException(status_code=400, detail=f"Not a valid WSI: {sample_id}")
+
+    # Out-of-range and glass-only tiles never touch OpenSlide
+    if is_blank_tile(descriptor, mask, z, x, y):
+        return blank_tile_response()
+
     _, deepzoom = get_active_slide(sample_id=sample_id)
 
     try:
@@ -196,11 +450,95 @@ def get_tile(sample_id: str, z: int, x: int, y: int) -> StreamingResponse:
                 tile, target_size=(256, 256), fill_color=(255, 255, 255)
             )
     except ValueError:
-        tile = Image.new("RGB", (256, 256), (255, 255, 255))
+        return blank_tile_response()
     return stream_tile(tile)
 
+
+# sample_id -> (expires_at, wsi_path, descriptor, tissue mask), see get_tile_context
+TILE_CONTEXT_TTL = 30.0
+TILE_CONTEXT_SIZE = 64
+_tile_contexts: OrderedDict[str, Tuple[float, str | None, SlideDescriptor | None, TissueMask | None]] = OrderedDict()
+_tile_contexts_lock = threading.Lock()
+
+
+def get_tile_context(sample_id: str) -> Tuple[str | None, SlideDescriptor | None, TissueMask | None]:
+    """The slide path, descriptor and tissue mask /tiles/ needs, resolved once per slide.
+
+    Resolving them costs a SQLite lookup and two stats of the slide; the tiles of a
+    slide come in bursts, so the result is kept in memory for TILE_CONTEXT_TTL
+    seconds (a second while the tissue mask is still being computed). Descriptor
+    and mask are None when not available, in which case tiles render normally.
+    """
+    now = time.monotonic()
+    with _tile_contexts_lock:
+        cached = _tile_contexts.get(sample_id)
+        if cached is not None and now < cached[0]:
+            _tile_contexts.move_to_end(sample_id)
+            return cached[1:]
+
+    wsi_path = sample_registry.resolve(sample_id)
+    descriptor, mask = None, None
+    if wsi_path is not None:
+        try:
+            descriptor = descriptor_cache.get(wsi_path)
+            mask = tissue_masks.get(wsi_path)
+        except Exception:
+            pass
+
+    ttl = 1.0 if descriptor is not None and mask is None else TILE_CONTEXT_TTL
+    with _tile_contexts_lock:
+        _tile_contexts[sample_id] = (now + ttl, wsi_path, descriptor, mask)
+        _tile_contexts.move_to_end(sample_id)
+        while len(_tile_contexts) > TILE_CONTEXT_SIZE:
+            _tile_contexts.popitem(last=False)
+    return wsi_path, descriptor, mask
+
+
+def is_blank_tile(
+    descriptor: SlideDescriptor | None,
+    mask: TissueMask | None,
+    z: int,
+    x: int,
+    y: int,
+    tile_size: int = 256,
+) -> bool:
+    """Whether DeepZoom tile (z, x, y) is out of bounds or contains no tissue.
+
+    Returns False (render normally) whenever the descriptor or mask is not available.
+    """
+    if descriptor is None:
+        return False
+
+    if not 0 <= z < descriptor.level_count:
+        return True
+    cols, rows = descriptor.level_tiles[z]
+    if not (0 <= x < cols and 0 <= y < rows):
+        return True
+
+    if mask is None:
+        return False
+
+    # DeepZoom level z is downsampled 2**(levels - 1 - z) times from level 0
+    downsample = 2 ** (descriptor.level_count - 1 - z)
+    x0, y0 = x * tile_size * downsample, y * tile_size * downsample
+    return not mask.has_tissue(x0, y0, x0 + tile_size * downsample, y0 + tile_size * downsample)
+
+
+@lru_cache(maxsize=1)
+def blank_tile_bytes() -> bytes:
+    """A white 256x256 JPEG, encoded once."""
+    img_byte_array = io.BytesIO()
+    Image.new("RGB", (256, 256), (255, 255, 255)).save(img_byte_array, format="JPEG")
+    return img_byte_array.getvalue()
+
+
+def blank_tile_response() -> Response:
+    return Response(content=blank_tile_bytes(), media_type="image/jpeg")
+
 @app.get("/tile_image/")
 def get_tile_image(wsi_path: str, x: int, y: int, size: int) -> StreamingResponse:
+    from openslide import OpenSlide
+
     slide = OpenSlide(wsi_path)
 
     # Get the best level that can give us a 256x256 tile efficiently
@@ -220,8 +558,73 @@ def get_tile_image(wsi_path: str, x: int, y: int, size: int) -> StreamingRespons
 
     return stream_tile(tile) 
 
+@app.post("/export_regions/")
+async def export_regions(request: RegionExportRequest) -> StreamingResponse:
+    """Full-resolution images of many regions (e.g. similarity hits) as a streamed ZIP or tar.
+
+    Takes (wsi_path, x, y, size, level) regions in level-0 coordinates; tile payloads
+    from /query_similar_tiles/ can be posted as they are. Regions wider than 4096
+    pixels at the level they are read at are not read. The archive ends with a
+    manifest.csv mapping each region to its file (or the error reading it).
+    """
+    if not request.regions:
+        raise HTTPException(status_code=400, detail="No regions to export")
+    if len(request.regions) > 50_000:
+        raise HTTPException(status_code=400, detail="At most 50000 regions per export")
+    for region in request.regions:
+        if region.size <= 0 or region.level < 0:
+            raise HTTPException(status_code=400, detail=f"Invalid region: {region.model_dump()}")
+    wsi_paths = {region.wsi_path for region in request.regions}
+    missing = await run_in_threadpool(lambda: [wsi_path for wsi_path in wsi_paths if not os.path.isfile(wsi_path)])
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Not a file: {missing[0]}")
+
+    if request.archive_format == ARCHIVE_FORMATS.TAR:
+        media_type, filename = "application/x-tar", "regions.tar"
+    else:
+        media_type, filename = "application/zip", "regions.zip"
+    return StreamingResponse(
+        content=region_exporter.stream_archive(request.regions, request.archive_format, request.image_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/thumbnail/")
+def get_thumbnail(wsi_path: str, size: int = Query(default=256, ge=16, le=1024)) -> Response:
+    """JPEG thumbnail of a slide (longest side <= size), served from the disk cache."""
+    if not os.path.isfile(wsi_path):
+        raise HTTPException(status_code=404, detail=f"Not a file: {wsi_path}")
+    try:
+        data = thumbnail_cache.get(wsi_path, size)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Unable to render thumbnail for {wsi_path}: {e}")
+    return Response(content=data, media_type="image/jpeg", headers={"Cache-Control": "max-age=3600"})
+
+
+@app.post("/thumbnails/")
+def get_thumbnails(
+    wsi_paths: List[str],
+    size: int = Query(default=256, ge=16, le=1024),
+) -> Dict[str, str | None]:
+    """Thumbnails for many slides in one response, as JPEG data URLs (None if unreadable)."""
+    if len(wsi_paths) > 500:
+        raise HTTPException(status_code=400, detail="At most 500 thumbnails per request")
+
+    thumbnails = thumbnail_cache.get_many(wsi_paths, size)
+    return {
+        wsi_path: f"data:image/jpeg;base64,{base64.b64encode(data).decode()}" if data else None
+        for wsi_path, data in thumbnails.items()
+    }
+
+
+# Payload fields a caller may ask /query_similar_tiles/ for
+TILE_PAYLOAD_FIELDS = set(WSITilePayload.model_fields) - {"score"}
+
+
 @app.get("/query_similar_tiles/")
-def query_similar_tiles(
+async def query_similar_tiles(
+    response: Response,
     tile_uuid: str,
     max_hits: int = 5,
     min_score: float | None = None,
@@ -230,29 +633,195 @@ def query_similar_tiles(
     magnification_list: List[MAGNIFICATIONS] = Query(default=[]),  # Ensure lists are properly parsed
     stain_list: List[STAINS] = Query(default=[]),
     tag_filter: str | None = None,
+    label_filter: List[str] = Query(default=[]),
+    label_match_all: bool = True,
+    note_query: str | None = None,
+    group_by: GROUP_BY_FIELDS | None = None,
+    group_size: int = Query(default=1, ge=1, le=100),
+    offset: int = Query(default=0, ge=0),
+    fields: List[str] = Query(default=[]),
+    stream: bool = False,
+    collections: List[str] = Query(default=[]),
+    cohort: str | None = None,
 ) -> List[WSITilePayload]:
+    """Tiles similar to `tile_uuid`.
+
+    With `group_by` (wsi_path / patient_id) the result holds up to `group_size` tiles
+    from each of the `max_hits` best matching slides / patients, group after group.
+
+    Large result sets can be paged with `offset` (the `X-Next-Offset` response header
+    is set when more hits may follow), trimmed to some payload `fields` (plus
+    "score"), and/or streamed as NDJSON (`stream=true`), one hit per line, as the
+    hits are fetched from the vector DB page by page.
+
+    By default the registry's default collections are searched (just the primary
+    one unless QDRANT_COLLECTIONS_CONFIG adds more); `collections` or `cohort`
+    select others. Searching several collections queries them concurrently and
+    merges the top hits; the `X-Collection-Status` header (JSON) gives each one's
+    outcome, so partial results (a collection timed out or failed) can be told apart.
+    Paging, `fields` and `stream` work on the primary collection alone.
+    """
 
     print(f"Running similarity query for tile ID: {tile_uuid}")
 
-    return vector_db.run_query(
-        tile_uuid=tile_uuid,
-        max_hits=max_hits,
-        min_similarity=min_score,
+    unknown_fields = set(fields) - TILE_PAYLOAD_FIELDS
+    if unknown_fields:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {sorted(unknown_fields)}")
+    if group_by is not None and (offset or fields or stream):
+        raise HTTPException(status_code=400, detail="group_by cannot be combined with offset, fields or stream")
+
+    try:
+        selected = collection_registry.select(names=collections, cohort=cohort, magnification_list=magnification_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    fan_out = [entry.name for entry in selected] != [collection_registry.primary]
+    if fan_out and (fields or stream):
+        raise HTTPException(status_code=400, detail="fields and stream are only supported on the primary collection")
+    if not selected:
+        return []
+
+    # Restrict the search to slides matching the label/note query, if any
+    wsi_paths = None
+    if label_filter or note_query:
+        wsi_paths, _ = await run_in_threadpool(
+            wsi_db.search_wsi,
+            labels=label_filter,
+            match_all=label_match_all,
+            note_query=note_query,
+            limit=None,
+        )
+        if not wsi_paths:
+            return Response(content=b"", media_type="application/x-ndjson") if stream else []
+
+    filters = dict(
         same_patient=same_pt,
         same_wsi=same_wsi,
         magnification_list=magnification_list,
         stain_list=stain_list,
         tag_filter=tag_filter,
+        wsi_paths=wsi_paths,
     )
 
-@app.get("/similar_tiles_heatmap/")
-def query_similar_tiles(
+    if stream:
+        pages = await async_vector_db.iter_query(
+            tile_uuid=tile_uuid,
+            max_hits=max_hits,
+            min_similarity=min_score,
+            offset=offset,
+            payload_fields=fields,
+            **filters,
+        )
+
+        async def ndjson():
+            async for page in pages:
+                yield "".join(json.dumps(hit) + "\n" for hit in page)
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    if fields:
+        pages = await async_vector_db.iter_query(
+            tile_uuid=tile_uuid,
+            max_hits=max_hits,
+            min_similarity=min_score,
+            offset=offset,
+            payload_fields=fields,
+            **filters,
+        )
+        hits = [hit async for page in pages for hit in page]
+        headers = {"X-Next-Offset": str(offset + len(hits))} if len(hits) == max_hits else None
+        return JSONResponse(content=hits, headers=headers)
+
+    if fan_out:
+        try:
+            results, status = await collection_search.run_query(
+                tile_uuid=tile_uuid,
+                collections=selected,
+                max_hits=max_hits,
+                min_similarity=min_score,
+                group_by=group_by,
+                group_size=group_size,
+                offset=offset,
+                **filters,
+            )
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=str(e.args[0]))
+        if "ok" not in status.values():
+            raise HTTPException(status_code=503, detail={"collections": status})
+        response.headers["X-Collection-Status"] = json.dumps(status)
+    else:
+        results = await async_vector_db.run_query(
+            tile_uuid=tile_uuid,
+            max_hits=max_hits,
+            min_similarity=min_score,
+            group_by=group_by,
+            group_size=group_size,
+            offset=offset,
+            **filters,
+        )
+    if group_by is None and len(results) == max_hits:
+        response.headers["X-Next-Offset"] = str(offset + len(results))
+    return results
+
+
+@app.get("/collections/")
+def list_collections() -> List[Dict]:
+    """Registered collections, and whether each one can currently be searched."""
+    searchable = collection_search.get_instance().dbs if collection_search.ready else {}
+    return [
+        {**entry, "primary": entry["name"] == collection_registry.primary, "available": entry["name"] in searchable}
+        for entry in collection_registry.describe()
+    ]
+
+
+@app.get("/similar_slides/")
+def similar_slides(
+    wsi_path: str,
+    magnification: MAGNIFICATIONS,
+    max_hits: int = 10,
+    method: str = Query(default="centroids", pattern="^(centroids|mean)$"),
+    tiles_per_slide: int = Query(default=3, ge=0, le=20),
+    same_pt: bool | None = None,
+    label_filter: List[str] = Query(default=[]),
+    label_match_all: bool = True,
+    note_query: str | None = None,
+) -> List[SimilarSlide]:
+    """Slides ranked by slide-level similarity to `wsi_path`, each with its best-matching tiles."""
+
+    print(f"Running slide similarity query for: {wsi_path}")
+
+    wsi_paths = None
+    if label_filter or note_query:
+        wsi_paths, _ = wsi_db.search_wsi(
+            labels=label_filter,
+            match_all=label_match_all,
+            note_query=note_query,
+            limit=None,
+        )
+        if not wsi_paths:
+            return []
+
+    try:
+        return slide_db.query_similar_slides(
+            wsi_path=wsi_path,
+            magnification=magnification,
+            max_hits=max_hits,
+            use_centroids=method == "centroids",
+            same_patient=same_pt,
+            wsi_paths=wsi_paths,
+            tiles_per_slide=tiles_per_slide,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+async def compute_heatmap_tiles(
     tile_uuid: str,
     magnification: MAGNIFICATIONS | None = None,
 ) -> List[WSITilePayload]:
-    
-    tile_payload, _ = vector_db.get_tile(tile_uuid=tile_uuid)
-    tiles = retrive_wsi_tiles(wsi_path=tile_payload.wsi_path)
+    """Every tile of the query tile's slide (at `magnification`) scored against the query tile."""
+
+    tile_payload, _ = await async_vector_db.get_tile(tile_uuid=tile_uuid)
+    tiles = await run_in_threadpool(retrive_wsi_tiles, wsi_path=tile_payload.wsi_path)
     all_uuids = {tile.uuid for tile in tiles}
 
     if not magnification:
@@ -260,7 +829,7 @@ def query_similar_tiles(
 
     print(f"Running tile similarity heatmap: {tile_uuid}")
 
-    result = vector_db.run_query(
+    result = await async_vector_db.run_query(
         tile_uuid=tile_uuid,
         max_hits=1_000_000,
         min_similarity=-1,
@@ -271,16 +840,17 @@ def query_similar_tiles(
 
     missed_uuids = all_uuids.difference(result_uuids)
 
-    result.extend(
-        vector_db.run_query(
-            tile_uuid=tile_uuid,
-            max_hits=1_000_000,
-            min_similarity=-1,
-            same_wsi=True,
-            magnification_list=[magnification],
-            uuids=missed_uuids,
+    if missed_uuids:
+        result.extend(
+            await async_vector_db.run_query(
+                tile_uuid=tile_uuid,
+                max_hits=1_000_000,
+                min_similarity=-1,
+                same_wsi=True,
+                magnification_list=[magnification],
+                uuids=missed_uuids,
+            )
         )
-    )
 
     if magnification == tile_payload.magnification:
         tile_payload.score = 1.0
@@ -289,6 +859,115 @@ def query_similar_tiles(
     return result
 
 
+@app.get("/similar_tiles_heatmap/")
+async def similar_tiles_heatmap(
+    tile_uuid: str,
+    magnification: MAGNIFICATIONS | None = None,
+) -> List[WSITilePayload]:
+    return await compute_heatmap_tiles(tile_uuid=tile_uuid, magnification=magnification)
+
+
+async def get_heatmap_raster(tile_uuid: str, magnification: MAGNIFICATIONS | None) -> Tuple[HeatmapRaster, SlideDescriptor]:
+    """Build (or reuse) the score raster for a query tile, plus its slide's descriptor."""
+
+    async def build() -> Tuple[HeatmapRaster, SlideDescriptor]:
+        tiles = await compute_heatmap_tiles(tile_uuid=tile_uuid, magnification=magnification)
+        if not tiles:
+            raise HTTPException(status_code=404, detail=f"No tiles to score for {tile_uuid}")
+        descriptor = await run_in_threadpool(descriptor_cache.get, tiles[0].wsi_path)
+        width, height = descriptor.slide_dimensions[0]
+        raster = await run_in_threadpool(HeatmapRaster, tiles, width, height)
+        return raster, descriptor
+
+    key = (tile_uuid, magnification.value if magnification else None)
+    return await heatmap_cache.get_raster(key, build)
+
+
+@app.get("/viewport_tiles/")
+async def viewport_tiles(
+    sample_id: str,
+    z: int,
+    x0: float = Query(allow_inf_nan=False),
+    y0: float = Query(allow_inf_nan=False),
+    x1: float = Query(allow_inf_nan=False),
+    y1: float = Query(allow_inf_nan=False),
+    magnification: MAGNIFICATIONS | None = None,
+    heatmap_tile_uuid: str | None = None,
+    heatmap_magnification: MAGNIFICATIONS | None = None,
+) -> List[WSITilePayload]:
+    """Indexed tiles intersecting a viewport.
+
+    The box [x0, x1) x [y0, y1) is in pixels of DeepZoom level `z` (the viewer's
+    current level). With `heatmap_tile_uuid`, each tile carries its score from that
+    query tile's heatmap (cached, see /heatmap_tiles/); tiles it did not score get None.
+    """
+    wsi_path = await run_in_threadpool(sample_registry.resolve, sample_id)
+    if wsi_path is None:
+        raise HTTPException(status_code=400, detail=f"Not a valid WSI: {sample_id}")
+
+    try:
+        descriptor = await run_in_threadpool(descriptor_cache.get, wsi_path)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Unable to read WSI {wsi_path}: {e}")
+    if not 0 <= z < descriptor.level_count:
+        raise HTTPException(status_code=400, detail=f"Invalid level: {z}")
+
+    # Level z pixels -> level 0 pixels
+    downsample = 2 ** (descriptor.level_count - 1 - z)
+    index = await run_in_threadpool(tile_indexes.get, wsi_path)
+    try:
+        tiles = await run_in_threadpool(
+            index.query, x0 * downsample, y0 * downsample, x1 * downsample, y1 * downsample, magnification
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if heatmap_tile_uuid:
+        raster, _ = await get_heatmap_raster(heatmap_tile_uuid, heatmap_magnification)
+        tiles = [tile.model_copy(update={"score": raster.scores.get(tile.uuid)}) for tile in tiles]
+
+    return tiles
+
+
+@app.get("/heatmap_info/")
+async def heatmap_info(
+    tile_uuid: str,
+    magnification: MAGNIFICATIONS | None = None,
+) -> Dict:
+    """Summary of a query tile's heatmap; also warms the raster used by /heatmap_tiles/."""
+    raster, descriptor = await get_heatmap_raster(tile_uuid, magnification)
+    return {
+        "wsi_path": descriptor.wsi_path,
+        "n_tiles": raster.n_tiles,
+        "min_score": raster.min_score,
+        "max_score": raster.max_score,
+        "level_count": descriptor.level_count,
+    }
+
+
+@app.get("/heatmap_tiles/{z}/{x}/{y}/")
+async def get_heatmap_tile(
+    z: int,
+    x: int,
+    y: int,
+    tile_uuid: str,
+    magnification: MAGNIFICATIONS | None = None,
+) -> Response:
+    """Similarity heatmap of a query tile as a transparent PNG in DeepZoom tile coordinates.
+
+    Uses the same pyramid as /tiles/, so it can be layered directly over the slide.
+    """
+    key = (tile_uuid, magnification.value if magnification else None)
+    data = heatmap_cache.get_tile(key, z, x, y)
+    if data is None:
+        raster, descriptor = await get_heatmap_raster(tile_uuid, magnification)
+        if not 0 <= z < descriptor.level_count:
+            raise HTTPException(status_code=400, detail=f"Invalid level: {z}")
+        data = await run_in_threadpool(raster.render_tile, z, x, y, descriptor.level_count)
+        heatmap_cache.put_tile(key, z, x, y, data)
+    return Response(content=data, media_type="image/png", headers={"Cache-Control": "max-age=300"})
+
+
 @app.put("/wsi_data_update/")
 def wsi_data_update(wsi_entry: WSI_ENTRY):
     try:
@@ -299,6 +978,82 @@ def wsi_data_update(wsi_entry: WSI_ENTRY):
         raise HTTPException(status_code=500, detail="Failed to update entry")
 
 
+@app.get("/wsi_search/")
+def wsi_search(
+    labels: List[str] = Query(default=[]),
+    match_all: bool = True,
+    note_query: str | None = None,
+    limit: int = Query(default=100, ge=1, le=10_000),
+    offset: int = Query(default=0, ge=0),
+) -> WSISearchResult:
+    """Find slides carrying the given labels and/or whose note matches `note_query`."""
+    wsi_paths, total = wsi_db.search_wsi(
+        labels=labels,
+        match_all=match_all,
+        note_query=note_query,
+        limit=limit,
+        offset=offset,
+    )
+    next_offset = offset + len(wsi_paths)
+    return WSISearchResult(
+        wsi_paths=wsi_paths,
+        total=total,
+        next_offset=next_offset if next_offset < total else None,
+    )
+
+
+@app.get("/wsi_labels/")
+def wsi_labels() -> List[LabelCount]:
+    """All labels in use, with the number of slides carrying each."""
+    return [LabelCount(label=label, count=count) for label, count in wsi_db.get_labels()]
+
+
+@app.put("/wsi_data_bulk_update/")
+def wsi_data_bulk_update(wsi_entries: List[WSI_ENTRY]):
+    """Upsert many WSI entries in batched transactions (empty entries are deleted)."""
+    try:
+        count = wsi_db.bulk_upsert(wsi_entries)
+        return {"success": True, "count": count}
+    except Exception as e:
+        print(f"Failed to bulk update {len(wsi_entries)} entries. Exception: {e}")
+        raise HTTPException(status_code=500, detail="Failed to update entries")
+
+
+@app.put("/wsi_data_import/")
+async def wsi_data_import(request: Request, file_format: str = "csv"):
+    """Import WSI entries from a raw CSV or Parquet request body.
+
+    The body is spooled to a temporary file chunk by chunk and then streamed into
+    the database, so memory use does not depend on the size of the upload.
+    """
+    if file_format not in ("csv", "parquet"):
+        raise HTTPException(status_code=400, detail=f"Unsupported file format: {file_format}")
+
+    with tempfile.NamedTemporaryFile(suffix=f".{file_format}") as tmp:
+        async for chunk in request.stream():
+            # Disk writes would stall the event loop for large uploads
+            await run_in_threadpool(tmp.write, chunk)
+        await run_in_threadpool(tmp.flush)
+
+        try:
+            count = await run_in_threadpool(wsi_db.bulk_upsert, read_wsi_entries(tmp.name))
+        except (KeyError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid {file_format} file: {e}")
+
+    return {"success": True, "count": count}
+
+
+@app.get("/wsi_data_export/")
+def wsi_data_export(wsi_paths: List[str] = Query(default=[])) -> StreamingResponse:
+    """Stream WSI entries as CSV, either all of them or only the requested paths."""
+    wsi_entries = wsi_db.bulk_export(wsi_paths=wsi_paths or None)
+    return StreamingResponse(
+        content=iter_csv_lines(wsi_entries),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="wsi_data.csv"'},
+    )
+
+
 
 def resize_and_fill(
     image: Image,
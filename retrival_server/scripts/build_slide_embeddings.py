@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+
+# Set the root directory dynamically
+ROOT_DIR = Path(__file__).resolve().parent.parent  # Adjust as needed
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.data_models import MAGNIFICATIONS
+from src.slide_embeddings import SlideVectorDB
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build slide-level vectors (mean + k-means centroids) for slides already in a tile collection."
+    )
+    parser.add_argument("--qdrant-address", default=os.getenv("QDRANT_ADDRESS", "http://localhost:8080"))
+    parser.add_argument("--collection", default=os.getenv("QDRANT_COLLECTION", "cosmic_uni_test_lung"))
+    parser.add_argument("--n-centroids", type=int, default=8)
+    parser.add_argument("--wsi-path", action="append", help="Only (re)build these slides (repeatable)")
+    parser.add_argument("--magnification", type=MAGNIFICATIONS, help="Only (re)build this magnification")
+    parser.add_argument("--skip-existing", action="store_true", help="Leave slides that already have a slide vector")
+    args = parser.parse_args()
+
+    client = QdrantClient(location=args.qdrant_address)
+    slide_db = SlideVectorDB(client, args.collection, n_centroids=args.n_centroids)
+
+    start = time.time()
+    built = skipped = 0
+    for wsi_path, magnification in slide_db.iter_tile_slides():
+        if args.wsi_path and wsi_path not in args.wsi_path:
+            continue
+        if args.magnification and magnification != args.magnification:
+            continue
+        if args.skip_existing and slide_db.get_slide(wsi_path, magnification) is not None:
+            skipped += 1
+            continue
+
+        slide = slide_db.rebuild_slide(wsi_path, magnification)
+        built += 1
+        print(f"{built}: {wsi_path} ({magnification.value}, {slide.n_tiles} tiles)")
+
+    print(f"Built {built} slide vectors into {slide_db.collection_name} ({skipped} skipped) in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.models import HnswConfigDiff, OptimizersConfigDiff, VectorParams
+
+# Set the root directory dynamically
+ROOT_DIR = Path(__file__).resolve().parent.parent  # Adjust as needed
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.qdrant_db import TileVectorDB
+from src.collection_snapshot import export_collection, import_collection, read_manifest, snapshot_filter
+
+load_dotenv()
+
+# Qdrant's default; indexing is switched off while bulk loading and restored after
+DEFAULT_INDEXING_THRESHOLD = 20_000
+
+
+def create_collection(client: QdrantClient, collection_name: str, manifest: dict, args) -> None:
+    if client.collection_exists(collection_name):
+        if not args.recreate:
+            raise SystemExit(f"Collection {collection_name} already exists (use --recreate to replace it)")
+        client.delete_collection(collection_name)
+
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=VectorParams(
+            size=manifest["vector_size"],
+            distance=manifest["distance"],
+            on_disk=args.on_disk,
+        ),
+        hnsw_config=HnswConfigDiff(m=args.hnsw_m, ef_construct=args.ef_construct, on_disk=args.on_disk),
+        # Build the HNSW index once after the upload instead of incrementally during it
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=0),
+    )
+    for field, schema in manifest["payload_indexes"].items():
+        client.create_payload_index(collection_name, field_name=field, field_schema=schema)
+    print(f"Created collection {collection_name} ({manifest['vector_size']} dims, {manifest['distance']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a tile collection to compact shards, or load shards into a new collection.")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("snapshot_dir", help="Directory holding manifest.json and the .npz shards")
+    parser.add_argument("--qdrant-address", default=os.getenv("QDRANT_ADDRESS", "http://localhost:8080"))
+    parser.add_argument("--collection", default=os.getenv("QDRANT_COLLECTION", "cosmic_uni_test_lung"),
+                        help="Collection to export from / import into")
+
+    export_args = parser.add_argument_group("export")
+    export_args.add_argument("--shard-size", type=int, default=100_000, help="Points per shard")
+    export_args.add_argument("--wsi-path", action="append", help="Only these slides (repeatable)")
+    export_args.add_argument("--patient-id", action="append", help="Only these patients (repeatable)")
+    export_args.add_argument("--magnification", help='Only this magnification, e.g. "20x"')
+    export_args.add_argument("--stain", help='Only this stain, e.g. "H&E"')
+    export_args.add_argument("--dataset", help="Only this dataset")
+    export_args.add_argument("--tag", action="append", help="Only tiles carrying this tag (repeatable, all must match)")
+
+    import_args = parser.add_argument_group("import")
+    import_args.add_argument("--recreate", action="store_true", help="Replace the collection if it exists")
+    import_args.add_argument("--parallel", type=int, default=os.cpu_count(), help="Upload worker processes")
+    import_args.add_argument("--batch-size", type=int, default=256)
+    import_args.add_argument("--hnsw-m", type=int, default=16)
+    import_args.add_argument("--ef-construct", type=int, default=100)
+    import_args.add_argument("--on-disk", action="store_true", help="Keep vectors and HNSW graph on disk")
+    args = parser.parse_args()
+
+    start = time.time()
+
+    if args.command == "export":
+        db = TileVectorDB(args.qdrant_address, args.collection)
+        export_collection(
+            db,
+            args.snapshot_dir,
+            scroll_filter=snapshot_filter(
+                wsi_paths=args.wsi_path,
+                patient_ids=args.patient_id,
+                magnification=args.magnification,
+                stain=args.stain,
+                dataset=args.dataset,
+                tags=args.tag,
+            ),
+            shard_size=args.shard_size,
+        )
+        return
+
+    manifest = read_manifest(args.snapshot_dir)
+    create_collection(QdrantClient(location=args.qdrant_address), args.collection, manifest, args)
+
+    db = TileVectorDB(args.qdrant_address, args.collection)
+    count = import_collection(db, args.snapshot_dir, batch_size=args.batch_size, parallel=args.parallel)
+
+    db.qdrant_client.update_collection(
+        args.collection,
+        optimizer_config=OptimizersConfigDiff(indexing_threshold=DEFAULT_INDEXING_THRESHOLD),
+    )
+    print(f"Imported {count} points into {args.collection} in {time.time() - start:.1f}s (indexing continues in the background)")
+
+
+if __name__ == "__main__":
+    main()
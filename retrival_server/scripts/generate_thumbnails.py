@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+# Set the root directory dynamically
+ROOT_DIR = Path(__file__).resolve().parent.parent  # Adjust as needed
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.file_index import WSI_EXTENSIONS
+from src.sample_registry import SampleRegistry
+from src.thumbnails import ThumbnailCache
+
+load_dotenv()
+
+
+def iter_directory_slides(dir_path: str, recursive: bool):
+    """Yield slide paths (by extension) under `dir_path`."""
+    for root, dirs, files in os.walk(dir_path):
+        for name in sorted(files):
+            if name.lower().endswith(WSI_EXTENSIONS):
+                yield os.path.join(root, name)
+        if not recursive:
+            break
+
+
+def build_thumbnail(cache_dir: str, wsi_path: str, size: int) -> str | None:
+    """Worker: render one thumbnail into the cache. Returns an error message on failure."""
+    try:
+        ThumbnailCache(cache_dir).get(wsi_path, size)
+        return None
+    except Exception as e:
+        return str(e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate slide thumbnails into the server's thumbnail cache.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", help="Directory of slides")
+    source.add_argument("--registry", action="store_true", help="Every slide in the sample registry")
+    parser.add_argument("--recursive", action="store_true", help="Recurse into sub-directories of --dir")
+    parser.add_argument("--db-dir", default=os.getenv("APPLICATION_DATA_LOCATION", "~/.wsi_viewer/"))
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    cache_dir = os.path.join(os.path.expanduser(args.db_dir), "thumbnails")
+
+    if args.dir:
+        wsi_paths = list(iter_directory_slides(args.dir, args.recursive))
+    else:
+        registry = SampleRegistry(db_dir_path=args.db_dir)
+        wsi_paths = list(registry.iter_wsi_paths())
+        registry.close()
+
+    print(f"Generating {len(wsi_paths)} thumbnails with {args.workers} processes into {cache_dir}")
+    start = time.time()
+    failed = 0
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(build_thumbnail, cache_dir, wsi_path, args.size): wsi_path
+            for wsi_path in wsi_paths
+        }
+        for i, future in enumerate(as_completed(futures), start=1):
+            error = future.result()
+            if error:
+                failed += 1
+                print(f"FAILED {futures[future]}: {error}")
+            if i % 100 == 0:
+                print(f"{i}/{len(wsi_paths)} done ({time.time() - start:.0f}s)")
+
+    print(f"Done: {len(wsi_paths) - failed} thumbnails, {failed} failures in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import os
+import sys
+import argparse
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Set the root directory dynamically
+ROOT_DIR = Path(__file__).resolve().parent.parent  # Adjust as needed
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.sample_registry import SampleRegistry
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import sample ID -> WSI path mappings into the sample registry.")
+    parser.add_argument("source", help="JSON ({sample_id: wsi_path}) or CSV file to import")
+    parser.add_argument("--db-dir", default=os.getenv("APPLICATION_DATA_LOCATION", "~/.wsi_viewer/"))
+    parser.add_argument("--sample-id-column", default="sample_id", help="CSV column holding the sample ID")
+    parser.add_argument("--wsi-path-column", default="wsi_path", help="CSV column holding the WSI path")
+    args = parser.parse_args()
+
+    registry = SampleRegistry(db_dir_path=args.db_dir)
+
+    if args.source.lower().endswith(".csv"):
+        count = registry.import_csv(
+            args.source,
+            sample_id_column=args.sample_id_column,
+            wsi_path_column=args.wsi_path_column,
+        )
+    else:
+        count = registry.import_json(args.source)
+
+    registry.close()
+    print(f"Imported {count} samples into {registry.db_path}")
+
+
+if __name__ == "__main__":
+    main()
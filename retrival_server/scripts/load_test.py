@@ -0,0 +1,477 @@
+"""
+Trace-replay load generator for viewer traffic.
+
+A session mimics one viewer user: open a slide (/metadata/), pan and zoom around
+it (bursts of /tiles/ for the tiles coming into view), run similarity queries and
+look at the hits (/query_similar_tiles/ + /tile_image/), and open heatmaps. Many
+sessions are replayed concurrently and per-route latency percentiles and
+throughput are reported.
+
+    # synthetic slide + in-memory vector store, server spawned in a subprocess
+    python scripts/load_test.py run --sessions 50
+
+    # against a running server
+    python scripts/load_test.py run --url http://localhost:8000 --sample-id /data/slide.svs
+
+Sessions can be saved with --record and replayed with --trace (JSON lines, one
+session per line), e.g. to replay the same traffic before and after a change.
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+import httpx
+import numpy as np
+
+# Set the root directory dynamically
+ROOT_DIR = Path(__file__).resolve().parent.parent  # Adjust as needed
+sys.path.insert(0, str(ROOT_DIR))
+
+TILE_SIZE = 256
+COLLECTION_NAME = "load_test"
+
+# Tissue regions of the synthetic slide (center x, center y, radius x, radius y; slide-relative)
+TISSUE_BLOBS = [(0.30, 0.45, 0.20, 0.30), (0.68, 0.35, 0.18, 0.22), (0.65, 0.75, 0.15, 0.15)]
+TISSUE_COLORS = [(190, 90, 160), (170, 70, 140), (210, 130, 180), (150, 60, 130)]
+GLASS_COLOR = 242
+
+
+# ---------------------------------------------------------------------- #
+# Synthetic slide + in-memory vector store
+# ---------------------------------------------------------------------- #
+
+def is_tissue(u: float, v: float) -> bool:
+    return any(((u - cx) / rx) ** 2 + ((v - cy) / ry) ** 2 <= 1 for cx, cy, rx, ry in TISSUE_BLOBS)
+
+
+def write_synthetic_slide(path: str, width: int, height: int, mpp: float = 0.25, seed: int = 0) -> None:
+    """Write a tiled, pyramidal generic TIFF that OpenSlide can open, tile by tile."""
+    try:
+        import tifffile
+    except ImportError:
+        raise SystemExit("Generating the synthetic slide needs tifffile (pip install tifffile)")
+
+    rng = np.random.default_rng(seed)
+    # Mildly noisy textures, quantized so zlib keeps the file small
+    textures = [
+        (np.clip(rng.normal(color, 8, (TILE_SIZE, TILE_SIZE, 3)), 0, 255) // 32 * 32).astype(np.uint8)
+        for color in TISSUE_COLORS
+    ]
+    glass = np.full((TILE_SIZE, TILE_SIZE, 3), GLASS_COLOR, dtype=np.uint8)
+
+    def tiles(level_width: int, level_height: int):
+        cols, rows = math.ceil(level_width / TILE_SIZE), math.ceil(level_height / TILE_SIZE)
+        for row in range(rows):
+            for col in range(cols):
+                u = (col + 0.5) * TILE_SIZE / level_width
+                v = (row + 0.5) * TILE_SIZE / level_height
+                yield textures[(row * 7 + col) % len(textures)] if is_tissue(u, v) else glass
+
+    levels = max(1, math.ceil(math.log2(max(width, height) / 1024)) + 1)
+    with tifffile.TiffWriter(path, bigtiff=True) as tif:
+        for level in range(levels):
+            downsample = 2 ** level
+            level_width, level_height = math.ceil(width / downsample), math.ceil(height / downsample)
+            tif.write(
+                tiles(level_width, level_height),
+                shape=(level_height, level_width, 3),
+                dtype=np.uint8,
+                tile=(TILE_SIZE, TILE_SIZE),
+                photometric="rgb",
+                compression="zlib",
+                resolution=(1e4 / (mpp * downsample), 1e4 / (mpp * downsample)),
+                resolutionunit="CENTIMETER",
+                subfiletype=1 if level else 0,
+            )
+    print(f"Wrote synthetic slide {path} ({width}x{height}, {levels} levels, {os.path.getsize(path) / 1e6:.0f} MB)")
+
+
+def synthetic_tile_points(wsi_path: str, width: int, height: int, dim: int, seed: int = 0):
+    """Tile payloads + vectors over the synthetic slide's tissue, at 20x (224 px) and 10x (448 px).
+
+    Vectors are noisy copies of a few prototypes assigned by region, so similarity
+    queries and heatmaps have spatial structure.
+    """
+    from qdrant_client.models import PointStruct
+    from src.data_models import DATASETS, MAGNIFICATIONS, STAINS, WSITilePayload
+
+    rng = np.random.default_rng(seed)
+    prototypes = rng.normal(size=(16, dim))
+    points = []
+    for magnification, size in ((MAGNIFICATIONS.X20, 224), (MAGNIFICATIONS.X10, 448)):
+        for y in range(0, height - size + 1, size):
+            for x in range(0, width - size + 1, size):
+                if not is_tissue((x + size / 2) / width, (y + size / 2) / height):
+                    continue
+                point_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{wsi_path}|{magnification.value}|{x}|{y}"))
+                payload = WSITilePayload(
+                    uuid=point_id,
+                    patient_id="load-test",
+                    wsi_path=wsi_path,
+                    dataset=DATASETS.TCGA,
+                    magnification=magnification,
+                    stain=STAINS.HE,
+                    x=x,
+                    y=y,
+                    size=size,
+                    tags=["load-test"],
+                )
+                prototype = prototypes[(x // 4096 * 7 + y // 4096) % len(prototypes)]
+                vector = prototype + rng.normal(scale=0.5, size=dim)
+                points.append(PointStruct(id=point_id, vector=vector.tolist(), payload=payload.model_dump(mode="json")))
+    return points
+
+
+def serve(args) -> None:
+    """Run the server with in-memory (sync + async) vector stores holding the synthetic slide's tiles."""
+    import uvicorn
+    from openslide import OpenSlide
+    from qdrant_client import QdrantClient, AsyncQdrantClient
+    from qdrant_client.models import VectorParams
+
+    os.environ["APPLICATION_DATA_LOCATION"] = args.data_dir
+    os.environ["QDRANT_COLLECTION"] = COLLECTION_NAME
+
+    import main
+    from src.qdrant_db import TileVectorDB, AsyncTileVectorDB
+
+    with OpenSlide(args.slide) as slide:
+        width, height = slide.dimensions
+    points = synthetic_tile_points(args.slide, width, height, args.dim)
+
+    client = QdrantClient(location=":memory:")
+    async_client = AsyncQdrantClient(location=":memory:")
+    vectors_config = VectorParams(size=args.dim, distance="Cosine")
+    client.create_collection(COLLECTION_NAME, vectors_config=vectors_config)
+    client.upsert(COLLECTION_NAME, points=points)
+
+    async def fill_async_store():
+        await async_client.create_collection(COLLECTION_NAME, vectors_config=vectors_config)
+        await async_client.upsert(COLLECTION_NAME, points=points)
+    asyncio.run(fill_async_store())
+
+    main.vector_db.set_instance(TileVectorDB(":memory:", COLLECTION_NAME, qdrant_client=client))
+    main.async_vector_db.set_instance(AsyncTileVectorDB(":memory:", COLLECTION_NAME, qdrant_client=async_client))
+    print(f"In-memory vector store: {len(points)} tiles ({args.dim} dims)")
+
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning", workers=1)
+
+
+# ---------------------------------------------------------------------- #
+# Session synthesis
+# ---------------------------------------------------------------------- #
+
+def visible_tiles(metadata: Dict, z: int, center: Tuple[float, float], viewport: Tuple[int, int]) -> List[Tuple[int, int, int]]:
+    """DeepZoom tiles of level z covering a viewport centered on `center` (level-0 pixels)."""
+    downsample = 2 ** (metadata["level_count"] - 1 - z)
+    cols, rows = metadata["level_tiles"][z]
+    cx, cy = center[0] / downsample, center[1] / downsample
+    col0, col1 = int((cx - viewport[0] / 2) // TILE_SIZE), int((cx + viewport[0] / 2) // TILE_SIZE)
+    row0, row1 = int((cy - viewport[1] / 2) // TILE_SIZE), int((cy + viewport[1] / 2) // TILE_SIZE)
+    return [
+        (z, col, row)
+        for row in range(max(row0, 0), min(row1, rows - 1) + 1)
+        for col in range(max(col0, 0), min(col1, cols - 1) + 1)
+    ]
+
+
+def synthesize_session(
+    rng: np.random.Generator,
+    sample_id: str,
+    metadata: Dict,
+    n_steps: int,
+    think_time: float,
+    viewport: Tuple[int, int],
+    heatmap_mode: str,
+) -> Dict[str, Any]:
+    """A random viewer session: open the slide, then pan / zoom / query / heatmap steps.
+
+    Like the browser, a session never requests the same tile twice.
+    """
+    level_count = metadata["level_count"]
+    width, height = metadata["extent"][2], metadata["extent"][3]
+    tiles = metadata.get("tiles") or []
+
+    # Start zoomed out with the whole slide in view
+    z = max(
+        (level for level, (w, h) in enumerate(metadata["level_dimentions"]) if w <= viewport[0] and h <= viewport[1]),
+        default=0,
+    )
+    center = (width / 2, height / 2)
+    seen = set()
+    t = 0.0
+    steps = [{"t": t, "requests": [{"route": "/metadata/", "path": "/metadata/", "params": {"sample_id": sample_id}}]}]
+
+    def tile_requests(z: int) -> List[Dict]:
+        requests = []
+        for key in visible_tiles(metadata, z, center, viewport):
+            if key not in seen:
+                seen.add(key)
+                requests.append({"route": "/tiles/", "path": "/tiles/{}/{}/{}/".format(*key), "params": {"sample_id": sample_id}})
+        return requests
+
+    steps.append({"t": t, "requests": tile_requests(z)})
+
+    for _ in range(n_steps):
+        t += float(rng.exponential(think_time))
+        action = rng.choice(["pan", "zoom_in", "zoom_out", "query", "heatmap"], p=[0.45, 0.25, 0.12, 0.12, 0.06])
+        downsample = 2 ** (level_count - 1 - z)
+
+        if action in ("query", "heatmap") and tiles:
+            tile = tiles[rng.integers(len(tiles))]
+            if action == "query":
+                requests = [{
+                    "route": "/query_similar_tiles/",
+                    "path": "/query_similar_tiles/",
+                    "params": {"tile_uuid": tile["uuid"], "max_hits": 20, "min_score": 0.5},
+                    # then load the hits' thumbnails, like the results panel does
+                    "follow": {"route": "/tile_image/", "max": 12},
+                }]
+            elif heatmap_mode == "tiles":
+                requests = [{"route": "/heatmap_info/", "path": "/heatmap_info/", "params": {"tile_uuid": tile["uuid"]}}]
+                requests += [
+                    {"route": "/heatmap_tiles/", "path": "/heatmap_tiles/{}/{}/{}/".format(*key), "params": {"tile_uuid": tile["uuid"]}}
+                    for key in visible_tiles(metadata, z, center, viewport)
+                ]
+            else:
+                requests = [{"route": "/similar_tiles_heatmap/", "path": "/similar_tiles_heatmap/", "params": {"tile_uuid": tile["uuid"]}}]
+            steps.append({"t": t, "requests": requests})
+            continue
+
+        if action == "zoom_in" and z < level_count - 1:
+            z += 1
+            # zoom towards tissue when the slide has indexed tiles
+            if tiles:
+                tile = tiles[rng.integers(len(tiles))]
+                center = (tile["x"] + tile["size"] / 2, tile["y"] + tile["size"] / 2)
+        elif action == "zoom_out" and z > 0:
+            z -= 1
+        else:
+            angle = rng.uniform(0, 2 * math.pi)
+            distance = 0.5 * viewport[0] * downsample
+            center = (
+                min(max(center[0] + distance * math.cos(angle), 0), width),
+                min(max(center[1] + distance * math.sin(angle), 0), height),
+            )
+
+        requests = tile_requests(z)
+        if requests:
+            steps.append({"t": t, "requests": requests})
+
+    return {"sample_id": sample_id, "steps": steps}
+
+
+# ---------------------------------------------------------------------- #
+# Replay
+# ---------------------------------------------------------------------- #
+
+class Stats:
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.bytes: Dict[str, int] = defaultdict(int)
+
+    def record(self, route: str, latency: float, ok: bool, size: int) -> None:
+        self.latencies[route].append(latency)
+        self.bytes[route] += size
+        if not ok:
+            self.errors[route] += 1
+
+    def report(self, elapsed: float) -> None:
+        header = f"{'route':<24}{'count':>8}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}{'MB':>8}"
+        print(header)
+        print("-" * len(header))
+        routes = sorted(self.latencies, key=lambda route: -len(self.latencies[route]))
+        for route in routes + ["total"]:
+            if route == "total":
+                latencies = [latency for values in self.latencies.values() for latency in values]
+                errors, size = sum(self.errors.values()), sum(self.bytes.values())
+                print("-" * len(header))
+            else:
+                latencies, errors, size = self.latencies[route], self.errors[route], self.bytes[route]
+            if not latencies:
+                continue
+            p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+            print(
+                f"{route:<24}{len(latencies):>8}{errors:>8}{len(latencies) / elapsed:>9.1f}"
+                f"{p50:>9.1f}{p90:>9.1f}{p99:>9.1f}{max(latencies) * 1000:>9.1f}{size / 1e6:>8.1f}"
+            )
+
+
+async def send(client: httpx.AsyncClient, request: Dict, stats: Stats) -> httpx.Response | None:
+    start = time.perf_counter()
+    try:
+        response = await client.get(request["path"], params=request.get("params"))
+    except httpx.HTTPError:
+        stats.record(request["route"], time.perf_counter() - start, False, 0)
+        return None
+    stats.record(request["route"], time.perf_counter() - start, response.is_success, len(response.content))
+
+    follow = request.get("follow")
+    if follow and response.is_success:
+        hits = response.json()[: follow["max"]]
+        await asyncio.gather(*(
+            send(client, {
+                "route": follow["route"],
+                "path": follow["route"],
+                "params": {"wsi_path": hit["wsi_path"], "x": hit["x"], "y": hit["y"], "size": hit["size"]},
+            }, stats)
+            for hit in hits
+        ))
+    return response
+
+
+async def replay_session(base_url: str, session: Dict, stats: Stats, delay: float, speed: float, connections: int) -> None:
+    await asyncio.sleep(delay)
+    # One client per session: a browser keeps `connections` connections per host
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        start = time.perf_counter()
+        for step in session["steps"]:
+            wait = start + step["t"] / speed - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await asyncio.gather(*(send(client, request, stats) for request in step["requests"]))
+
+
+async def replay(base_url: str, sessions: List[Dict], ramp_up: float, speed: float, connections: int) -> None:
+    stats = Stats()
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        replay_session(base_url, session, stats, ramp_up * i / max(len(sessions), 1), speed, connections)
+        for i, session in enumerate(sessions)
+    ))
+    elapsed = time.perf_counter() - start
+
+    print(f"\n{len(sessions)} sessions in {elapsed:.1f}s\n")
+    stats.report(elapsed)
+
+
+# ---------------------------------------------------------------------- #
+# CLI
+# ---------------------------------------------------------------------- #
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 300) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("Server process exited during startup")
+        try:
+            if httpx.get(f"{base_url}/readyz", timeout=2).json()["status"] == "ready":
+                return
+        except (httpx.HTTPError, ValueError):
+            pass
+        time.sleep(0.5)
+    raise SystemExit("Server did not become ready in time")
+
+
+def run(args) -> None:
+    process = None
+    base_url = args.url
+    sample_id = args.sample_id
+
+    if base_url is None:
+        work_dir = args.work_dir or tempfile.mkdtemp(prefix="wsi-load-test-")
+        slide_path = os.path.join(work_dir, "synthetic_slide.tif")
+        if not os.path.exists(slide_path):
+            write_synthetic_slide(slide_path, args.slide_width, args.slide_height)
+        sample_id = slide_path
+
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        process = subprocess.Popen([
+            sys.executable, __file__, "serve",
+            "--slide", slide_path,
+            "--port", str(port),
+            "--dim", str(args.dim),
+            "--data-dir", os.path.join(work_dir, "app_data"),
+        ])
+        print(f"Starting server on {base_url} ...")
+        wait_until_ready(base_url, process)
+
+    try:
+        if args.trace:
+            with open(args.trace) as f:
+                sessions = [json.loads(line) for line in f if line.strip()]
+        else:
+            if sample_id is None:
+                raise SystemExit("--sample-id is required with --url")
+            metadata = httpx.get(f"{base_url}/metadata/", params={"sample_id": sample_id}, timeout=300).json()
+            print(f"Slide {metadata['location']}: {metadata['level_count']} levels, {len(metadata.get('tiles') or [])} indexed tiles")
+            rng = np.random.default_rng(args.seed)
+            sessions = [
+                synthesize_session(rng, sample_id, metadata, args.steps, args.think_time, tuple(args.viewport), args.heatmap_mode)
+                for _ in range(args.sessions)
+            ]
+
+        if args.record:
+            with open(args.record, "w") as f:
+                for session in sessions:
+                    f.write(json.dumps(session) + "\n")
+            print(f"Recorded {len(sessions)} sessions to {args.record}")
+
+        n_requests = sum(len(step["requests"]) for session in sessions for step in session["steps"])
+        print(f"Replaying {len(sessions)} sessions ({n_requests} requests, not counting follow-ups) at {args.speed}x speed")
+        asyncio.run(replay(base_url, sessions, args.ramp_up, args.speed, args.connections))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay realistic viewer sessions against the server and report per-route latency.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Synthesize (or load) sessions and replay them")
+    run_parser.add_argument("--url", help="Server to test; default: spawn one with a synthetic slide and in-memory vector store")
+    run_parser.add_argument("--sample-id", help="Slide to browse (required with --url)")
+    run_parser.add_argument("--work-dir", help="Where the synthetic slide and server data go (reused across runs)")
+    run_parser.add_argument("--slide-width", type=int, default=24_000)
+    run_parser.add_argument("--slide-height", type=int, default=18_000)
+    run_parser.add_argument("--dim", type=int, default=768, help="Vector size of the in-memory store")
+    run_parser.add_argument("--sessions", type=int, default=20, help="Concurrent sessions")
+    run_parser.add_argument("--steps", type=int, default=30, help="Actions per session")
+    run_parser.add_argument("--think-time", type=float, default=1.5, help="Mean seconds between actions")
+    run_parser.add_argument("--ramp-up", type=float, default=5.0, help="Seconds over which sessions start")
+    run_parser.add_argument("--speed", type=float, default=1.0, help="Replay speed-up (think times are divided by it)")
+    run_parser.add_argument("--connections", type=int, default=6, help="Connections per session (browsers use 6 per host)")
+    run_parser.add_argument("--viewport", type=int, nargs=2, default=[1600, 900], metavar=("WIDTH", "HEIGHT"))
+    run_parser.add_argument("--heatmap-mode", choices=["json", "tiles"], default="json",
+                            help="json: /similar_tiles_heatmap/ (current viewer); tiles: /heatmap_tiles/ overlays")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--record", help="Save the sessions (JSON lines) for later replay")
+    run_parser.add_argument("--trace", help="Replay sessions from a JSON lines file instead of synthesizing them")
+
+    serve_parser = subparsers.add_parser("serve", help="(internal) server with an in-memory vector store")
+    serve_parser.add_argument("--slide", required=True)
+    serve_parser.add_argument("--port", type=int, required=True)
+    serve_parser.add_argument("--dim", type=int, default=768)
+    serve_parser.add_argument("--data-dir", required=True)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,7 @@ ROOT_DIR = Path(__file__).resolve().parent.parent  # Adjust as needed
 sys.path.insert(0, str(ROOT_DIR))
 
 from src.data_models import STAINS, MAGNIFICATIONS, WSITilePayload, DATASETS
+from src.slide_embeddings import SlideVectorDB
 
 IDX = -1
 
@@ -56,6 +57,9 @@ def main():
     # )
     # print("Collection Made!")
 
+    # Slide-level vectors, kept in the companion collection f"{COLLECTION_NAME}_slides"
+    slide_db = SlideVectorDB(client, COLLECTION_NAME)
+
     # load csv file
     df = pd.read_csv(LABEL_CSV_PATH)
     df_rare = df[df["class_name"].isin(RARE_CANCER_LIST)]
@@ -97,7 +101,8 @@ def main():
                 #     magnification=MAGNIFICATION,
                 #     tags=tags,
                 #     stain=STAIN,
-                #     patient_id=patient_id
+                #     patient_id=patient_id,
+                #     slide_db=slide_db,
                 # )
             idx += 1
 
@@ -133,7 +138,8 @@ def main():
             #     magnification=MAGNIFICATION,
             #     tags=tags,
             #     stain=STAIN,
-            #     patient_id=patient_id
+            #     patient_id=patient_id,
+            #     slide_db=slide_db,
             # )
         idx += 1
 
@@ -152,6 +158,7 @@ def add_wsi_to_collection(
     tags,
     stain,
     patient_id,
+    slide_db: SlideVectorDB | None = None,
 ):
     # open coordinates
     with open(coord_path, "r") as f:
@@ -163,15 +170,9 @@ def add_wsi_to_collection(
     # open features
     tile_features = torch.load(features_path, map_location=torch.device('cpu'), weights_only=False)
 
-    # get list of points and batch insert every 50 tiles
-    points = []
-    batch_size = 25
-
-    for i, (coord, features) in enumerate(zip(coords, tile_features)):
-        uuid = str(uuid4())
-        
-        payload = WSITilePayload(
-            uuid=uuid,
+    payloads = [
+        WSITilePayload(
+            uuid=str(uuid4()),
             dataset=source_dataset,
             wsi_path=str(wsi_path),
             patient_id=str(patient_id),
@@ -182,28 +183,29 @@ def add_wsi_to_collection(
             size=patch_size,
             tags=tags,
         )
-        
-        point = PointStruct(id=uuid, vector=features.tolist(), payload=payload.model_dump())
-        points.append(point)
-
-        # Insert every batch_size tiles
-        if (i + 1) % batch_size == 0:
-            operation_info = client.upsert(
-                collection_name=collection_name,
-                wait=True,
-                points=points,
-            )
-            # print(f"Inserted {len(points)} tiles")
-            points = []  # Reset points list
-
-    # Insert remaining points if any
-    if points:
-        operation_info = client.upsert(
+        for coord in coords
+    ]
+
+    # Stores the tiles (replacing those already stored at the same positions) and
+    # folds the new ones into the slide's pooled vectors (mean + k-means centroids)
+    if slide_db is not None:
+        slide_db.add_tiles(payloads, tile_features.float().numpy())
+        print(f"Inserted {len(payloads)} tiles")
+        return
+
+    # get list of points and batch insert every 25 tiles
+    batch_size = 25
+    points = [
+        PointStruct(id=payload.uuid, vector=features.tolist(), payload=payload.model_dump())
+        for payload, features in zip(payloads, tile_features)
+    ]
+    for start in range(0, len(points), batch_size):
+        client.upsert(
             collection_name=collection_name,
             wait=True,
-            points=points,
+            points=points[start:start + batch_size],
         )
-        print(f"Inserted remaining {len(points)} tiles")
+    print(f"Inserted {len(points)} tiles")
 
 
 if __name__ == "__main__":
@@ -43,16 +43,13 @@ df['note'] = ""
 # Initialize WSI_DB
 db = WSI_DB(db_dir_path=DB_DIR)
 
-# Insert entries into database
-for _, row in df.iterrows():
-    entry = WSI_ENTRY(
-        wsi_path=row['wsi_path'],
-        note=row['note'],
-        labels=row['labels']
-    )
-    success = db.update_wsi(entry)
-    if not success:
-        print(f"Failed to insert/update: {row['wsi_path']}")
+# Insert entries into database (batched transactions instead of one commit per row)
+entries = (
+    WSI_ENTRY(wsi_path=wsi_path, note=note, labels=labels)
+    for wsi_path, note, labels in zip(df['wsi_path'], df['note'], df['labels'])
+)
+count = db.bulk_upsert(entries)
+print(f"Inserted/updated {count} entries")
 
 # Close connection
 db.close()
@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Set the root directory dynamically
+ROOT_DIR = Path(__file__).resolve().parent.parent  # Adjust as needed
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.wsi_db import WSI_DB
+from src.wsi_db_io import read_wsi_entries, write_wsi_entries
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import/export WSI notes and labels (CSV or Parquet).")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("path", help="CSV or Parquet file to read from / write to")
+    parser.add_argument("--db-dir", default=os.getenv("APPLICATION_DATA_LOCATION", "~/.wsi_viewer/"))
+    parser.add_argument("--wsi-path-column", default="wsi_path")
+    parser.add_argument("--note-column", default="note")
+    parser.add_argument("--labels-column", default="labels")
+    args = parser.parse_args()
+
+    db = WSI_DB(db_dir_path=args.db_dir)
+    start = time.time()
+
+    if args.command == "import":
+        entries = read_wsi_entries(
+            args.path,
+            wsi_path_column=args.wsi_path_column,
+            note_column=args.note_column,
+            labels_column=args.labels_column,
+        )
+        count = db.bulk_upsert(entries)
+        print(f"Imported {count} entries from {args.path} in {time.time() - start:.1f}s")
+    else:
+        count = write_wsi_entries(db.bulk_export(), args.path)
+        print(f"Exported {count} entries to {args.path} in {time.time() - start:.1f}s")
+
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+import json
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Set, Tuple
+from urllib.parse import parse_qs
+
+
+class ClassPolicy:
+    """Admission policy of one request class.
+
+    - priority: lower is more important; free slots go to the most important
+      waiting class first.
+    - max_concurrency: requests of the class running at once.
+    - max_queue: requests of the class allowed to wait (0 = shed immediately when
+      no slot is free).
+    - max_queue_per_client: waiting requests per client; beyond it the client gets 429.
+    - queue_timeout: seconds a request may wait before being shed with 503.
+    """
+
+    def __init__(
+        self,
+        priority: int,
+        max_concurrency: int,
+        max_queue: int = 64,
+        max_queue_per_client: int = 32,
+        queue_timeout: float = 10.0,
+    ) -> None:
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.queue_timeout = queue_timeout
+
+
+DEFAULT_POLICIES: Dict[str, ClassPolicy] = {
+    # What the user is looking at right now
+    "tile": ClassPolicy(priority=0, max_concurrency=24, max_queue=512, max_queue_per_client=128, queue_timeout=10),
+    "metadata": ClassPolicy(priority=0, max_concurrency=8, max_queue=64, max_queue_per_client=16, queue_timeout=10),
+    "thumbnail": ClassPolicy(priority=1, max_concurrency=8, max_queue=256, max_queue_per_client=64, queue_timeout=15),
+    # Analysis
+    "query": ClassPolicy(priority=2, max_concurrency=8, max_queue=32, max_queue_per_client=8, queue_timeout=30),
+    "heatmap": ClassPolicy(priority=3, max_concurrency=4, max_queue=64, max_queue_per_client=32, queue_timeout=30),
+    # Speculative; dropped rather than queued when busy
+    "prefetch": ClassPolicy(priority=4, max_concurrency=8, max_queue=0),
+    # Bulk downloads, held for the whole (streamed) response
+    "export": ClassPolicy(priority=5, max_concurrency=2, max_queue=8, max_queue_per_client=2, queue_timeout=60),
+}
+
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: int = 1) -> None:
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+        super().__init__(detail)
+
+
+class AdmissionController:
+    """Per-class concurrency budgets under a global budget, with priorities and per-client fairness.
+
+    A request runs when both its class and the global budget have a free slot.
+    `reserved_slots` of the global budget are kept for the top-priority classes
+    (visible tiles, metadata): the other classes together never hold more than
+    `total_slots - reserved_slots`, so a burst of thumbnails or queries cannot take
+    every slot and leave the viewer waiting (running requests are not preempted).
+    Otherwise it waits in its class queue; waiting requests of a class are kept
+    per client and granted round-robin across clients, so one client's burst
+    cannot starve others. When a slot frees up it goes to the most important class
+    with an eligible waiter. Requests that cannot be queued, or wait too long, are
+    rejected (429 for a client exceeding its own queue share, 503 otherwise).
+
+    All state is touched from the event loop only, so no locking is needed.
+    """
+
+    def __init__(
+        self,
+        policies: Dict[str, ClassPolicy] | None = None,
+        total_slots: int = 32,
+        reserved_slots: int = 8,
+    ) -> None:
+        self.policies = policies or DEFAULT_POLICIES
+        self.total_slots = total_slots
+        self.reserved_slots = min(reserved_slots, total_slots - 1)
+        self.top_priority = min(policy.priority for policy in self.policies.values())
+        self.logger = logging.getLogger("AdmissionController")
+
+        self.running_total = 0
+        # Running requests of the classes below top priority
+        self.running_lower = 0
+        self.running: Dict[str, int] = {name: 0 for name in self.policies}
+        self.queued: Dict[str, int] = {name: 0 for name in self.policies}
+        # class -> client -> waiting futures (clients in round-robin order)
+        self.waiters: Dict[str, OrderedDict[str, Deque[asyncio.Future]]] = {name: OrderedDict() for name in self.policies}
+        self.shed: Dict[str, int] = {name: 0 for name in self.policies}
+        self._by_priority: List[str] = sorted(self.policies, key=lambda name: self.policies[name].priority)
+
+    def _is_lower(self, name: str) -> bool:
+        return self.policies[name].priority > self.top_priority
+
+    def _can_run(self, name: str) -> bool:
+        if self._is_lower(name) and self.running_lower >= self.total_slots - self.reserved_slots:
+            return False
+        return self.running_total < self.total_slots and self.running[name] < self.policies[name].max_concurrency
+
+    def _grant(self, name: str) -> None:
+        self.running_total += 1
+        self.running[name] += 1
+        if self._is_lower(name):
+            self.running_lower += 1
+
+    def _reject(self, name: str, status_code: int, detail: str) -> Rejected:
+        self.shed[name] += 1
+        return Rejected(status_code, detail)
+
+    async def acquire(self, name: str, client: str) -> None:
+        """Wait for a slot for a `name` request from `client`, or raise `Rejected`."""
+        policy = self.policies[name]
+        clients = self.waiters[name]
+
+        if not clients and self._can_run(name):
+            self._grant(name)
+            return
+
+        if self.queued[name] >= policy.max_queue:
+            raise self._reject(name, 503, f"Server busy: {name} requests are being shed")
+        queue = clients.get(client)
+        if queue is not None and len(queue) >= policy.max_queue_per_client:
+            raise self._reject(name, 429, f"Too many queued {name} requests from this client")
+
+        future = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = clients[client] = deque()
+        queue.append(future)
+        self.queued[name] += 1
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=policy.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Granted just as we gave up: hand the slot back
+                self.release(name)
+            else:
+                future.cancel()
+                self._remove_waiter(name, client, future)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject(name, 503, f"Server busy: {name} request waited more than {policy.queue_timeout:.0f}s")
+            raise
+
+    def _remove_waiter(self, name: str, client: str, future: asyncio.Future) -> None:
+        queue = self.waiters[name].get(client)
+        if queue is None or future not in queue:
+            return
+        queue.remove(future)
+        self.queued[name] -= 1
+        if not queue:
+            del self.waiters[name][client]
+
+    def release(self, name: str) -> None:
+        self.running_total -= 1
+        self.running[name] -= 1
+        if self._is_lower(name):
+            self.running_lower -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiters, most important class first, round-robin over clients."""
+        for name in self._by_priority:
+            clients = self.waiters[name]
+            while clients and self._can_run(name):
+                client, queue = next(iter(clients.items()))
+                future = queue.popleft()
+                self.queued[name] -= 1
+                if queue:
+                    clients.move_to_end(client)
+                else:
+                    del clients[client]
+                if future.done():
+                    continue
+                self._grant(name)
+                future.set_result(True)
+            if self.running_total >= self.total_slots:
+                return
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running_total,
+            "total_slots": self.total_slots,
+            "reserved_slots": self.reserved_slots,
+            "classes": {
+                name: {"running": self.running[name], "queued": self.queued[name], "shed": self.shed[name]}
+                for name in self.policies
+            },
+        }
+
+
+# Route prefix -> request class; routes not listed are not admission controlled
+ROUTE_CLASSES: List[Tuple[str, str]] = [
+    ("/tiles/", "tile"),
+    ("/metadata/", "metadata"),
+    ("/load_wsi/", "metadata"),
+    ("/viewport_tiles/", "metadata"),
+    ("/tile_image/", "thumbnail"),
+    ("/thumbnail/", "thumbnail"),
+    ("/thumbnails/", "thumbnail"),
+    ("/query_similar_tiles/", "query"),
+    ("/similar_slides/", "query"),
+    ("/similar_tiles_heatmap/", "heatmap"),
+    ("/heatmap_info/", "heatmap"),
+    ("/heatmap_tiles/", "heatmap"),
+    ("/export_regions/", "export"),
+]
+
+
+def classify_request(scope: Dict[str, Any]) -> str | None:
+    """Request class of an HTTP request, None if it is not admission controlled.
+
+    Tile requests marked as speculative (`Sec-Purpose: prefetch` / `Purpose:
+    prefetch` header, or `prefetch=true` query parameter) are "prefetch".
+    """
+    path = scope["path"]
+    name = next((name for prefix, name in ROUTE_CLASSES if path.startswith(prefix)), None)
+    if name != "tile":
+        return name
+
+    headers = dict(scope.get("headers") or [])
+    purpose = (headers.get(b"sec-purpose") or headers.get(b"purpose") or b"").decode("latin-1").lower()
+    prefetch = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("prefetch", [""])[0].lower()
+    if "prefetch" in purpose or prefetch in ("1", "true", "yes"):
+        return "prefetch"
+    return name
+
+
+def client_key(scope: Dict[str, Any], trusted_proxies: Set[str] = frozenset()) -> str:
+    """Identity used for fairness: the peer address.
+
+    Headers are client-controlled, so X-Forwarded-For is only used when the peer is
+    one of `trusted_proxies`; the client is then the last hop not added by them.
+    """
+    client = scope.get("client")
+    peer = client[0] if client else "unknown"
+    if peer not in trusted_proxies:
+        return peer
+
+    headers = dict(scope.get("headers") or [])
+    hops = [hop.strip() for hop in headers.get(b"x-forwarded-for", b"").decode("latin-1").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if hop not in trusted_proxies:
+            return hop
+    return peer
+
+
+class AdmissionControlMiddleware:
+    """ASGI middleware running every classified request through an `AdmissionController`.
+
+    The slot is held until the response has been fully sent (streamed responses
+    included), which is when the work behind it is actually done.
+    """
+
+    def __init__(self, app: Callable, controller: AdmissionController, trusted_proxies: Iterable[str] = ()) -> None:
+        self.app = app
+        self.controller = controller
+        self.trusted_proxies = frozenset(trusted_proxies)
+
+    async def __call__(self, scope, receive, send) -> None:
+        name = classify_request(scope) if scope["type"] == "http" and scope["method"] != "OPTIONS" else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(name, client_key(scope, self.trusted_proxies))
+        except Rejected as e:
+            await _send_rejection(send, e)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name)
+
+
+async def _send_rejection(send: Callable, rejection: Rejected) -> None:
+    body = json.dumps({"detail": rejection.detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": rejection.status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(rejection.retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
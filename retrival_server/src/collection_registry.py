@@ -0,0 +1,309 @@
+import json
+import time
+import heapq
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Set, Tuple, TYPE_CHECKING
+
+from src.data_models import CollectionEntry, WSITilePayload, MAGNIFICATIONS, GROUP_BY_FIELDS
+
+# qdrant_client is slow to import; the registry itself is read at startup
+if TYPE_CHECKING:
+    from qdrant_client import AsyncQdrantClient
+    from src.qdrant_db import AsyncTileVectorDB
+
+
+class CollectionRegistry:
+    """The tile collections a server can search: cohorts, embedding models, magnifications.
+
+    Loaded from a JSON list of `CollectionEntry` objects. The primary collection
+    (QDRANT_COLLECTION, used for tiles, metadata and heatmaps) is always registered,
+    so without a registry file the server behaves as with a single collection.
+    """
+
+    def __init__(self, entries: List[CollectionEntry], primary: str) -> None:
+        self.entries: Dict[str, CollectionEntry] = OrderedDict((entry.name, entry) for entry in entries)
+        if primary not in self.entries:
+            self.entries[primary] = CollectionEntry(name=primary)
+            self.entries.move_to_end(primary, last=False)
+        self.primary = primary
+
+    @classmethod
+    def from_file(cls, path: str | None, primary: str) -> "CollectionRegistry":
+        if not path:
+            return cls([], primary)
+        with open(path) as f:
+            return cls([CollectionEntry(**entry) for entry in json.load(f)], primary)
+
+    def select(
+        self,
+        names: List[str] | None = None,
+        cohort: str | None = None,
+        magnification_list: List[MAGNIFICATIONS] | None = None,
+    ) -> List[CollectionEntry]:
+        """Collections to search: the named ones, else those of `cohort`, else the defaults.
+
+        Collections known not to hold the requested magnification are left out.
+        Raises ValueError for unknown names.
+        """
+        if names:
+            unknown = [name for name in names if name not in self.entries]
+            if unknown:
+                raise ValueError(f"Unknown collections: {unknown}")
+            selected = [self.entries[name] for name in dict.fromkeys(names)]
+        elif cohort:
+            selected = [entry for entry in self.entries.values() if entry.cohort == cohort]
+        else:
+            selected = [entry for entry in self.entries.values() if entry.default]
+
+        if magnification_list:
+            selected = [
+                entry for entry in selected
+                if not entry.magnifications or magnification_list[0] in entry.magnifications
+            ]
+        return selected
+
+    def describe(self) -> List[Dict[str, Any]]:
+        return [entry.model_dump(mode="json") for entry in self.entries.values()]
+
+
+def merge_hits(hit_lists: List[List[WSITilePayload]], max_hits: int, offset: int = 0) -> List[WSITilePayload]:
+    """Global top hits (by score) of per-collection lists that are each sorted best first."""
+    merged, seen = [], set()
+    for hit in heapq.merge(*hit_lists, key=lambda hit: -hit.score):
+        # A tile stored in several collections counts once
+        if hit.uuid in seen:
+            continue
+        seen.add(hit.uuid)
+        merged.append(hit)
+        if len(merged) == offset + max_hits:
+            break
+    return merged[offset:]
+
+
+def merge_groups(
+    hit_lists: List[List[WSITilePayload]],
+    group_by: GROUP_BY_FIELDS,
+    max_groups: int,
+    group_size: int,
+) -> List[WSITilePayload]:
+    """Regroup per-collection grouped hits: best `max_groups` groups, `group_size` tiles each, flattened."""
+    groups: Dict[str, List[WSITilePayload]] = {}
+    seen = set()
+    # Grouped lists are ordered group by group, not by score: sort them all
+    for hit in sorted((hit for hits in hit_lists for hit in hits), key=lambda hit: -hit.score):
+        if hit.uuid in seen:
+            continue
+        seen.add(hit.uuid)
+        members = groups.setdefault(getattr(hit, group_by.value), [])
+        if len(members) < group_size:
+            members.append(hit)
+    # Hits were visited best first, so groups are already ordered by their best hit
+    return [hit for members in list(groups.values())[:max_groups] for hit in members]
+
+
+class CollectionSearch:
+    """Similarity search fanned out over several collections of the registry.
+
+    The query tile is looked up once (in whichever collection holds it) and its
+    vector is sent concurrently to every selected collection of the same embedding
+    model. Each collection has its own timeout; the top hits are merged by score
+    from whatever collections answered, and the per-collection outcome is reported
+    so callers can tell partial results from complete ones.
+
+    Collections that could not be connected (node down, collection not created yet)
+    are retried when a query selects them, with exponential backoff, so a node that
+    was still starting up joins the fan-out once it is up.
+    """
+
+    def __init__(
+        self,
+        registry: CollectionRegistry,
+        primary_db: "AsyncTileVectorDB",
+        default_address: str,
+        query_timeout: float = 10.0,
+        retry_interval: float = 1.0,
+        max_retry_interval: float = 60.0,
+        **client_kwargs: Any,
+    ) -> None:
+        self.registry = registry
+        self.default_address = default_address
+        self.query_timeout = query_timeout
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.client_kwargs = client_kwargs
+        self.logger = logging.getLogger("CollectionSearch")
+
+        # One client per Qdrant node, shared by its collections
+        self.clients: Dict[str, "AsyncQdrantClient"] = {default_address: primary_db.qdrant_client}
+        self.owned_clients: List["AsyncQdrantClient"] = []
+        self.dbs: Dict[str, "AsyncTileVectorDB"] = {registry.primary: primary_db}
+        # Collections not connected yet: name -> (error, next attempt at, current backoff)
+        self.unavailable: Dict[str, Tuple[str, float, float]] = {}
+        self._connecting: Set[str] = set()
+
+    @classmethod
+    async def create(
+        cls,
+        registry: CollectionRegistry,
+        primary_db: "AsyncTileVectorDB",
+        default_address: str,
+        query_timeout: float = 10.0,
+        **client_kwargs: Any,
+    ) -> "CollectionSearch":
+        """Connect to every registered collection; the primary one reuses `primary_db`.
+
+        Unreachable nodes and missing collections are logged and retried later rather
+        than failing the whole set.
+        """
+        search = cls(registry, primary_db, default_address, query_timeout=query_timeout, **client_kwargs)
+        others = [entry for entry in registry.entries.values() if entry.name != registry.primary]
+        await asyncio.gather(*[search._connect(entry) for entry in others])
+        print(f"Searchable collections: {list(search.dbs)}")
+        return search
+
+    async def _connect(self, entry: CollectionEntry) -> None:
+        """Try to add `entry` to the searchable collections; on failure, schedule a retry."""
+        from src.qdrant_db import AsyncTileVectorDB
+
+        address = entry.address or self.default_address
+        self._connecting.add(entry.name)
+        try:
+            if address not in self.clients:
+                self.clients[address] = AsyncTileVectorDB(address, entry.name, **self.client_kwargs).qdrant_client
+                self.owned_clients.append(self.clients[address])
+            db = AsyncTileVectorDB(address, entry.name, qdrant_client=self.clients[address])
+            exists = await asyncio.wait_for(db.qdrant_client.collection_exists(entry.name), timeout=self.query_timeout)
+            error = None if exists else f"does not exist at {address}"
+        except Exception as e:
+            error = f"is unreachable at {address}: {e!r}"
+        finally:
+            self._connecting.discard(entry.name)
+
+        if error is None:
+            self.dbs[entry.name] = db
+            if self.unavailable.pop(entry.name, None) is not None:
+                self.logger.info(f"Collection {entry.name} is now searchable")
+            return
+
+        _, _, delay = self.unavailable.get(entry.name, (None, 0.0, self.retry_interval / 2))
+        delay = min(delay * 2, self.max_retry_interval)
+        self.unavailable[entry.name] = (error, time.monotonic() + delay, delay)
+        self.logger.warning(f"Collection {entry.name} {error}, retrying in {delay:.0f}s")
+
+    async def _retry_unavailable(self, collections: List[CollectionEntry]) -> None:
+        """Retry the selected collections that are not connected and whose backoff has expired."""
+        now = time.monotonic()
+        due = [
+            entry for entry in collections
+            if entry.name in self.unavailable
+            and entry.name not in self._connecting
+            and self.unavailable[entry.name][1] <= now
+        ]
+        if due:
+            await asyncio.gather(*[self._connect(entry) for entry in due])
+
+    def status(self) -> Dict[str, Any]:
+        """Searchable collections, and the error and next retry of the others."""
+        now = time.monotonic()
+        return {
+            "searchable": list(self.dbs),
+            "unavailable": {
+                name: {"error": error, "retry_in": max(round(retry_at - now, 1), 0.0)}
+                for name, (error, retry_at, _) in self.unavailable.items()
+            },
+        }
+
+    async def find_tile(self, tile_uuid: str) -> Tuple[CollectionEntry, WSITilePayload, List[float]]:
+        """The collection holding `tile_uuid` (primary first), with the tile's payload and vector."""
+        primary = self.dbs[self.registry.primary]
+        found = await primary.find_tile(tile_uuid)
+        if found is not None:
+            return (self.registry.entries[self.registry.primary], *found)
+
+        others = [name for name in self.dbs if name != self.registry.primary]
+        lookups = await asyncio.gather(
+            *[self.dbs[name].find_tile(tile_uuid) for name in others],
+            return_exceptions=True,
+        )
+        for name, found in zip(others, lookups):
+            if found is not None and not isinstance(found, Exception):
+                return (self.registry.entries[name], *found)
+        raise KeyError(f"Tile {tile_uuid} not found in any collection")
+
+    async def run_query(
+        self,
+        tile_uuid: str,
+        collections: List[CollectionEntry],
+        max_hits: int = 100,
+        min_similarity: float | None = 0.75,
+        group_by: GROUP_BY_FIELDS | None = None,
+        group_size: int = 1,
+        offset: int = 0,
+        **filters: Any,
+    ) -> Tuple[List[WSITilePayload], Dict[str, str]]:
+        """Merged hits over `collections`, and each collection's status ("ok", "timeout", "error: ..." or "skipped: ...").
+
+        Same semantics as `AsyncTileVectorDB.run_query` otherwise; `filters` are its
+        filter arguments. Raises KeyError if the tile is unknown.
+        """
+        if group_by is not None and offset:
+            raise ValueError("offset is not supported for grouped queries")
+
+        from qdrant_client.models import HasIdCondition
+        from src.qdrant_db import build_query_filter
+
+        await self._retry_unavailable(collections)
+        home, payload, vector = await self.find_tile(tile_uuid)
+        query_filter = build_query_filter(payload=payload, **filters)
+        # Querying by vector (unlike by ID) would return the query tile itself
+        query_filter.must_not.append(HasIdCondition(has_id=[tile_uuid]))
+
+        status: Dict[str, str] = {}
+        targets = []
+        for entry in collections:
+            if entry.embedding_model != home.embedding_model:
+                status[entry.name] = f"skipped: embedding model {entry.embedding_model} != {home.embedding_model}"
+            elif entry.name not in self.dbs:
+                error = self.unavailable.get(entry.name, ("not connected",))[0]
+                status[entry.name] = f"skipped: unavailable ({error})"
+            else:
+                targets.append(entry)
+
+        async def search(entry: CollectionEntry) -> List[WSITilePayload]:
+            return await asyncio.wait_for(
+                self.dbs[entry.name].search(
+                    query=vector,
+                    query_filter=query_filter,
+                    # Any collection may hold all of the global top hits
+                    max_hits=max_hits if group_by is not None else offset + max_hits,
+                    min_similarity=min_similarity,
+                    group_by=group_by,
+                    group_size=group_size,
+                ),
+                timeout=entry.timeout or self.query_timeout,
+            )
+
+        responses = await asyncio.gather(*[search(entry) for entry in targets], return_exceptions=True)
+        hit_lists = []
+        for entry, response in zip(targets, responses):
+            if isinstance(response, asyncio.TimeoutError):
+                status[entry.name] = "timeout"
+            elif isinstance(response, Exception):
+                status[entry.name] = f"error: {response}"
+            else:
+                status[entry.name] = "ok"
+                hit_lists.append(response)
+            if status[entry.name] != "ok":
+                self.logger.warning(f"Query of {entry.name} failed: {status[entry.name]}")
+
+        status = {entry.name: status[entry.name] for entry in collections}
+        if group_by is not None:
+            return merge_groups(hit_lists, group_by, max_hits, group_size), status
+        return merge_hits(hit_lists, max_hits, offset), status
+
+    async def close(self) -> None:
+        # The primary collection's client belongs to the async_vector_db resource
+        for client in self.owned_clients:
+            await client.close()
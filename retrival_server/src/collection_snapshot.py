@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import uuid
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from qdrant_client.models import FieldCondition, Filter, MatchAny, MatchValue
+
+from src.qdrant_db import TileVectorDB
+
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+# Marks a payload key absent from a point (distinct from any JSON-encoded value)
+MISSING = ""
+
+
+def snapshot_filter(
+    wsi_paths: List[str] | None = None,
+    patient_ids: List[str] | None = None,
+    magnification: str | None = None,
+    stain: str | None = None,
+    dataset: str | None = None,
+    tags: List[str] | None = None,
+) -> Filter | None:
+    """Filter selecting the subset of a tile collection to export (None = everything)."""
+    must = []
+    if wsi_paths:
+        must.append(FieldCondition(key="wsi_path", match=MatchAny(any=wsi_paths)))
+    if patient_ids:
+        must.append(FieldCondition(key="patient_id", match=MatchAny(any=patient_ids)))
+    if magnification:
+        must.append(FieldCondition(key="magnification", match=MatchValue(value=magnification)))
+    if stain:
+        must.append(FieldCondition(key="stain", match=MatchValue(value=stain)))
+    if dataset:
+        must.append(FieldCondition(key="dataset", match=MatchValue(value=dataset)))
+    for tag in tags or []:
+        must.append(FieldCondition(key="tags", match=MatchValue(value=tag)))
+    return Filter(must=must) if must else None
+
+
+# ---------------------------------------------------------------------- #
+# Shard encoding
+# ---------------------------------------------------------------------- #
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def encode_payload_columns(payloads: List[Dict[str, Any]], ids: List[str] | None = None) -> Dict[str, np.ndarray]:
+    """Columnar encoding of a list of payload dicts.
+
+    Integer columns (coordinates, sizes) are stored as is, and a column repeating
+    the point IDs (the tiles' "uuid") is stored as a reference to them. Every other
+    column is dictionary-encoded: the distinct JSON-encoded values plus one small
+    integer code per point, which is what makes repeated paths, patient IDs, enums and tag
+    lists cheap.
+    """
+    keys = sorted({key for payload in payloads for key in payload})
+    arrays: Dict[str, np.ndarray] = {}
+    for key in keys:
+        values = [payload.get(key, MISSING) for payload in payloads]
+        if ids is not None and values == ids:
+            arrays[f"payload.{key}.id"] = np.zeros(0, dtype=np.uint8)
+            continue
+        if all(_is_int(value) for value in values):
+            arrays[f"payload.{key}.int"] = np.asarray(values, dtype=np.int64)
+            continue
+
+        encoded = [MISSING if value is MISSING else json.dumps(value) for value in values]
+        uniques, codes = np.unique(np.asarray(encoded, dtype=np.str_), return_inverse=True)
+        code_dtype = np.uint8 if len(uniques) <= 2**8 else np.uint16 if len(uniques) <= 2**16 else np.uint32
+        arrays[f"payload.{key}.values"] = uniques
+        arrays[f"payload.{key}.codes"] = codes.astype(code_dtype)
+    return arrays
+
+
+def decode_payload_columns(arrays: Dict[str, np.ndarray], ids: List[str]) -> List[Dict[str, Any]]:
+    """Inverse of `encode_payload_columns`."""
+    payloads: List[Dict[str, Any]] = [{} for _ in range(len(ids))]
+    for name in arrays:
+        if not name.startswith("payload."):
+            continue
+        key, kind = name[len("payload."):].rsplit(".", 1)
+        if kind == "id":
+            for payload, point_id in zip(payloads, ids):
+                payload[key] = point_id
+        elif kind == "int":
+            for payload, value in zip(payloads, arrays[name].tolist()):
+                payload[key] = value
+        elif kind == "codes":
+            decoded = [MISSING if value == MISSING else json.loads(value) for value in arrays[f"payload.{key}.values"].tolist()]
+            for payload, code in zip(payloads, arrays[name].tolist()):
+                value = decoded[code]
+                if value is not MISSING:
+                    payload[key] = value
+    return payloads
+
+
+def encode_ids(ids: List[str]) -> Dict[str, np.ndarray]:
+    """UUID point IDs as 16 raw bytes each; anything else as strings."""
+    try:
+        return {"ids.uuid": np.frombuffer(b"".join(uuid.UUID(point_id).bytes for point_id in ids), dtype=np.uint8).reshape(-1, 16)}
+    except ValueError:
+        return {"ids.str": np.asarray(ids, dtype=np.str_)}
+
+
+def decode_ids(arrays: Dict[str, np.ndarray]) -> List[str]:
+    if "ids.uuid" in arrays:
+        return [str(uuid.UUID(bytes=row.tobytes())) for row in arrays["ids.uuid"]]
+    return arrays["ids.str"].tolist()
+
+
+def write_shard(path: str, ids: List[str], vectors: np.ndarray, payloads: List[Dict[str, Any]]) -> None:
+    """Write one compressed shard: float16 vectors, point IDs and encoded payload columns."""
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(
+        tmp_path,
+        vectors=np.asarray(vectors, dtype=np.float16),
+        **encode_ids(ids),
+        **encode_payload_columns(payloads, ids),
+    )
+    os.replace(tmp_path, path)
+
+
+def read_shard(path: str) -> Tuple[List[str], np.ndarray, List[Dict[str, Any]]]:
+    """Read a shard back as (ids, float32 vectors, payloads)."""
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in data.files}
+    ids = decode_ids(arrays)
+    return ids, arrays["vectors"].astype(np.float32), decode_payload_columns(arrays, ids)
+
+
+# ---------------------------------------------------------------------- #
+# Export / import
+# ---------------------------------------------------------------------- #
+
+def export_collection(
+    db: TileVectorDB,
+    out_dir: str,
+    scroll_filter: Filter | None = None,
+    shard_size: int = 100_000,
+) -> Dict[str, Any]:
+    """Export (a filtered subset of) `db`'s collection into `out_dir` as shards + manifest.
+
+    Vectors are stored as float16, which halves their size; for the cosine
+    similarities used here the rounding error is far below any meaningful score
+    difference. Points are scrolled in small pages and their vectors copied into a
+    preallocated float16 shard array as they arrive, so memory is bounded by one
+    shard's arrays and payloads rather than by Qdrant records (float lists).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    info = db.qdrant_client.get_collection(db.collection_name)
+    vectors_config = info.config.params.vectors
+    start = time.time()
+
+    shards = []
+    vectors = np.empty((shard_size, vectors_config.size), dtype=np.float16)
+    ids: List[str] = []
+    payloads: List[Dict[str, Any]] = []
+
+    def flush() -> None:
+        name = f"shard-{len(shards):05d}.npz"
+        write_shard(os.path.join(out_dir, name), ids=ids, vectors=vectors[:len(ids)], payloads=payloads)
+        shards.append({"file": name, "n_points": len(ids)})
+        print(f"Wrote {name} ({len(ids)} points, {sum(shard['n_points'] for shard in shards)} total)")
+        ids.clear()
+        payloads.clear()
+
+    for point in db.iter_points(scroll_filter=scroll_filter, batch_size=min(shard_size, 1_000)):
+        vectors[len(ids)] = point.vector
+        ids.append(str(point.id))
+        payloads.append(point.payload)
+        if len(ids) == shard_size:
+            flush()
+    if ids:
+        flush()
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "source_collection": db.collection_name,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "filter": scroll_filter.model_dump(mode="json", exclude_none=True) if scroll_filter else None,
+        "vector_size": vectors_config.size,
+        "distance": vectors_config.distance.value,
+        "vector_dtype": "float16",
+        "payload_indexes": {
+            field: schema.data_type.value for field, schema in (info.payload_schema or {}).items()
+        },
+        "n_points": sum(shard["n_points"] for shard in shards),
+        "shards": shards,
+    }
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=4)
+
+    print(f"Exported {manifest['n_points']} points in {len(shards)} shards to {out_dir} in {time.time() - start:.1f}s")
+    return manifest
+
+
+def read_manifest(snapshot_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(snapshot_dir, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format: {manifest.get('format_version')}")
+    return manifest
+
+
+def import_collection(
+    db: TileVectorDB,
+    snapshot_dir: str,
+    batch_size: int = 256,
+    parallel: int = 4,
+) -> int:
+    """Upload every shard of a snapshot into `db`'s (existing) collection. Returns the point count."""
+    manifest = read_manifest(snapshot_dir)
+    start = time.time()
+
+    total = 0
+    for shard in manifest["shards"]:
+        ids, vectors, payloads = read_shard(os.path.join(snapshot_dir, shard["file"]))
+        db.upload_points(ids, vectors, payloads, batch_size=batch_size, parallel=parallel)
+        total += len(ids)
+        print(f"Uploaded {shard['file']} ({total}/{manifest['n_points']} points, {time.time() - start:.0f}s)")
+
+    return total
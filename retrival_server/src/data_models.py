@@ -1,6 +1,6 @@
 from enum import Enum
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List, Tuple
 import math
 
 class DATASETS(Enum):
@@ -25,6 +25,21 @@ class MAGNIFICATIONS(Enum):
     X40 = "40x"
 
 
+class GROUP_BY_FIELDS(Enum):
+    WSI_PATH = "wsi_path"
+    PATIENT_ID = "patient_id"
+
+
+class ARCHIVE_FORMATS(Enum):
+    ZIP = "zip"
+    TAR = "tar"
+
+
+class IMAGE_FORMATS(Enum):
+    PNG = "png"
+    JPEG = "jpeg"
+
+
 class QDRANT_ENTRY_TYPES(Enum):
     WSI_TILE = "WSI_TILE"
     TILE = "TILE"
@@ -69,4 +84,86 @@ class WSI_ENTRY(BaseModel):
         # Convert 'nan' to None for the note field
         if "note" in data and isinstance(data["note"], float) and math.isnan(data["note"]):
             data["note"] = None
-        super().__init__(**data)
\ No newline at end of file
+        super().__init__(**data)
+
+
+class WSISearchResult(BaseModel):
+    wsi_paths: List[str]
+    total: int
+    next_offset: int | None = None
+
+
+class LabelCount(BaseModel):
+    label: str
+    count: int
+
+
+class SlideDescriptor(BaseModel):
+    """Everything /metadata/ needs about a slide, cached so the file need not be opened."""
+    wsi_path: str
+    mtime: float
+    size: int
+    # DeepZoom pyramid (index 0 = most zoomed-out)
+    level_count: int
+    level_dimensions: List[Tuple[int, int]]
+    level_tiles: List[Tuple[int, int]]
+    # OpenSlide pyramid (index 0 = full resolution)
+    slide_dimensions: List[Tuple[int, int]]
+    slide_downsamples: List[float]
+    mpp_x: float = 0.0
+    mpp_y: float = 0.0
+    vendor: str | None = None
+    properties: Dict[str, str] = {}
+    associated_images: List[str] = []
+
+
+class WSISlidePayload(QdrantPayload):
+    patient_id: str
+    wsi_path: str
+    dataset: DATASETS
+    magnification: MAGNIFICATIONS
+    stain: STAINS
+    n_tiles: int
+    # Norm of the mean tile vector (Qdrant stores cosine vectors normalized)
+    mean_norm: float = 1.0
+    centroid_counts: List[float] = []
+    score: float | None = None
+    tags: List[str] = []
+
+
+class SimilarSlide(BaseModel):
+    slide: WSISlidePayload
+    tiles: List[WSITilePayload]
+
+
+class ExportRegion(BaseModel):
+    """A square slide region; x, y and size are in level-0 pixels (tile payloads validate as-is)."""
+    wsi_path: str
+    x: int
+    y: int
+    size: int
+    # OpenSlide pyramid level to read at (0 = full resolution)
+    level: int = 0
+    uuid: str | None = None
+
+
+class RegionExportRequest(BaseModel):
+    regions: List[ExportRegion]
+    archive_format: ARCHIVE_FORMATS = ARCHIVE_FORMATS.ZIP
+    image_format: IMAGE_FORMATS = IMAGE_FORMATS.PNG
+
+
+class CollectionEntry(BaseModel):
+    """A tile collection known to the server (see `src.collection_registry`)."""
+    name: str
+    # Qdrant node holding it (None = QDRANT_ADDRESS)
+    address: str | None = None
+    cohort: str | None = None
+    # Collections are searched together only if embedded by the same model
+    embedding_model: str = "default"
+    # Magnifications present (empty = unknown/any); used to skip collections a query cannot match
+    magnifications: List[MAGNIFICATIONS] = []
+    # Searched when a query does not name collections or a cohort
+    default: bool = True
+    # Per-collection query timeout in seconds (None = server default)
+    timeout: float | None = None
@@ -0,0 +1,187 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
+# Extensions OpenSlide can open (generic tiled TIFFs use .tif/.tiff)
+WSI_EXTENSIONS = (
+    ".svs", ".tif", ".tiff", ".ndpi", ".vms", ".vmu", ".scn",
+    ".mrxs", ".svslide", ".bif", ".dcm", ".czi",
+)
+
+# Sort key for directory entries: directories (0) before files (1), then by name
+Entry = Tuple[int, str]
+
+
+class DirectoryListing:
+    """Sorted snapshot of a directory's entries."""
+
+    def __init__(self, mtime: float, entries: List[Entry]) -> None:
+        self.mtime = mtime
+        self.entries = entries
+        self.checked_at = time.monotonic()
+
+
+class DirectoryIndex:
+    """Cached, paginated directory listings for the file browser.
+
+    Listings are built with `os.scandir` (entry types come from the directory read
+    itself, no per-entry stat) and cached per directory. Within `ttl` seconds a
+    listing is reused as is; after that the directory's mtime is checked and the
+    listing is only rebuilt when it changed.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 10.0,
+        max_directories: int = 256,
+        max_readable: int = 4096,
+        extensions: Tuple[str, ...] = WSI_EXTENSIONS,
+    ) -> None:
+        self.ttl = ttl
+        self.max_directories = max_directories
+        self.max_readable = max_readable
+        self.extensions = extensions
+        self.logger = logging.getLogger("DirectoryIndex")
+
+        self._lock = threading.Lock()
+        # (dir_path, wsi_only) -> listing
+        self._listings: OrderedDict[Tuple[str, bool], DirectoryListing] = OrderedDict()
+        # file path -> (mtime, size, readable), least recently used first
+        self._readable: OrderedDict[str, Tuple[float, int, bool]] = OrderedDict()
+
+    def is_wsi_name(self, name: str) -> bool:
+        return name.lower().endswith(self.extensions)
+
+    def _scan(self, dir_path: str, wsi_only: bool) -> List[Entry]:
+        entries: List[Entry] = []
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                if is_dir:
+                    entries.append((0, entry.name))
+                elif not wsi_only or self.is_wsi_name(entry.name):
+                    entries.append((1, entry.name))
+        entries.sort()
+        return entries
+
+    def listing(self, dir_path: str, wsi_only: bool = True) -> DirectoryListing:
+        """Return the (possibly cached) sorted listing of `dir_path`.
+
+        Raises:
+            NotADirectoryError / FileNotFoundError / PermissionError: From the filesystem.
+        """
+        key = (dir_path, wsi_only)
+        now = time.monotonic()
+
+        with self._lock:
+            cached = self._listings.get(key)
+        if cached is not None and now - cached.checked_at < self.ttl:
+            return cached
+
+        mtime = os.stat(dir_path).st_mtime
+        if cached is not None and cached.mtime == mtime:
+            cached.checked_at = now
+            return cached
+
+        listing = DirectoryListing(mtime, self._scan(dir_path, wsi_only))
+        self.logger.debug("Indexed %s (%d entries)", dir_path, len(listing.entries))
+
+        with self._lock:
+            self._listings[key] = listing
+            self._listings.move_to_end(key)
+            while len(self._listings) > self.max_directories:
+                self._listings.popitem(last=False)
+        return listing
+
+    def page(
+        self,
+        dir_path: str,
+        prefix: str = "",
+        cursor: str | None = None,
+        limit: int | None = None,
+        wsi_only: bool = True,
+    ) -> Tuple[List[str], List[str], str | None]:
+        """Return one page of (directories, files, next_cursor) for `dir_path`.
+
+        Directories come before files, each sorted by name. `prefix` restricts the page
+        to names starting with it; `cursor` is the `next_cursor` of the previous page.
+        """
+        entries = self.listing(dir_path, wsi_only).entries
+
+        # Narrow to the prefix range with binary search on each of the two groups
+        ranges = []
+        for kind in (0, 1):
+            lo = bisect.bisect_left(entries, (kind, prefix))
+            hi = bisect.bisect_left(entries, (kind, prefix + "\U0010ffff"))
+            ranges.append((lo, hi))
+
+        start_after = _decode_cursor(cursor)
+        dirs: List[str] = []
+        files: List[str] = []
+        remaining = limit
+        last: Entry | None = None
+        for lo, hi in ranges:
+            if start_after is not None:
+                lo = max(lo, bisect.bisect_right(entries, start_after, lo, hi))
+            if remaining is not None:
+                hi = min(hi, lo + remaining)
+            for kind, name in entries[lo:hi]:
+                (dirs if kind == 0 else files).append(name)
+                last = (kind, name)
+            if remaining is not None:
+                remaining -= hi - lo
+
+        # More entries left in the prefix range after the last one returned?
+        next_cursor = None
+        if limit is not None and last is not None:
+            after = bisect.bisect_right(entries, last)
+            if any(max(lo, after) < hi for lo, hi in ranges):
+                next_cursor = _encode_cursor(last)
+
+        return dirs, files, next_cursor
+
+    def is_readable(self, path: str) -> bool:
+        """Whether OpenSlide recognises `path`, cached by path + mtime + size."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+
+        with self._lock:
+            cached = self._readable.get(path)
+            if cached is not None and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+                self._readable.move_to_end(path)
+                return cached[2]
+
+        from openslide import OpenSlide
+
+        try:
+            readable = OpenSlide.detect_format(path) is not None
+        except Exception:
+            readable = False
+        with self._lock:
+            self._readable[path] = (stat.st_mtime, stat.st_size, readable)
+            self._readable.move_to_end(path)
+            while len(self._readable) > self.max_readable:
+                self._readable.popitem(last=False)
+        return readable
+
+
+def _encode_cursor(entry: Entry) -> str:
+    return f"{entry[0]}/{entry[1]}"
+
+
+def _decode_cursor(cursor: str | None) -> Entry | None:
+    if not cursor:
+        return None
+    kind, _, name = cursor.partition("/")
+    if kind not in ("0", "1"):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return int(kind), name
@@ -0,0 +1,162 @@
+import io
+import asyncio
+import colorsys
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Hashable, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from src.data_models import WSITilePayload
+
+
+@lru_cache(maxsize=1)
+def score_colormap() -> np.ndarray:
+    """256-entry RGBA lookup table for scores in [-1, 1].
+
+    Same mapping the viewer uses for its vector heatmap: hue 240 (blue) at -1 down to
+    0 (red) at 1, full saturation, 50% lightness, 50% opacity.
+    """
+    lut = np.zeros((256, 4), dtype=np.uint8)
+    for i in range(256):
+        hue = (240 * (1 - i / 255)) / 360
+        r, g, b = colorsys.hls_to_rgb(hue, 0.5, 1.0)
+        lut[i] = (round(r * 255), round(g * 255), round(b * 255), 128)
+    return lut
+
+
+def empty_tile_png(tile_size: int = 256) -> bytes:
+    """A fully transparent PNG tile, encoded once."""
+    return _blank_png(tile_size, tile_size)
+
+
+@lru_cache(maxsize=64)
+def _blank_png(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGBA", (width, height), (0, 0, 0, 0)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class HeatmapRaster:
+    """Tile similarity scores rasterized onto the slide's tile lattice.
+
+    Each grid cell covers one (level-0) tile, so the raster is tiny compared to the
+    slide, and any DeepZoom tile of the heatmap can be rendered from it by nearest
+    neighbour sampling.
+    """
+
+    def __init__(self, tiles: List[WSITilePayload], slide_width: int, slide_height: int) -> None:
+        self.slide_width = slide_width
+        self.slide_height = slide_height
+        self.n_tiles = len(tiles)
+
+        scored = [tile for tile in tiles if tile.score is not None]
+        # Exact per-tile scores, for callers that list tiles rather than render them
+        self.scores = {tile.uuid: tile.score for tile in scored}
+        if not scored:
+            self.cell = 1
+            self.origin = (0, 0)
+            self.grid = np.full((0, 0), np.nan, dtype=np.float32)
+            self.min_score = self.max_score = None
+            return
+
+        xs = np.array([tile.x for tile in scored], dtype=np.int64)
+        ys = np.array([tile.y for tile in scored], dtype=np.int64)
+        scores = np.array([tile.score for tile in scored], dtype=np.float32)
+
+        # Align the grid with the tile lattice (tiles are laid out every `size` pixels)
+        self.cell = int(min(tile.size for tile in scored))
+        self.origin = (int(xs.min() % self.cell), int(ys.min() % self.cell))
+
+        cols = (xs - self.origin[0]) // self.cell
+        rows = (ys - self.origin[1]) // self.cell
+        self.grid = np.full((rows.max() + 1, cols.max() + 1), np.nan, dtype=np.float32)
+        np.fmax.at(self.grid, (rows, cols), scores)
+
+        self.min_score = float(scores.min())
+        self.max_score = float(scores.max())
+
+    def render_tile(self, z: int, x: int, y: int, level_count: int, tile_size: int = 256) -> bytes:
+        """Render DeepZoom tile (z, x, y) of the heatmap as an RGBA PNG."""
+        if self.grid.size == 0:
+            return empty_tile_png(tile_size)
+
+        downsample = 2 ** (level_count - 1 - z)
+        # Edge tiles are cropped to the level size, like DeepZoomGenerator's
+        level_width = -(-self.slide_width // downsample)
+        level_height = -(-self.slide_height // downsample)
+        width = min(tile_size, level_width - x * tile_size)
+        height = min(tile_size, level_height - y * tile_size)
+        if width <= 0 or height <= 0:
+            return empty_tile_png(tile_size)
+
+        px = x * tile_size * downsample + (np.arange(width) + 0.5) * downsample
+        py = y * tile_size * downsample + (np.arange(height) + 0.5) * downsample
+
+        cols = np.floor((px - self.origin[0]) / self.cell).astype(np.int64)
+        rows = np.floor((py - self.origin[1]) / self.cell).astype(np.int64)
+        col_ok = (cols >= 0) & (cols < self.grid.shape[1]) & (px < self.slide_width)
+        row_ok = (rows >= 0) & (rows < self.grid.shape[0]) & (py < self.slide_height)
+        if not col_ok.any() or not row_ok.any():
+            return _blank_png(width, height)
+
+        values = self.grid[np.clip(rows, 0, self.grid.shape[0] - 1)][:, np.clip(cols, 0, self.grid.shape[1] - 1)]
+        values[~row_ok, :] = np.nan
+        values[:, ~col_ok] = np.nan
+
+        missing = np.isnan(values)
+        if missing.all():
+            return _blank_png(width, height)
+
+        indices = np.clip(np.rint((np.nan_to_num(values) + 1) / 2 * 255), 0, 255).astype(np.uint8)
+        rgba = score_colormap()[indices]
+        rgba[missing] = 0
+
+        buffer = io.BytesIO()
+        Image.fromarray(rgba, mode="RGBA").save(buffer, format="PNG")
+        return buffer.getvalue()
+
+
+class HeatmapCache:
+    """LRU of heatmap rasters and of their rendered PNG tiles.
+
+    Concurrent requests for a raster that is still being built share one build.
+    """
+
+    def __init__(self, max_rasters: int = 16, max_tiles: int = 4_096) -> None:
+        self.max_rasters = max_rasters
+        self.max_tiles = max_tiles
+        self._rasters: OrderedDict[Hashable, Any] = OrderedDict()
+        self._tiles: OrderedDict[Tuple[Hashable, int, int, int], bytes] = OrderedDict()
+        self._building: dict[Hashable, asyncio.Future] = {}
+
+    async def get_raster(self, key: Hashable, build: Callable[[], Awaitable[Any]]) -> Any:
+        """Cached raster entry for `key` (whatever `build` returns), building it on a miss."""
+        raster = self._rasters.get(key)
+        if raster is not None:
+            self._rasters.move_to_end(key)
+            return raster
+
+        future = self._building.get(key)
+        if future is None:
+            future = asyncio.ensure_future(build())
+            self._building[key] = future
+            future.add_done_callback(lambda _: self._building.pop(key, None))
+        raster = await asyncio.shield(future)
+
+        _put(self._rasters, key, raster, self.max_rasters)
+        return raster
+
+    def get_tile(self, key: Hashable, z: int, x: int, y: int) -> bytes | None:
+        return self._tiles.get((key, z, x, y))
+
+    def put_tile(self, key: Hashable, z: int, x: int, y: int, data: bytes) -> None:
+        _put(self._tiles, (key, z, x, y), data, self.max_tiles)
+
+
+def _put(cache: OrderedDict, key: Any, value: Any, max_size: int) -> None:
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > max_size:
+        cache.popitem(last=False)
@@ -0,0 +1,136 @@
+import time
+import asyncio
+import inspect
+import logging
+from typing import Any, Callable, Dict
+
+
+class ResourceUnavailable(Exception):
+    """Raised when a lazily initialized resource is not (or no longer) usable."""
+
+    def __init__(self, name: str, error: str | None = None) -> None:
+        self.name = name
+        self.error = error
+        super().__init__(f"{name} is unavailable" + (f": {error}" if error else ""))
+
+
+class LazyResource:
+    """A dependency (DB client, cache, ...) that is initialized in the background.
+
+    The server starts accepting requests immediately; `run()` keeps retrying the
+    factory with exponential backoff until it succeeds and then, if a health check
+    is given, keeps probing it so readiness reflects reality. Attribute access is
+    forwarded to the underlying object, so `resource.method(...)` works as if it
+    were the object itself and raises `ResourceUnavailable` while it is not ready.
+
+    `factory` may be a plain function (run in a worker thread) or a coroutine
+    function (awaited on the event loop).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        required: bool = True,
+        health_check: Callable[[Any], bool] | None = None,
+        retry_interval: float = 1.0,
+        max_retry_interval: float = 30.0,
+        check_interval: float = 15.0,
+    ) -> None:
+        self.name = name
+        self.factory = factory
+        self.required = required
+        self.health_check = health_check
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.check_interval = check_interval
+        self.logger = logging.getLogger(f"LazyResource.{name}")
+
+        self._instance = None
+        self._healthy = False
+        self._error: str | None = None
+        self._attempts = 0
+        self._ready_since: float | None = None
+
+    # ------------------------------------------------------------------ #
+    # Access
+    # ------------------------------------------------------------------ #
+
+    @property
+    def ready(self) -> bool:
+        return self._instance is not None and self._healthy
+
+    def get_instance(self) -> Any:
+        """Return the underlying object, or raise `ResourceUnavailable`."""
+        if not self.ready:
+            raise ResourceUnavailable(self.name, self._error)
+        return self._instance
+
+    def __getattr__(self, attr: str) -> Any:
+        # Only called for attributes not found on the resource itself
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.get_instance(), attr)
+
+    def set_instance(self, instance: Any) -> None:
+        """Install an already-built instance (tests, tools, manual overrides)."""
+        self._instance = instance
+        self._healthy = True
+        self._error = None
+        self._ready_since = time.time()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "required": self.required,
+            "attempts": self._attempts,
+            "error": self._error,
+            "ready_since": self._ready_since,
+        }
+
+    # ------------------------------------------------------------------ #
+    # Background initialization
+    # ------------------------------------------------------------------ #
+
+    async def _call(self, func: Callable, *args) -> Any:
+        if inspect.iscoroutinefunction(func):
+            return await func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    async def run(self) -> None:
+        """Initialize with retries, then keep health-checking. Runs until cancelled."""
+        delay = self.retry_interval
+        while self._instance is None:
+            self._attempts += 1
+            try:
+                instance = await self._call(self.factory)
+            except Exception as e:
+                self._error = str(e)
+                self.logger.warning(f"Initializing {self.name} failed (attempt {self._attempts}), retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_interval)
+                continue
+            self.set_instance(instance)
+            self.logger.info(f"{self.name} initialized")
+
+        if self.health_check is None:
+            return
+
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                healthy = bool(await self._call(self.health_check, self._instance))
+                error = None if healthy else "health check failed"
+            except Exception as e:
+                healthy, error = False, str(e)
+
+            if healthy != self._healthy:
+                self.logger.warning(f"{self.name} is now {'healthy' if healthy else 'unhealthy'}")
+                self._healthy = healthy
+                self._error = error
+                self._ready_since = time.time() if healthy else None
+
+    async def shutdown(self) -> None:
+        """Close the underlying object if it has a `close` method."""
+        if self._instance is not None and hasattr(self._instance, "close"):
+            await self._call(self._instance.close)
@@ -1,29 +1,109 @@
 import sys
+import httpx
+import numpy as np
 from pathlib import Path
-from typing import List, Tuple
-from qdrant_client import QdrantClient
+from typing import Any, AsyncIterator, Dict, Iterable, List, Tuple
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.models import ( 
     Filter,
     FieldCondition,
     MatchValue,
     MatchAny,
+    Record,
 )
 
 # Set the root directory dynamically
 ROOT_DIR = Path(__file__).resolve().parent.parent  # Adjust as needed
 sys.path.insert(0, str(ROOT_DIR))
 
-from src.data_models import WSITilePayload, STAINS, MAGNIFICATIONS
+from src.data_models import WSITilePayload, STAINS, MAGNIFICATIONS, GROUP_BY_FIELDS
+
+
+def build_query_filter(
+    payload: WSITilePayload,
+    same_patient: bool | None = None,
+    same_wsi: bool | None = None,
+    magnification_list: List[MAGNIFICATIONS] | None = None,
+    stain_list: List[STAINS] | None = None,
+    tag_filter: str | None = None,
+    uuids: Iterable[str] | None = None,
+    wsi_paths: Iterable[str] | None = None,
+) -> Filter:
+    """Build the Qdrant filter for a similarity query around the tile described by `payload`."""
+    must_filters = []
+    must_not_filters = [FieldCondition(key="uuid", match=MatchValue(value=payload.uuid))]
+    should_filters = []
+
+    if same_patient is False:
+        must_not_filters.append(FieldCondition(key="patient_id", match=MatchValue(value=payload.patient_id)))
+    if same_patient:
+        must_filters.append(FieldCondition(key="patient_id", match=MatchValue(value=payload.patient_id)))
+
+    if same_wsi:
+        must_filters.append(FieldCondition(key="wsi_path", match=MatchValue(value=payload.wsi_path)))
+    elif same_wsi is False:
+        must_not_filters.append(FieldCondition(key="wsi_path", match=MatchValue(value=payload.wsi_path)))
+
+    if magnification_list:
+        must_filters.append(FieldCondition(key="magnification", match=MatchValue(value=magnification_list[0].value)))
+
+    if stain_list:
+        must_filters.append(FieldCondition(key="stain", match=MatchValue(value=stain_list[0].value)))
+
+    if tag_filter:
+        tags = [tag.strip() for tag in tag_filter.split(",")]
+        for tag in tags:
+            must_filters.append(FieldCondition(key="tags", match=MatchValue(value=tag)))
+
+    if uuids:
+        must_filters.append(
+            FieldCondition(
+                key="uuid", 
+                match=MatchAny(any=list(uuids))
+            )
+        )
+
+    if wsi_paths is not None:
+        must_filters.append(
+            FieldCondition(
+                key="wsi_path",
+                match=MatchAny(any=list(wsi_paths))
+            )
+        )
+
+    return Filter(
+        must=must_filters,
+        must_not=must_not_filters,
+        should=should_filters
+    )
+
+
+def to_tile_payloads(scored_points) -> List[WSITilePayload]:
+    """Convert Qdrant scored points into tile payloads carrying their score."""
+    results = []
+    for scored_point in scored_points:
+        tile = WSITilePayload(**scored_point.payload)
+        tile.score = scored_point.score
+        results.append(tile)
+    return results
+
+
+def flatten_groups(groups) -> List[WSITilePayload]:
+    """Flatten Qdrant point groups (best group first) into tile payloads carrying their score."""
+    results = []
+    for group in groups:
+        results.extend(to_tile_payloads(group.hits))
+    return results
 
 
 class TileVectorDB:
-    def __init__(self, qdrant_address: str, collection_name: str) -> None:
+    def __init__(self, qdrant_address: str, collection_name: str, qdrant_client: QdrantClient | None = None) -> None:
         self.qdrant_address = qdrant_address
         self.collection_name = collection_name
         
-        # Establish client
+        # Establish client (or use the given one, e.g. an in-memory client in tools)
         try:
-            self.qdrant_client = QdrantClient(location=self.qdrant_address)
+            self.qdrant_client = qdrant_client or QdrantClient(location=self.qdrant_address)
         except Exception as e:
             raise Exception(f"Failed to initialize Qdrant client at {self.qdrant_address}: {e}")
 
@@ -73,6 +153,14 @@ class TileVectorDB:
                 break
 
         return all_tiles
+
+    def count_wsi_tiles(self, wsi_path: str) -> int:
+        """Number of tiles of a slide (all magnifications)."""
+        return self.qdrant_client.count(
+            collection_name=self.collection_name,
+            count_filter=Filter(must=[FieldCondition(key="wsi_path", match=MatchValue(value=wsi_path))]),
+            exact=True,
+        ).count
     
     def run_query(
         self, 
@@ -85,68 +173,66 @@ class TileVectorDB:
         stain_list: List[STAINS] | None = None,
         tag_filter: str | None = None,
         uuids: List[str] | None = None,
+        wsi_paths: List[str] | None = None,
+        group_by: GROUP_BY_FIELDS | None = None,
+        group_size: int = 1,
+        offset: int = 0,
     ) -> List[WSITilePayload]:
+        """Tiles most similar to `tile_uuid`, filtered as requested.
+
+        With `group_by`, hits are grouped by that payload field in Qdrant: `max_hits`
+        is then the number of groups and `group_size` the number of tiles per group,
+        and the groups are returned flattened, best group first.
+
+        `offset` skips the first hits, for paging through large result sets (not
+        supported together with `group_by`).
+        """
     
         # get query tile (payload and vector)
         payload, query_tile_vector = self.get_tile(tile_uuid=tile_uuid)
 
         # create query filters
-        must_filters = []
-        must_not_filters = [FieldCondition(key="uuid", match=MatchValue(value=payload.uuid))]
-        should_filters = []
-
-        if same_patient is False:
-            must_not_filters.append(FieldCondition(key="patient_id", match=MatchValue(value=payload.patient_id)))
-        if same_patient:
-            must_filters.append(FieldCondition(key="patient_id", match=MatchValue(value=payload.patient_id)))
-        
-        if same_wsi:
-            must_filters.append(FieldCondition(key="wsi_path", match=MatchValue(value=payload.wsi_path)))
-        elif same_wsi is False:
-            must_not_filters.append(FieldCondition(key="wsi_path", match=MatchValue(value=payload.wsi_path)))
+        query_filter = build_query_filter(
+            payload=payload,
+            same_patient=same_patient,
+            same_wsi=same_wsi,
+            magnification_list=magnification_list,
+            stain_list=stain_list,
+            tag_filter=tag_filter,
+            uuids=uuids,
+            wsi_paths=wsi_paths,
+        )
+
+        # grouped query: the best `group_size` tiles of each of the top `max_hits` groups
+        if group_by is not None:
+            if offset:
+                raise ValueError("offset is not supported for grouped queries")
+            groups = self.qdrant_client.query_points_groups(
+                collection_name=self.collection_name,
+                group_by=group_by.value,
+                query=tile_uuid,
+                query_filter=query_filter,
+                with_payload=True,
+                score_threshold=min_similarity,
+                limit=max_hits,
+                group_size=group_size,
+            ).groups
+            return flatten_groups(groups)
 
-        if magnification_list:
-            must_filters.append(FieldCondition(key="magnification", match=MatchValue(value=magnification_list[0].value)))
-        
-        if stain_list:
-            must_filters.append(FieldCondition(key="stain", match=MatchValue(value=stain_list[0].value)))
-
-        if tag_filter:
-            tags = [tag.strip() for tag in tag_filter.split(",")]
-            for tag in tags:
-                must_filters.append(FieldCondition(key="tags", match=MatchValue(value=tag)))
-
-        if uuids:
-            must_filters.append(
-                FieldCondition(
-                    key="uuid", 
-                    match=MatchAny(any=uuids)
-                )
-            )
-        
         # run query
         search_result = self.qdrant_client.query_points(
             collection_name=self.collection_name,
             # query=query_tile_vector,
             query=tile_uuid,
-            query_filter=Filter(
-                must=must_filters,
-                must_not=must_not_filters,
-                should=should_filters
-            ),
+            query_filter=query_filter,
             with_payload=True,
             score_threshold=min_similarity,
             limit=max_hits,
+            offset=offset,
         ).points
 
         # formatting results to return
-        results = []
-        for scored_point in search_result:
-            tile = WSITilePayload(**scored_point.payload)
-            tile.score = scored_point.score
-            results.append(tile)
-
-        return results
+        return to_tile_payloads(search_result)
 
     def get_tile(self, tile_uuid: str) -> Tuple[WSITilePayload, List[float]]:
 
@@ -159,3 +245,248 @@ class TileVectorDB:
         tile_payload = WSITilePayload(**tile.payload)
 
         return tile_payload, tile.vector
+
+    def iter_points(
+        self,
+        scroll_filter: Filter | None = None,
+        batch_size: int = 1_000,
+        with_vectors: bool = True,
+    ) -> Iterable[Record]:
+        """Every point of the collection (matching `scroll_filter`), with payloads and vectors."""
+        next_page = None
+        while True:
+            points, next_page = self.qdrant_client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=scroll_filter,
+                limit=batch_size,
+                offset=next_page,
+                with_payload=True,
+                with_vectors=with_vectors,
+            )
+            yield from points
+            if next_page is None:
+                break
+
+    def upload_points(
+        self,
+        ids: List[str],
+        vectors: np.ndarray,
+        payloads: List[Dict[str, Any]],
+        batch_size: int = 256,
+        parallel: int = 1,
+    ) -> None:
+        """Bulk upload points, split into batches sent by `parallel` worker processes."""
+        self.qdrant_client.upload_collection(
+            collection_name=self.collection_name,
+            vectors=vectors,
+            payload=payloads,
+            ids=ids,
+            batch_size=batch_size,
+            parallel=parallel,
+            wait=True,
+        )
+
+
+class AsyncTileVectorDB:
+    """Async counterpart of `TileVectorDB` for use from `async def` routes.
+
+    Queries run on the event loop over a pool of keep-alive HTTP connections (or a
+    gRPC channel with `prefer_grpc=True`) instead of holding a threadpool thread
+    for the whole round trip. Build it with `await AsyncTileVectorDB.create(...)`, which also
+    verifies the connection and collection.
+    """
+
+    def __init__(
+        self,
+        qdrant_address: str,
+        collection_name: str,
+        prefer_grpc: bool = False,
+        grpc_port: int = 6334,
+        timeout: int | None = None,
+        pool_size: int = 64,
+        qdrant_client: AsyncQdrantClient | None = None,
+    ) -> None:
+        self.qdrant_address = qdrant_address
+        self.collection_name = collection_name
+        self.prefer_grpc = prefer_grpc
+
+        self.qdrant_client = qdrant_client or AsyncQdrantClient(
+            location=self.qdrant_address,
+            prefer_grpc=prefer_grpc,
+            grpc_port=grpc_port,
+            timeout=timeout,
+            # gRPC channels multiplex requests; keep them alive across idle periods
+            grpc_options={"grpc.keepalive_time_ms": 30_000},
+            # REST: reuse up to `pool_size` keep-alive connections
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    @classmethod
+    async def create(cls, qdrant_address: str, collection_name: str, **kwargs) -> "AsyncTileVectorDB":
+        db = cls(qdrant_address, collection_name, **kwargs)
+
+        # Verify connection
+        if not await db.is_client_alive():
+            await db.close()
+            raise Exception(f"Qdrant client at {qdrant_address} is unreachable!")
+
+        # Verify valid collection
+        if not await db.qdrant_client.collection_exists(collection_name):
+            await db.close()
+            raise Exception(f"Qdrant collection {collection_name} does not exist!")
+
+        transport = "gRPC" if db.prefer_grpc else "HTTP"
+        print(f"AsyncQdrantClient at {qdrant_address} ({transport}) successfully initialized!")
+        return db
+
+    async def is_client_alive(self) -> bool:
+        """Check if Qdrant is reachable."""
+        try:
+            return await self.qdrant_client.get_collections() is not None
+        except Exception:
+            return False
+
+    async def run_query(
+        self,
+        tile_uuid: str,
+        max_hits: int = 100,
+        min_similarity: float | None = 0.75,
+        same_patient: bool | None = None,
+        same_wsi: bool | None = None,
+        magnification_list: List[MAGNIFICATIONS] | None = None,
+        stain_list: List[STAINS] | None = None,
+        tag_filter: str | None = None,
+        uuids: List[str] | None = None,
+        wsi_paths: List[str] | None = None,
+        group_by: GROUP_BY_FIELDS | None = None,
+        group_size: int = 1,
+        offset: int = 0,
+    ) -> List[WSITilePayload]:
+        """Same semantics as `TileVectorDB.run_query`."""
+
+        payload, _ = await self.get_tile(tile_uuid=tile_uuid)
+
+        query_filter = build_query_filter(
+            payload=payload,
+            same_patient=same_patient,
+            same_wsi=same_wsi,
+            magnification_list=magnification_list,
+            stain_list=stain_list,
+            tag_filter=tag_filter,
+            uuids=uuids,
+            wsi_paths=wsi_paths,
+        )
+        return await self.search(
+            query=tile_uuid,
+            query_filter=query_filter,
+            max_hits=max_hits,
+            min_similarity=min_similarity,
+            group_by=group_by,
+            group_size=group_size,
+            offset=offset,
+        )
+
+    async def search(
+        self,
+        query: str | List[float],
+        query_filter: Filter | None = None,
+        max_hits: int = 100,
+        min_similarity: float | None = 0.75,
+        group_by: GROUP_BY_FIELDS | None = None,
+        group_size: int = 1,
+        offset: int = 0,
+    ) -> List[WSITilePayload]:
+        """Run a (grouped) query for a point ID of this collection, or a vector from any collection of the same space."""
+        if group_by is not None:
+            if offset:
+                raise ValueError("offset is not supported for grouped queries")
+            response = await self.qdrant_client.query_points_groups(
+                collection_name=self.collection_name,
+                group_by=group_by.value,
+                query=query,
+                query_filter=query_filter,
+                with_payload=True,
+                score_threshold=min_similarity,
+                limit=max_hits,
+                group_size=group_size,
+            )
+            return flatten_groups(response.groups)
+
+        response = await self.qdrant_client.query_points(
+            collection_name=self.collection_name,
+            query=query,
+            query_filter=query_filter,
+            with_payload=True,
+            score_threshold=min_similarity,
+            limit=max_hits,
+            offset=offset,
+        )
+        return to_tile_payloads(response.points)
+
+    async def iter_query(
+        self,
+        tile_uuid: str,
+        max_hits: int = 100,
+        min_similarity: float | None = 0.75,
+        offset: int = 0,
+        page_size: int = 1_000,
+        payload_fields: List[str] | None = None,
+        **filters: Any,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Page through the hits of a similarity query without materializing them all.
+
+        Returns an async iterator over pages of at most `page_size` hits, each hit
+        being the raw payload dict (only `payload_fields`, if given) plus its "score".
+        Each page is fetched when the previous one has been consumed, so at most one
+        page is held in memory. Qdrant has no cursor for similarity queries, so pages
+        are fetched by offset, and each query re-ranks the hits before its offset:
+        larger pages mean fewer of these re-ranks but more memory per page. The query
+        tile is looked up before this returns, so a bad `tile_uuid` fails here rather
+        than mid-iteration. `filters` are the filter arguments of `run_query`.
+        """
+        payload, _ = await self.get_tile(tile_uuid=tile_uuid)
+        query_filter = build_query_filter(payload=payload, **filters)
+
+        async def pages() -> AsyncIterator[List[Dict[str, Any]]]:
+            position, end = offset, offset + max_hits
+            while position < end:
+                limit = min(page_size, end - position)
+                response = await self.qdrant_client.query_points(
+                    collection_name=self.collection_name,
+                    query=tile_uuid,
+                    query_filter=query_filter,
+                    with_payload=payload_fields if payload_fields else True,
+                    score_threshold=min_similarity,
+                    limit=limit,
+                    offset=position,
+                )
+                yield [{**point.payload, "score": point.score} for point in response.points]
+                if len(response.points) < limit:
+                    break
+                position += limit
+
+        return pages()
+
+    async def get_tile(self, tile_uuid: str) -> Tuple[WSITilePayload, List[float]]:
+
+        tile = (await self.qdrant_client.retrieve(
+            collection_name=self.collection_name,
+            ids=[tile_uuid],
+            with_vectors=True
+        ))[0]
+
+        return WSITilePayload(**tile.payload), tile.vector
+
+    async def find_tile(self, tile_uuid: str) -> Tuple[WSITilePayload, List[float]] | None:
+        """Like `get_tile`, but None if the tile is not in this collection."""
+        tiles = await self.qdrant_client.retrieve(
+            collection_name=self.collection_name,
+            ids=[tile_uuid],
+            with_vectors=True
+        )
+        if not tiles:
+            return None
+        return WSITilePayload(**tiles[0].payload), tiles[0].vector
+
+    async def close(self) -> None:
+        await self.qdrant_client.close()
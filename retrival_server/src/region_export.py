@@ -0,0 +1,237 @@
+import io
+import os
+import csv
+import time
+import asyncio
+import logging
+import tarfile
+import zipfile
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Tuple
+
+from src.data_models import ARCHIVE_FORMATS, IMAGE_FORMATS, ExportRegion
+
+# Largest region side, in pixels of the level it is read at: a worker holds the
+# RGBA read (64 MiB at 4096 px), its RGB copy and the encoded image at once
+MAX_REGION_SIZE = 4096
+
+# (index in the request, x, y, size, level)
+RegionSpec = Tuple[int, int, int, int, int]
+# (index in the request, encoded image or None, error or None)
+RegionResult = Tuple[int, bytes | None, str | None]
+
+
+# ---------------------------------------------------------------------- #
+# Worker side (runs in the process pool)
+# ---------------------------------------------------------------------- #
+
+@lru_cache(maxsize=4)
+def _open_slide(wsi_path: str):
+    from openslide import OpenSlide
+    return OpenSlide(wsi_path)
+
+
+def read_regions(wsi_path: str, regions: List[RegionSpec], image_format: str) -> List[RegionResult]:
+    """Read and encode regions of one slide; a failing region is reported, not raised."""
+    try:
+        slide = _open_slide(wsi_path)
+    except Exception as e:
+        return [(index, None, f"Unable to open slide: {e}") for index, *_ in regions]
+
+    results = []
+    for index, x, y, size, level in regions:
+        try:
+            if not 0 <= level < slide.level_count:
+                raise ValueError(f"level {level} out of range (slide has {slide.level_count})")
+            level_size = max(int(round(size / slide.level_downsamples[level])), 1)
+            if level_size > MAX_REGION_SIZE:
+                raise ValueError(
+                    f"region is {level_size}px wide at level {level} (at most {MAX_REGION_SIZE}px): read it at a higher level"
+                )
+            image = slide.read_region((x, y), level, (level_size, level_size)).convert("RGB")
+
+            buffer = io.BytesIO()
+            if image_format == IMAGE_FORMATS.JPEG.value:
+                image.save(buffer, format="JPEG", quality=95)
+            else:
+                # Fast, still lossless: these are for analysis, not storage
+                image.save(buffer, format="PNG", compress_level=1)
+            results.append((index, buffer.getvalue(), None))
+        except Exception as e:
+            results.append((index, None, str(e)))
+    return results
+
+
+# ---------------------------------------------------------------------- #
+# Streaming archives
+# ---------------------------------------------------------------------- #
+
+class _ChunkBuffer:
+    """Write-only, non-seekable sink collecting what an archive writer produces until drained."""
+
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+class _ArchiveWriter:
+    """ZIP or tar written to a `_ChunkBuffer`, one member at a time."""
+
+    def __init__(self, archive_format: ARCHIVE_FORMATS) -> None:
+        self.buffer = _ChunkBuffer()
+        self.mtime = time.time()
+        if archive_format == ARCHIVE_FORMATS.TAR:
+            self.tar = tarfile.open(fileobj=self.buffer, mode="w|")
+            self.zip = None
+        else:
+            # Non-seekable output: zipfile writes data descriptors after each member.
+            # Images are already compressed, so members are stored.
+            self.zip = zipfile.ZipFile(self.buffer, mode="w", compression=zipfile.ZIP_STORED)
+            self.tar = None
+
+    def add(self, name: str, data: bytes) -> bytes:
+        if self.zip is not None:
+            info = zipfile.ZipInfo(name, date_time=time.localtime(self.mtime)[:6])
+            self.zip.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(self.mtime)
+            self.tar.addfile(info, io.BytesIO(data))
+        return self.buffer.drain()
+
+    def close(self) -> bytes:
+        (self.zip or self.tar).close()
+        return self.buffer.drain()
+
+
+def region_file_name(index: int, region: ExportRegion, image_format: IMAGE_FORMATS) -> str:
+    slide_name = os.path.splitext(os.path.basename(region.wsi_path))[0]
+    extension = "jpg" if image_format == IMAGE_FORMATS.JPEG else "png"
+    return f"{slide_name}/{index:06d}_x{region.x}_y{region.y}_s{region.size}_l{region.level}.{extension}"
+
+
+class RegionExporter:
+    """Reads many slide regions in a process pool and streams them back as an archive.
+
+    Regions are grouped by slide and split into chunks of `chunk_size`; each chunk is
+    one pool task, so a slide is opened once per worker rather than once per region
+    and several slides (or large slides) are read in parallel. At most `max_pending`
+    chunks are in flight and each finished chunk is written out immediately, so
+    memory stays bounded whatever the number of regions. Members are written in
+    completion order, followed by a `manifest.csv` listing every region with its
+    file name or error.
+    """
+
+    def __init__(self, max_workers: int = 4, chunk_size: int = 16, max_pending: int | None = None) -> None:
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending or 2 * max_workers
+        self.logger = logging.getLogger("RegionExporter")
+        self._pool: ProcessPoolExecutor | None = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned, not forked: the server process runs threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _chunks(self, regions: List[ExportRegion]) -> List[Tuple[str, List[RegionSpec]]]:
+        by_slide: Dict[str, List[RegionSpec]] = defaultdict(list)
+        for index, region in enumerate(regions):
+            by_slide[region.wsi_path].append((index, region.x, region.y, region.size, region.level))
+
+        chunks = []
+        for wsi_path, specs in by_slide.items():
+            # Read each slide roughly top-to-bottom
+            specs.sort(key=lambda spec: (spec[4], spec[2], spec[1]))
+            for start in range(0, len(specs), self.chunk_size):
+                chunks.append((wsi_path, specs[start:start + self.chunk_size]))
+        return chunks
+
+    async def stream_archive(
+        self,
+        regions: List[ExportRegion],
+        archive_format: ARCHIVE_FORMATS = ARCHIVE_FORMATS.ZIP,
+        image_format: IMAGE_FORMATS = IMAGE_FORMATS.PNG,
+    ) -> AsyncIterator[bytes]:
+        """Yield the bytes of an archive with one image per region, as regions complete."""
+        loop = asyncio.get_running_loop()
+        writer = _ArchiveWriter(archive_format)
+        chunks = iter(self._chunks(regions))
+        pending = set()
+        status: Dict[int, Tuple[str, str]] = {}
+        start = time.time()
+
+        def submit_next() -> bool:
+            chunk = next(chunks, None)
+            if chunk is None:
+                return False
+            wsi_path, specs = chunk
+            pending.add(loop.run_in_executor(self.pool, read_regions, wsi_path, specs, image_format.value))
+            return True
+
+        try:
+            while len(pending) < self.max_pending and submit_next():
+                pass
+
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    pending.discard(future)
+                    for index, data, error in future.result():
+                        if data is None:
+                            status[index] = ("", error)
+                            continue
+                        name = region_file_name(index, regions[index], image_format)
+                        status[index] = (name, "")
+                        yield writer.add(name, data)
+                    submit_next()
+
+            yield writer.add("manifest.csv", self._manifest(regions, status))
+            yield writer.close()
+
+            n_failed = sum(1 for _, error in status.values() if error)
+            self.logger.info(f"Exported {len(regions) - n_failed}/{len(regions)} regions in {time.time() - start:.1f}s")
+        except BrokenProcessPool:
+            # A worker died (e.g. a crashing slide reader): start a fresh pool next time
+            self.close()
+            raise
+        finally:
+            # Client went away (or an error): drop the work that has not started
+            for future in pending:
+                future.cancel()
+
+    @staticmethod
+    def _manifest(regions: List[ExportRegion], status: Dict[int, Tuple[str, str]]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["index", "file", "wsi_path", "x", "y", "size", "level", "uuid", "error"])
+        for index, region in enumerate(regions):
+            name, error = status.get(index, ("", "not read"))
+            writer.writerow([index, name, region.wsi_path, region.x, region.y, region.size, region.level, region.uuid or "", error])
+        return buffer.getvalue().encode()
@@ -0,0 +1,231 @@
+import os
+import csv
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Iterable, Iterator, Tuple
+
+from src.sqlite_utils import ThreadLocalSQLite
+
+INSERT_SAMPLE_SQL = "INSERT OR REPLACE INTO samples (sample_id, wsi_path, source_path) VALUES (?, ?, ?)"
+
+
+class SampleRegistry:
+    """SQLite-backed mapping of sample IDs to WSI paths.
+
+    Lookups go straight to an indexed table instead of an in-memory dict, so
+    startup cost and memory do not grow with the size of the cohort. Source
+    JSON/CSV files are only (re-)imported on the first lookup after they change;
+    a re-import replaces everything the file imported before, so IDs removed from
+    it stop resolving.
+    """
+
+    def __init__(
+        self,
+        db_dir_path: str,
+        source_paths: Iterable[str] = (),
+        stat_ttl: float = 30.0,
+        stat_cache_size: int = 4096,
+    ) -> None:
+        self.db_dir_path = os.path.expanduser(db_dir_path)
+        self.db_path = os.path.join(self.db_dir_path, "samples.db")
+        self.source_paths = list(source_paths)
+        self.stat_ttl = stat_ttl
+        self.stat_cache_size = stat_cache_size
+
+        os.makedirs(self.db_dir_path, exist_ok=True)
+        self.logger = logging.getLogger("SampleRegistry")
+
+        self._sources_lock = threading.Lock()
+        self._sources_checked = False
+        # existing path -> checked_at, least recently used first
+        self._stat_cache: OrderedDict[str, float] = OrderedDict()
+        self._stat_lock = threading.Lock()
+
+        self.pool = ThreadLocalSQLite(self.db_path)
+        self._init_db()
+
+    def _init_db(self) -> None:
+        """Ensure the registry tables and indexes exist."""
+        self.pool.connection().executescript("""
+        CREATE TABLE IF NOT EXISTS samples (
+            sample_id TEXT PRIMARY KEY,
+            wsi_path TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_samples_wsi_path ON samples (wsi_path);
+        CREATE TABLE IF NOT EXISTS sources (
+            source_path TEXT PRIMARY KEY,
+            mtime REAL NOT NULL
+        );
+        """)
+        # File each row was imported from (registries created before it have none)
+        conn = self.pool.connection()
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(samples)")]
+        if "source_path" not in columns:
+            conn.execute("ALTER TABLE samples ADD COLUMN source_path TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_samples_source_path ON samples (source_path)")
+
+    # ------------------------------------------------------------------ #
+    # Lookups
+    # ------------------------------------------------------------------ #
+
+    def path_exists(self, path: str) -> bool:
+        """`os.path.exists` with a short-lived, size-bounded cache of positive results.
+
+        Missing paths are checked again every time, so a file that was just
+        uploaded is found right away.
+        """
+        now = time.monotonic()
+        with self._stat_lock:
+            checked_at = self._stat_cache.get(path)
+            if checked_at is not None and now - checked_at < self.stat_ttl:
+                self._stat_cache.move_to_end(path)
+                return True
+
+        exists = os.path.exists(path)
+        with self._stat_lock:
+            if not exists:
+                self._stat_cache.pop(path, None)
+                return False
+            self._stat_cache[path] = now
+            self._stat_cache.move_to_end(path)
+            while len(self._stat_cache) > self.stat_cache_size:
+                self._stat_cache.popitem(last=False)
+        return True
+
+    def get_wsi_path(self, sample_id: str) -> str | None:
+        """Return the WSI path registered for `sample_id`, or None."""
+        self._load_sources()
+        row = self.pool.connection().execute(
+            "SELECT wsi_path FROM samples WHERE sample_id = ?", (sample_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def iter_wsi_paths(self, batch_size: int = 10_000) -> Iterator[str]:
+        """Stream every distinct registered WSI path, in sorted order."""
+        self._load_sources()
+        last_path = ""
+        while True:
+            rows = self.pool.connection().execute(
+                "SELECT DISTINCT wsi_path FROM samples WHERE wsi_path > ? ORDER BY wsi_path LIMIT ?",
+                (last_path, batch_size),
+            ).fetchall()
+            for row in rows:
+                yield row[0]
+            if len(rows) < batch_size:
+                return
+            last_path = rows[-1][0]
+
+    def resolve(self, sample_id: str) -> str | None:
+        """Resolve a sample ID to a WSI path.
+
+        Registered IDs win. Otherwise, if `sample_id` is itself an existing file
+        path it is returned as is (not registered: callers pass arbitrary IDs).
+        """
+        wsi_path = self.get_wsi_path(sample_id)
+        if wsi_path is not None:
+            return wsi_path
+
+        if self.path_exists(sample_id):
+            return sample_id
+
+        return None
+
+    # ------------------------------------------------------------------ #
+    # Writes / imports
+    # ------------------------------------------------------------------ #
+
+    def replace_source(self, source_path: str, items: Iterable[Tuple[str, str]], batch_size: int = 10_000) -> int:
+        """Replace the samples imported from `source_path` with `items`, (sample_id, wsi_path) pairs.
+
+        Runs as one transaction: lookups see either the old or the new rows of the
+        source, and IDs missing from `items` are gone afterwards. Rows are written
+        with `executemany` in batches, so `items` is consumed lazily.
+        """
+        source_path = os.path.abspath(source_path)
+        count = 0
+        with self.pool.transaction() as conn:
+            conn.execute("DELETE FROM samples WHERE source_path = ?", (source_path,))
+            batch = []
+            for sample_id, wsi_path in items:
+                batch.append((sample_id, wsi_path, source_path))
+                if len(batch) >= batch_size:
+                    conn.executemany(INSERT_SAMPLE_SQL, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                conn.executemany(INSERT_SAMPLE_SQL, batch)
+                count += len(batch)
+        return count
+
+    def import_json(self, json_path: str) -> int:
+        """Import a `{sample_id: wsi_path}` JSON file."""
+        with open(json_path, "r") as f:
+            mapping = json.load(f)
+        count = self.replace_source(json_path, ((str(k), str(v)) for k, v in mapping.items()))
+        self.logger.info(f"Imported {count} samples from {json_path}")
+        return count
+
+    def import_csv(
+        self,
+        csv_path: str,
+        sample_id_column: str = "sample_id",
+        wsi_path_column: str = "wsi_path",
+    ) -> int:
+        """Import sample ID / WSI path pairs from two columns of a CSV file."""
+        with open(csv_path, "r", newline="") as f:
+            reader = csv.DictReader(f)
+            count = self.replace_source(
+                csv_path, ((row[sample_id_column], row[wsi_path_column]) for row in reader)
+            )
+        self.logger.info(f"Imported {count} samples from {csv_path}")
+        return count
+
+    def import_file(self, source_path: str) -> int:
+        """Import a JSON or CSV file, chosen by extension."""
+        if source_path.lower().endswith(".csv"):
+            return self.import_csv(source_path)
+        return self.import_json(source_path)
+
+    def _load_sources(self) -> None:
+        """Import configured source files that are new or changed since the last import.
+
+        Runs once per process, on the first lookup.
+        """
+        if self._sources_checked:
+            return
+
+        with self._sources_lock:
+            if self._sources_checked:
+                return
+
+            for source_path in self.source_paths:
+                if not os.path.exists(source_path):
+                    self.logger.warning(f"Sample source file {source_path} does not exist")
+                    continue
+
+                mtime = os.path.getmtime(source_path)
+                row = self.pool.connection().execute(
+                    "SELECT mtime FROM sources WHERE source_path = ?", (source_path,)
+                ).fetchone()
+                if row is not None and row[0] >= mtime:
+                    continue
+
+                try:
+                    self.import_file(source_path)
+                except Exception as e:
+                    self.logger.error(f"Failed to import samples from {source_path}: {e}")
+                    continue
+
+                self.pool.connection().execute(
+                    "INSERT OR REPLACE INTO sources (source_path, mtime) VALUES (?, ?)",
+                    (source_path, mtime),
+                )
+
+            self._sources_checked = True
+
+    def close(self):
+        """Close the database connections."""
+        self.pool.close()
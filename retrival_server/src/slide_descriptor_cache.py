@@ -0,0 +1,135 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+from src.data_models import SlideDescriptor
+from src.sqlite_utils import ThreadLocalSQLite
+
+
+SELECT_DESCRIPTOR_SQL = "SELECT mtime, size, descriptor FROM slide_descriptors WHERE wsi_path = ?"
+UPSERT_DESCRIPTOR_SQL = """
+    INSERT INTO slide_descriptors (wsi_path, mtime, size, descriptor)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (wsi_path) DO UPDATE SET
+        mtime = excluded.mtime,
+        size = excluded.size,
+        descriptor = excluded.descriptor
+"""
+
+
+class SlideDescriptorCache:
+    """Persistent cache of slide geometry and properties keyed by path + mtime + size.
+
+    Lookups are served from an in-memory LRU, then from SQLite; the slide is only
+    opened with OpenSlide when neither has a descriptor for the file's current
+    mtime/size.
+    """
+
+    def __init__(
+        self,
+        db_dir_path: str,
+        tile_size: int = 256,
+        overlap: int = 0,
+        limit_bounds: bool = False,
+        memory_size: int = 4_096,
+    ) -> None:
+        self.db_dir_path = os.path.expanduser(db_dir_path)
+        self.db_path = os.path.join(self.db_dir_path, "slide_descriptors.db")
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.limit_bounds = limit_bounds
+        self.memory_size = memory_size
+
+        os.makedirs(self.db_dir_path, exist_ok=True)
+        self.logger = logging.getLogger("SlideDescriptorCache")
+
+        self._memory: OrderedDict[str, SlideDescriptor] = OrderedDict()
+        self._memory_lock = threading.Lock()
+
+        self.pool = ThreadLocalSQLite(self.db_path)
+        self.pool.connection().execute("""
+        CREATE TABLE IF NOT EXISTS slide_descriptors (
+            wsi_path TEXT PRIMARY KEY,
+            mtime REAL NOT NULL,
+            size INTEGER NOT NULL,
+            descriptor TEXT NOT NULL
+        )
+        """)
+
+    def get(self, wsi_path: str) -> SlideDescriptor:
+        """Return the descriptor of `wsi_path`, computing (and persisting) it on a miss.
+
+        Raises:
+            FileNotFoundError: If the slide does not exist.
+            openslide.OpenSlideError: If the slide cannot be read.
+        """
+        stat = os.stat(wsi_path)
+
+        with self._memory_lock:
+            descriptor = self._memory.get(wsi_path)
+            if descriptor is not None and self._is_current(descriptor, stat):
+                self._memory.move_to_end(wsi_path)
+                return descriptor
+
+        descriptor = self._load(wsi_path, stat)
+        if descriptor is None:
+            descriptor = self._compute(wsi_path, stat)
+            self.pool.connection().execute(
+                UPSERT_DESCRIPTOR_SQL,
+                (wsi_path, descriptor.mtime, descriptor.size, descriptor.model_dump_json()),
+            )
+
+        self._remember(descriptor)
+        return descriptor
+
+    @staticmethod
+    def _is_current(descriptor: SlideDescriptor, stat: os.stat_result) -> bool:
+        return descriptor.mtime == stat.st_mtime and descriptor.size == stat.st_size
+
+    def _remember(self, descriptor: SlideDescriptor) -> None:
+        with self._memory_lock:
+            self._memory[descriptor.wsi_path] = descriptor
+            self._memory.move_to_end(descriptor.wsi_path)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _load(self, wsi_path: str, stat: os.stat_result) -> SlideDescriptor | None:
+        row = self.pool.connection().execute(SELECT_DESCRIPTOR_SQL, (wsi_path,)).fetchone()
+        if row is None or row[0] != stat.st_mtime or row[1] != stat.st_size:
+            return None
+        return SlideDescriptor.model_validate_json(row[2])
+
+    def _compute(self, wsi_path: str, stat: os.stat_result) -> SlideDescriptor:
+        # Imported here so the cache (and the server using it) can start without openslide loaded
+        from openslide import OpenSlide, PROPERTY_NAME_VENDOR
+        from openslide.deepzoom import DeepZoomGenerator
+
+        self.logger.info(f"Computing slide descriptor for {wsi_path}")
+        with OpenSlide(wsi_path) as slide:
+            deepzoom = DeepZoomGenerator(
+                slide,
+                tile_size=self.tile_size,
+                overlap=self.overlap,
+                limit_bounds=self.limit_bounds,
+            )
+            properties = dict(slide.properties)
+            return SlideDescriptor(
+                wsi_path=wsi_path,
+                mtime=stat.st_mtime,
+                size=stat.st_size,
+                level_count=deepzoom.level_count,
+                level_dimensions=deepzoom.level_dimensions,
+                level_tiles=deepzoom.level_tiles,
+                slide_dimensions=slide.level_dimensions,
+                slide_downsamples=slide.level_downsamples,
+                mpp_x=float(properties.get("openslide.mpp-x", "0")),
+                mpp_y=float(properties.get("openslide.mpp-y", "0")),
+                vendor=properties.get(PROPERTY_NAME_VENDOR),
+                properties=properties,
+                associated_images=list(slide.associated_images.keys()),
+            )
+
+    def close(self):
+        """Close the database connections."""
+        self.pool.close()
@@ -0,0 +1,458 @@
+import uuid
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    Distance,
+    FieldCondition,
+    Filter,
+    HasIdCondition,
+    MatchAny,
+    MatchValue,
+    MultiVectorComparator,
+    MultiVectorConfig,
+    PointStruct,
+    QueryRequest,
+    VectorParams,
+)
+
+from src.data_models import SimilarSlide, WSISlidePayload, WSITilePayload, MAGNIFICATIONS
+
+# Named vectors of a slide point
+MEAN_VECTOR = "mean"
+CENTROIDS_VECTOR = "centroids"
+
+
+def slide_collection_name(collection_name: str) -> str:
+    """Name of the companion slide collection of a tile collection."""
+    return f"{collection_name}_slides"
+
+
+def slide_point_id(wsi_path: str, magnification: MAGNIFICATIONS) -> str:
+    """Deterministic point ID of a slide (one point per slide and magnification)."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{wsi_path}|{magnification.value}"))
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def weighted_kmeans(
+    points: np.ndarray,
+    weights: np.ndarray,
+    k: int,
+    n_iter: int = 20,
+    seed: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Spherical k-means on weighted points (k-means++ init, Lloyd iterations).
+
+    Returns (centroids, counts), where counts is the total weight assigned to each
+    centroid. Weights let previously computed centroids stand in for the tiles they
+    summarize, which is what makes incremental updates possible.
+    """
+    k = min(k, len(points))
+    rng = np.random.default_rng(seed)
+
+    # k-means++ seeding on cosine distance
+    centroids = [points[rng.choice(len(points), p=weights / weights.sum())]]
+    for _ in range(1, k):
+        distance = 1 - np.max(points @ np.stack(centroids).T, axis=1)
+        probs = np.maximum(distance, 0) * weights
+        if probs.sum() <= 0:
+            break
+        centroids.append(points[rng.choice(len(points), p=probs / probs.sum())])
+    centroids = np.stack(centroids)
+
+    for _ in range(n_iter):
+        assignment = np.argmax(points @ centroids.T, axis=1)
+        updated = np.zeros_like(centroids)
+        np.add.at(updated, assignment, points * weights[:, None])
+        empty = ~updated.any(axis=1)
+        updated[empty] = centroids[empty]
+        updated = normalize(updated)
+        if np.allclose(updated, centroids):
+            break
+        centroids = updated
+
+    assignment = np.argmax(points @ centroids.T, axis=1)
+    counts = np.bincount(assignment, weights=weights, minlength=len(centroids))
+    keep = counts > 0
+    return centroids[keep], counts[keep]
+
+
+class SlideEmbedding:
+    """Pooled representation of a slide's tile vectors: their mean and k-means centroids.
+
+    Tile vectors are L2-normalized before pooling (the tile collection uses cosine
+    similarity). `update` folds in a new batch of tiles without needing the tiles
+    already pooled: the mean is a running mean and the centroids are re-clustered
+    from the existing centroids (weighted by their tile counts) plus the centroids
+    of the new batch.
+    """
+
+    def __init__(
+        self,
+        mean: np.ndarray | None = None,
+        centroids: np.ndarray | None = None,
+        counts: np.ndarray | None = None,
+        n_tiles: int = 0,
+    ) -> None:
+        self.mean = mean
+        self.centroids = centroids
+        self.counts = counts
+        self.n_tiles = n_tiles
+
+    def update(self, vectors: np.ndarray, n_centroids: int = 8) -> None:
+        vectors = normalize(np.asarray(vectors, dtype=np.float32))
+        if len(vectors) == 0:
+            return
+
+        batch_mean = vectors.mean(axis=0)
+        batch_centroids, batch_counts = weighted_kmeans(vectors, np.ones(len(vectors)), n_centroids)
+
+        if self.n_tiles == 0:
+            self.mean = batch_mean
+            self.centroids, self.counts = batch_centroids, batch_counts
+        else:
+            total = self.n_tiles + len(vectors)
+            self.mean = (self.mean * self.n_tiles + batch_mean * len(vectors)) / total
+            self.centroids, self.counts = weighted_kmeans(
+                np.concatenate([self.centroids, batch_centroids]),
+                np.concatenate([self.counts, batch_counts]),
+                n_centroids,
+            )
+        self.n_tiles += len(vectors)
+
+
+class SlideVectorDB:
+    """Slide-level vectors in a companion collection (`<collection>_slides`) of a tile collection.
+
+    Each slide (per magnification) is one point with two named vectors: the mean of
+    its tile vectors, and its k-means centroids as a multivector compared with MaxSim.
+    Slides are written incrementally as tiles are ingested (`add_tiles`) or pooled
+    from the tiles already in the tile collection (`rebuild_slide`).
+    """
+
+    def __init__(
+        self,
+        qdrant_client: QdrantClient,
+        collection_name: str,
+        n_centroids: int = 8,
+    ) -> None:
+        self.qdrant_client = qdrant_client
+        self.tile_collection_name = collection_name
+        self.collection_name = slide_collection_name(collection_name)
+        self.n_centroids = n_centroids
+        self.logger = logging.getLogger("SlideVectorDB")
+
+        self._ensure_collection()
+
+    def _ensure_collection(self) -> None:
+        if self.qdrant_client.collection_exists(self.collection_name):
+            return
+
+        vector_size = self.qdrant_client.get_collection(self.tile_collection_name).config.params.vectors.size
+        self.qdrant_client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config={
+                MEAN_VECTOR: VectorParams(size=vector_size, distance=Distance.COSINE),
+                CENTROIDS_VECTOR: VectorParams(
+                    size=vector_size,
+                    distance=Distance.COSINE,
+                    multivector_config=MultiVectorConfig(comparator=MultiVectorComparator.MAX_SIM),
+                ),
+            },
+        )
+        print(f"Created slide collection {self.collection_name} ({vector_size} dims)")
+
+    # ------------------------------------------------------------------ #
+    # Writing
+    # ------------------------------------------------------------------ #
+
+    def get_slide(
+        self, wsi_path: str, magnification: MAGNIFICATIONS
+    ) -> Tuple[WSISlidePayload, SlideEmbedding] | None:
+        points = self.qdrant_client.retrieve(
+            collection_name=self.collection_name,
+            ids=[slide_point_id(wsi_path, magnification)],
+            with_vectors=True,
+        )
+        if not points:
+            return None
+
+        point = points[0]
+        payload = WSISlidePayload(**point.payload)
+        embedding = SlideEmbedding(
+            mean=np.asarray(point.vector[MEAN_VECTOR], dtype=np.float32) * payload.mean_norm,
+            centroids=np.asarray(point.vector[CENTROIDS_VECTOR], dtype=np.float32),
+            counts=np.asarray(payload.centroid_counts, dtype=np.float64),
+            n_tiles=payload.n_tiles,
+        )
+        return payload, embedding
+
+    def _upsert_slide(self, payload: WSISlidePayload, embedding: SlideEmbedding) -> None:
+        payload.n_tiles = embedding.n_tiles
+        payload.mean_norm = float(np.linalg.norm(embedding.mean))
+        payload.centroid_counts = embedding.counts.tolist()
+        self.qdrant_client.upsert(
+            collection_name=self.collection_name,
+            wait=True,
+            points=[
+                PointStruct(
+                    id=payload.uuid,
+                    vector={
+                        MEAN_VECTOR: embedding.mean.tolist(),
+                        CENTROIDS_VECTOR: embedding.centroids.tolist(),
+                    },
+                    payload=payload.model_dump(mode="json", exclude={"score"}),
+                )
+            ],
+        )
+
+    @staticmethod
+    def _new_slide(tile: WSITilePayload) -> WSISlidePayload:
+        """Empty slide payload described by one of its tiles."""
+        return WSISlidePayload(
+            uuid=slide_point_id(tile.wsi_path, tile.magnification),
+            patient_id=tile.patient_id,
+            wsi_path=tile.wsi_path,
+            dataset=tile.dataset,
+            magnification=tile.magnification,
+            stain=tile.stain,
+            n_tiles=0,
+            tags=tile.tags,
+        )
+
+    def _stored_tile_ids(self, wsi_path: str, magnification: MAGNIFICATIONS) -> Dict[Tuple[int, int], str]:
+        """Point ID of each tile position of a slide already in the tile collection."""
+        scroll_filter = Filter(
+            must=[
+                FieldCondition(key="wsi_path", match=MatchValue(value=wsi_path)),
+                FieldCondition(key="magnification", match=MatchValue(value=magnification.value)),
+            ]
+        )
+        stored = {}
+        next_page = None
+        while True:
+            points, next_page = self.qdrant_client.scroll(
+                collection_name=self.tile_collection_name,
+                scroll_filter=scroll_filter,
+                limit=10_000,
+                offset=next_page,
+                with_payload=["x", "y"],
+            )
+            for point in points:
+                stored[(point.payload["x"], point.payload["y"])] = str(point.id)
+            if next_page is None:
+                return stored
+
+    def add_tiles(
+        self,
+        tiles: List[WSITilePayload],
+        vectors: np.ndarray,
+        batch_size: int = 256,
+    ) -> WSISlidePayload:
+        """Store one slide's tiles in the tile collection and fold the new ones into its slide point.
+
+        Tiles are identified by their position: a tile whose (x, y) the slide already
+        has at this magnification replaces the stored point (keeping its ID) and is
+        not pooled again, so re-ingesting a slide does not count its tiles twice.
+        The pooled vectors are not corrected for replaced tiles whose vectors
+        changed; `rebuild_slide` recomputes them from scratch.
+        """
+        if len(tiles) != len(vectors):
+            raise ValueError(f"Got {len(tiles)} tiles but {len(vectors)} vectors")
+        if not tiles:
+            raise ValueError("No tiles to add")
+        wsi_path, magnification = tiles[0].wsi_path, tiles[0].magnification
+        if any(tile.wsi_path != wsi_path or tile.magnification != magnification for tile in tiles):
+            raise ValueError("All tiles must come from the same slide and magnification")
+
+        stored = self._stored_tile_ids(wsi_path, magnification)
+        # Last occurrence of a position wins within the batch as well
+        by_position = {(tile.x, tile.y): index for index, tile in enumerate(tiles)}
+        points, new = [], []
+        for (x, y), index in by_position.items():
+            tile = tiles[index]
+            if (x, y) in stored:
+                tile = tile.model_copy(update={"uuid": stored[(x, y)]})
+            else:
+                new.append(index)
+            points.append(
+                PointStruct(id=tile.uuid, vector=np.asarray(vectors[index]).tolist(), payload=tile.model_dump(mode="json", exclude={"score"}))
+            )
+
+        for start in range(0, len(points), batch_size):
+            self.qdrant_client.upsert(
+                collection_name=self.tile_collection_name,
+                wait=True,
+                points=points[start:start + batch_size],
+            )
+
+        existing = self.get_slide(wsi_path, magnification)
+        payload, embedding = existing if existing is not None else (self._new_slide(tiles[0]), SlideEmbedding())
+        if new:
+            embedding.update(np.asarray(vectors)[new], n_centroids=self.n_centroids)
+            self._upsert_slide(payload, embedding)
+        return payload
+
+    def iter_tile_vectors(
+        self, wsi_path: str, magnification: MAGNIFICATIONS
+    ) -> Iterable[Tuple[WSITilePayload, List[float]]]:
+        """All tiles of a slide at a magnification, with their vectors, from the tile collection."""
+        scroll_filter = Filter(
+            must=[
+                FieldCondition(key="wsi_path", match=MatchValue(value=wsi_path)),
+                FieldCondition(key="magnification", match=MatchValue(value=magnification.value)),
+            ]
+        )
+        next_page = None
+        while True:
+            points, next_page = self.qdrant_client.scroll(
+                collection_name=self.tile_collection_name,
+                scroll_filter=scroll_filter,
+                limit=1000,
+                offset=next_page,
+                with_vectors=True,
+            )
+            for point in points:
+                yield WSITilePayload(**point.payload), point.vector
+            if next_page is None:
+                break
+
+    def iter_tile_slides(self) -> Iterable[Tuple[str, MAGNIFICATIONS]]:
+        """Distinct (wsi_path, magnification) pairs in the tile collection, in scroll order."""
+        seen = set()
+        next_page = None
+        while True:
+            points, next_page = self.qdrant_client.scroll(
+                collection_name=self.tile_collection_name,
+                limit=10_000,
+                offset=next_page,
+                with_payload=["wsi_path", "magnification"],
+            )
+            for point in points:
+                key = (point.payload["wsi_path"], MAGNIFICATIONS(point.payload["magnification"]))
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+            if next_page is None:
+                break
+
+    def rebuild_slide(self, wsi_path: str, magnification: MAGNIFICATIONS) -> WSISlidePayload | None:
+        """Pool a slide's vectors from scratch out of the tile collection. None if it has no tiles."""
+        tiles = list(self.iter_tile_vectors(wsi_path, magnification))
+        if not tiles:
+            return None
+
+        payload, embedding = self._new_slide(tiles[0][0]), SlideEmbedding()
+        embedding.update(np.asarray([vector for _, vector in tiles], dtype=np.float32), n_centroids=self.n_centroids)
+        self._upsert_slide(payload, embedding)
+        return payload
+
+    # ------------------------------------------------------------------ #
+    # Querying
+    # ------------------------------------------------------------------ #
+
+    def query_similar_slides(
+        self,
+        wsi_path: str,
+        magnification: MAGNIFICATIONS,
+        max_hits: int = 10,
+        use_centroids: bool = True,
+        same_patient: bool | None = None,
+        wsi_paths: List[str] | None = None,
+        tiles_per_slide: int = 3,
+    ) -> List[SimilarSlide]:
+        """Rank other slides by similarity to `wsi_path`, each with its best-matching tiles.
+
+        Slides are compared by MaxSim over their centroids (or by their mean vectors
+        with `use_centroids=False`); scores are averaged over the query centroids so
+        they stay in [-1, 1]. A query slide missing from the slide collection is
+        pooled from its tiles first.
+        """
+        existing = self.get_slide(wsi_path, magnification)
+        if existing is None:
+            if self.rebuild_slide(wsi_path, magnification) is None:
+                raise ValueError(f"No tiles at {magnification.value} for {wsi_path}")
+            existing = self.get_slide(wsi_path, magnification)
+        query_payload, query_embedding = existing
+
+        must_filters = [FieldCondition(key="magnification", match=MatchValue(value=magnification.value))]
+        must_not_filters = [HasIdCondition(has_id=[query_payload.uuid])]
+        if same_patient:
+            must_filters.append(FieldCondition(key="patient_id", match=MatchValue(value=query_payload.patient_id)))
+        elif same_patient is False:
+            must_not_filters.append(FieldCondition(key="patient_id", match=MatchValue(value=query_payload.patient_id)))
+        if wsi_paths is not None:
+            must_filters.append(FieldCondition(key="wsi_path", match=MatchAny(any=list(wsi_paths))))
+
+        if use_centroids:
+            query, using, scale = query_embedding.centroids.tolist(), CENTROIDS_VECTOR, len(query_embedding.centroids)
+        else:
+            query, using, scale = query_embedding.mean.tolist(), MEAN_VECTOR, 1
+
+        points = self.qdrant_client.query_points(
+            collection_name=self.collection_name,
+            query=query,
+            using=using,
+            query_filter=Filter(must=must_filters, must_not=must_not_filters),
+            with_payload=True,
+            limit=max_hits,
+        ).points
+
+        slides = []
+        for point in points:
+            slide = WSISlidePayload(**point.payload)
+            slide.score = point.score / scale
+            slides.append(slide)
+
+        tiles = self._best_matching_tiles(slides, query_embedding.centroids, tiles_per_slide)
+        return [SimilarSlide(slide=slide, tiles=tiles[slide.wsi_path]) for slide in slides]
+
+    def _best_matching_tiles(
+        self,
+        slides: List[WSISlidePayload],
+        query_vectors: np.ndarray,
+        tiles_per_slide: int,
+    ) -> Dict[str, List[WSITilePayload]]:
+        """Top tiles of each slide against any of the query vectors, in one batched request."""
+        if not slides or tiles_per_slide <= 0:
+            return defaultdict(list)
+
+        best: Dict[str, Dict[str, WSITilePayload]] = defaultdict(dict)
+
+        requests, request_slides = [], []
+        for slide in slides:
+            tile_filter = Filter(
+                must=[
+                    FieldCondition(key="wsi_path", match=MatchValue(value=slide.wsi_path)),
+                    FieldCondition(key="magnification", match=MatchValue(value=slide.magnification.value)),
+                ]
+            )
+            for vector in query_vectors:
+                requests.append(
+                    QueryRequest(query=vector.tolist(), filter=tile_filter, limit=tiles_per_slide, with_payload=True)
+                )
+                request_slides.append(slide.wsi_path)
+
+        responses = self.qdrant_client.query_batch_points(
+            collection_name=self.tile_collection_name,
+            requests=requests,
+        )
+        for wsi_path, response in zip(request_slides, responses):
+            for point in response.points:
+                tile = WSITilePayload(**point.payload)
+                tile.score = point.score
+                current = best[wsi_path].get(tile.uuid)
+                if current is None or current.score < tile.score:
+                    best[wsi_path][tile.uuid] = tile
+
+        return defaultdict(list, {
+            wsi_path: sorted(tiles.values(), key=lambda tile: tile.score, reverse=True)[:tiles_per_slide]
+            for wsi_path, tiles in best.items()
+        })
@@ -0,0 +1,84 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+# Applied to every new connection. WAL lets readers proceed while a writer commits,
+# and synchronous=NORMAL is durable under WAL except for power loss on the last commit.
+DEFAULT_PRAGMAS: Dict[str, str | int] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64_000,  # negative => KiB, i.e. ~64MB page cache per connection
+    "temp_store": "MEMORY",
+    "mmap_size": 268_435_456,
+    "busy_timeout": 5_000,  # ms to wait on a locked database before raising
+}
+
+
+class ThreadLocalSQLite:
+    """Hands out one sqlite3 connection per thread for a single database file.
+
+    sqlite3 connections (and their statement caches) are not safe to share between
+    threads, so each FastAPI worker thread gets its own, opened lazily and reused.
+    Statements passed as constant SQL strings are prepared once per connection and
+    served from sqlite3's statement cache afterwards.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        pragmas: Dict[str, str | int] | None = None,
+        cached_statements: int = 256,
+    ) -> None:
+        self.db_path = db_path
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.cached_statements = cached_statements
+
+        self._local = threading.local()
+        self._all_lock = threading.Lock()
+        self._all: List[sqlite3.Connection] = []
+
+    def connection(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                check_same_thread=False,
+                isolation_level=None,  # autocommit; multi-statement writes use transaction()
+                cached_statements=self.cached_statements,
+            )
+            for key, value in self.pragmas.items():
+                conn.execute(f"PRAGMA {key}={value}")
+            self._local.conn = conn
+            with self._all_lock:
+                self._all.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run a block in a single write transaction on the calling thread's connection.
+
+        `BEGIN IMMEDIATE` takes the write lock up front so concurrent writers wait on
+        `busy_timeout` instead of failing mid-transaction on lock upgrade.
+        """
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+
+    def close(self) -> None:
+        """Close every connection opened through this pool."""
+        with self._all_lock:
+            for conn in self._all:
+                try:
+                    conn.close()
+                except sqlite3.ProgrammingError:
+                    pass
+            self._all.clear()
+        self._local = threading.local()
@@ -0,0 +1,76 @@
+import io
+import os
+import hashlib
+import tempfile
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable
+
+
+class ThumbnailCache:
+    """Slide thumbnails rendered once and kept as JPEG files on disk.
+
+    Thumbnails are built with `OpenSlide.get_thumbnail`, which reads from the lowest
+    resolution pyramid level, and cached under a name derived from the slide path,
+    mtime, size and thumbnail size, so a changed slide gets a fresh thumbnail.
+    """
+
+    def __init__(self, cache_dir: str, quality: int = 85, max_workers: int = 8) -> None:
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.quality = quality
+        self.max_workers = max_workers
+        self.logger = logging.getLogger("ThumbnailCache")
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def cache_path(self, wsi_path: str, size: int) -> str:
+        """Location of the cached thumbnail for the slide's current mtime/size."""
+        stat = os.stat(wsi_path)
+        key = f"{wsi_path}|{stat.st_mtime}|{stat.st_size}|{size}"
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.jpg")
+
+    def get(self, wsi_path: str, size: int = 256) -> bytes:
+        """Return the JPEG thumbnail of `wsi_path` (longest side <= `size`), rendering it on a miss."""
+        path = self.cache_path(wsi_path, size)
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+
+        data = render_thumbnail(wsi_path, size, self.quality)
+
+        # Write atomically so concurrent readers never see a partial file, under a
+        # unique temp name since several threads may render the same thumbnail
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return data
+
+    def get_many(self, wsi_paths: Iterable[str], size: int = 256) -> Dict[str, bytes | None]:
+        """Thumbnails for many slides, rendered in parallel; unreadable slides map to None."""
+        def safe_get(wsi_path: str) -> bytes | None:
+            try:
+                return self.get(wsi_path, size)
+            except Exception as e:
+                self.logger.warning(f"Unable to render thumbnail for {wsi_path}: {e}")
+                return None
+
+        wsi_paths = list(dict.fromkeys(wsi_paths))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(wsi_paths, executor.map(safe_get, wsi_paths)))
+
+
+def render_thumbnail(wsi_path: str, size: int = 256, quality: int = 85) -> bytes:
+    """Render a JPEG thumbnail of a slide whose longest side is at most `size`."""
+    from openslide import OpenSlide
+
+    with OpenSlide(wsi_path) as slide:
+        thumbnail = slide.get_thumbnail((size, size)).convert("RGB")
+
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
@@ -0,0 +1,161 @@
+import math
+import time
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from src.data_models import WSITilePayload, MAGNIFICATIONS
+
+
+class _MagnificationGrid:
+    """Uniform grid over the tiles of one magnification (level-0 coordinates)."""
+
+    def __init__(self, indices: np.ndarray, xs: np.ndarray, ys: np.ndarray, sizes: np.ndarray, cell_size: int) -> None:
+        self.indices = indices
+        self.x0, self.y0 = xs, ys
+        self.x1, self.y1 = xs + sizes, ys + sizes
+        self.cell_size = cell_size
+
+        # Register every tile in each cell it overlaps (tiles are at most one cell
+        # wide, so that is at most 4 cells)
+        cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        col0, col1 = self.x0 // cell_size, (self.x1 - 1) // cell_size
+        row0, row1 = self.y0 // cell_size, (self.y1 - 1) // cell_size
+        for i in range(len(indices)):
+            for row in range(row0[i], row1[i] + 1):
+                for col in range(col0[i], col1[i] + 1):
+                    cells[(int(col), int(row))].append(i)
+        self.cells = {cell: np.asarray(members, dtype=np.int64) for cell, members in cells.items()}
+        # Extent of the occupied cells, to clamp queries to
+        self.min_col = min(col for col, _ in self.cells)
+        self.max_col = max(col for col, _ in self.cells)
+        self.min_row = min(row for _, row in self.cells)
+        self.max_row = max(row for _, row in self.cells)
+
+    def query(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """Indices (into the slide's tile list) of tiles intersecting [x0, x1) x [y0, y1)."""
+        if not all(math.isfinite(value) for value in (x0, y0, x1, y1)):
+            raise ValueError("Query box coordinates must be finite")
+        col0 = max(int(x0 // self.cell_size), self.min_col)
+        col1 = min(int((x1 - 1) // self.cell_size), self.max_col)
+        row0 = max(int(y0 // self.cell_size), self.min_row)
+        row1 = min(int((y1 - 1) // self.cell_size), self.max_row)
+        if col0 > col1 or row0 > row1:
+            return np.zeros(0, dtype=np.int64)
+
+        if (col1 - col0 + 1) * (row1 - row0 + 1) > len(self.cells):
+            # Box larger than the occupied area: walking the cells is cheaper
+            candidates = [
+                members for (col, row), members in self.cells.items()
+                if col0 <= col <= col1 and row0 <= row <= row1
+            ]
+        else:
+            candidates = [
+                self.cells[(col, row)]
+                for row in range(row0, row1 + 1)
+                for col in range(col0, col1 + 1)
+                if (col, row) in self.cells
+            ]
+        if not candidates:
+            return np.zeros(0, dtype=np.int64)
+
+        candidates = np.unique(np.concatenate(candidates))
+        hit = (
+            (self.x0[candidates] < x1) & (self.x1[candidates] > x0)
+            & (self.y0[candidates] < y1) & (self.y1[candidates] > y0)
+        )
+        return self.indices[candidates[hit]]
+
+
+class TileGridIndex:
+    """Spatial index over a slide's tiles, one uniform grid per magnification.
+
+    Built once when a slide's tiles are loaded; `query` returns the tiles whose
+    (x, y, size) box intersects a level-0 bounding box, touching only the grid cells
+    the box overlaps, so the cost follows the viewport rather than the slide.
+    """
+
+    def __init__(self, tiles: List[WSITilePayload], tiles_per_cell: int = 8) -> None:
+        self.tiles = tiles
+        self.grids: Dict[MAGNIFICATIONS, _MagnificationGrid] = {}
+
+        by_magnification: Dict[MAGNIFICATIONS, List[int]] = defaultdict(list)
+        for i, tile in enumerate(tiles):
+            by_magnification[tile.magnification].append(i)
+
+        for magnification, members in by_magnification.items():
+            indices = np.asarray(members, dtype=np.int64)
+            xs = np.asarray([tiles[i].x for i in members], dtype=np.int64)
+            ys = np.asarray([tiles[i].y for i in members], dtype=np.int64)
+            sizes = np.asarray([tiles[i].size for i in members], dtype=np.int64)
+            # Cells `tiles_per_cell` tiles wide: few cells per viewport, few tiles per cell
+            cell_size = max(int(sizes.max()) * tiles_per_cell, 1)
+            self.grids[magnification] = _MagnificationGrid(indices, xs, ys, sizes, cell_size)
+
+    def query(
+        self,
+        x0: float,
+        y0: float,
+        x1: float,
+        y1: float,
+        magnification: MAGNIFICATIONS | None = None,
+    ) -> List[WSITilePayload]:
+        """Tiles intersecting the level-0 box [x0, x1) x [y0, y1), optionally of one magnification."""
+        if magnification is not None:
+            grids = [self.grids[magnification]] if magnification in self.grids else []
+        else:
+            grids = list(self.grids.values())
+
+        indices = [grid.query(x0, y0, x1, y1) for grid in grids]
+        if not indices:
+            return []
+        return [self.tiles[i] for i in np.sort(np.concatenate(indices))]
+
+
+class TileIndexCache:
+    """Tile indexes of the most recently viewed slides, rebuilt when their tiles change.
+
+    Tiles are ingested by other processes, so a cached index is trusted for `ttl`
+    seconds; after that the slide's tiles are counted again (`count_tiles`, cheap
+    next to loading them) and the index is rebuilt from `load_tiles` only if the
+    count changed.
+    """
+
+    def __init__(
+        self,
+        load_tiles: Callable[[str], List[WSITilePayload]],
+        count_tiles: Callable[[str], int],
+        ttl: float = 30.0,
+        max_slides: int = 8,
+    ) -> None:
+        self.load_tiles = load_tiles
+        self.count_tiles = count_tiles
+        self.ttl = ttl
+        self.max_slides = max_slides
+
+        self._lock = threading.Lock()
+        # wsi_path -> (checked_at, index), least recently used first
+        self._indexes: OrderedDict[str, Tuple[float, TileGridIndex]] = OrderedDict()
+
+    def get(self, wsi_path: str) -> TileGridIndex:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._indexes.get(wsi_path)
+            if cached is not None:
+                self._indexes.move_to_end(wsi_path)
+                if now - cached[0] < self.ttl:
+                    return cached[1]
+
+        if cached is not None and self.count_tiles(wsi_path) == len(cached[1].tiles):
+            index = cached[1]
+        else:
+            index = TileGridIndex(self.load_tiles(wsi_path))
+
+        with self._lock:
+            self._indexes[wsi_path] = (now, index)
+            self._indexes.move_to_end(wsi_path)
+            while len(self._indexes) > self.max_slides:
+                self._indexes.popitem(last=False)
+        return index
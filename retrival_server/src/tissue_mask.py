@@ -0,0 +1,174 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Set
+
+import numpy as np
+
+
+class TissueMask:
+    """Low-resolution boolean tissue map of a slide, queried in level-0 coordinates."""
+
+    def __init__(self, mask: np.ndarray, slide_width: int, slide_height: int) -> None:
+        self.mask = mask
+        self.slide_width = slide_width
+        self.slide_height = slide_height
+        self.scale_x = mask.shape[1] / slide_width
+        self.scale_y = mask.shape[0] / slide_height
+
+    def has_tissue(self, x0: float, y0: float, x1: float, y1: float) -> bool:
+        """Whether any mask pixel overlapping the level-0 box [x0, x1) x [y0, y1) is tissue."""
+        # floor/ceil so partially covered mask pixels count
+        col0 = max(int(x0 * self.scale_x), 0)
+        row0 = max(int(y0 * self.scale_y), 0)
+        col1 = min(int(np.ceil(x1 * self.scale_x)), self.mask.shape[1])
+        row1 = min(int(np.ceil(y1 * self.scale_y)), self.mask.shape[0])
+        if col0 >= col1 or row0 >= row1:
+            return False
+        return bool(self.mask[row0:row1, col0:col1].any())
+
+
+def compute_tissue_mask(
+    wsi_path: str,
+    max_dim: int = 1024,
+    saturation_threshold: float = 0.05,
+    brightness_threshold: int = 220,
+    dilation: int = 2,
+) -> TissueMask:
+    """Compute a tissue mask from a low-resolution rendering of the slide.
+
+    A pixel is tissue if it is coloured (HSV saturation above the threshold) or dark
+    (grayscale below the threshold). The mask is dilated by a few pixels so tile
+    borders touching tissue are never classified as glass; erring towards tissue
+    only costs a normal tile render.
+    """
+    from openslide import OpenSlide
+
+    with OpenSlide(wsi_path) as slide:
+        slide_width, slide_height = slide.dimensions
+        image = np.asarray(slide.get_thumbnail((max_dim, max_dim)).convert("RGB"), dtype=np.float32)
+
+    channel_max = image.max(axis=2)
+    channel_min = image.min(axis=2)
+    saturation = (channel_max - channel_min) / np.maximum(channel_max, 1.0)
+    gray = image.mean(axis=2)
+
+    mask = (saturation > saturation_threshold) | (gray < brightness_threshold)
+
+    for _ in range(dilation):
+        grown = mask.copy()
+        grown[1:, :] |= mask[:-1, :]
+        grown[:-1, :] |= mask[1:, :]
+        grown[:, 1:] |= mask[:, :-1]
+        grown[:, :-1] |= mask[:, 1:]
+        mask = grown
+
+    return TissueMask(mask, slide_width, slide_height)
+
+
+class TissueMaskCache:
+    """Per-slide tissue masks, computed once in the background and cached on disk.
+
+    `get` never blocks on computation: a slide whose mask is not ready yet returns
+    None (callers then render normally) and its mask is computed in a worker thread.
+    A slide whose mask could not be computed is retried after `retry_after` seconds
+    (a changed slide file has a new cache key and is retried right away).
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_dim: int = 1024,
+        memory_size: int = 64,
+        max_workers: int = 2,
+        retry_after: float = 300.0,
+    ) -> None:
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_dim = max_dim
+        self.memory_size = memory_size
+        self.retry_after = retry_after
+        self.logger = logging.getLogger("TissueMaskCache")
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, TissueMask] = OrderedDict()
+        self._pending: Set[str] = set()
+        # cache path -> when computing it failed
+        self._failed: Dict[str, float] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tissue-mask")
+
+    def _cache_path(self, wsi_path: str, stat: os.stat_result) -> str:
+        key = f"{wsi_path}|{stat.st_mtime}|{stat.st_size}|{self.max_dim}"
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".npz")
+
+    def get(self, wsi_path: str) -> TissueMask | None:
+        """Return the slide's mask if available, otherwise schedule it and return None."""
+        try:
+            stat = os.stat(wsi_path)
+        except OSError:
+            return None
+        path = self._cache_path(wsi_path, stat)
+
+        with self._lock:
+            mask = self._memory.get(path)
+            if mask is not None:
+                self._memory.move_to_end(path)
+                return mask
+            if path in self._pending:
+                return None
+            failed_at = self._failed.get(path)
+            if failed_at is not None:
+                if time.monotonic() - failed_at < self.retry_after:
+                    return None
+                del self._failed[path]
+
+        if os.path.exists(path):
+            try:
+                with np.load(path) as data:
+                    mask = TissueMask(data["mask"], int(data["width"]), int(data["height"]))
+                self._remember(path, mask)
+                return mask
+            except Exception as e:
+                self.logger.warning(f"Discarding unreadable tissue mask {path}: {e}")
+
+        with self._lock:
+            if path not in self._pending:
+                self._pending.add(path)
+                self._executor.submit(self._build, wsi_path, path)
+        return None
+
+    def _build(self, wsi_path: str, path: str) -> None:
+        try:
+            mask = compute_tissue_mask(wsi_path, max_dim=self.max_dim)
+            tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez_compressed(tmp_path, mask=mask.mask, width=mask.slide_width, height=mask.slide_height)
+            os.replace(tmp_path, path)
+            self._remember(path, mask)
+            self.logger.info(f"Computed tissue mask for {wsi_path} ({mask.mask.mean():.0%} tissue)")
+        except Exception as e:
+            self.logger.warning(f"Unable to compute tissue mask for {wsi_path}: {e}")
+            with self._lock:
+                now = time.monotonic()
+                # Forget failures that are due for a retry anyway, so this stays small
+                for failed_path, failed_at in list(self._failed.items()):
+                    if now - failed_at >= self.retry_after:
+                        del self._failed[failed_path]
+                self._failed[path] = now
+        finally:
+            with self._lock:
+                self._pending.discard(path)
+
+    def _remember(self, path: str, mask: TissueMask) -> None:
+        with self._lock:
+            self._memory[path] = mask
+            self._memory.move_to_end(path)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
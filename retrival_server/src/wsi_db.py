@@ -3,18 +3,40 @@ import sys
 import logging
 import sqlite3
 from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
 
 from src.data_models import WSI_ENTRY
+from src.sqlite_utils import ThreadLocalSQLite
 
 # Set the root directory dynamically
 ROOT_DIR = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(ROOT_DIR))
 
+
+SELECT_WSI_SQL = "SELECT wsi_path, note, labels FROM wsi WHERE wsi_path = ?"
+DELETE_WSI_SQL = "DELETE FROM wsi WHERE wsi_path = ?"
+UPSERT_WSI_SQL = """
+    INSERT INTO wsi (wsi_path, note, labels)
+    VALUES (?, ?, ?)
+    ON CONFLICT (wsi_path) DO UPDATE SET
+        note = excluded.note,
+        labels = excluded.labels
+"""
+EXPORT_WSI_SQL = "SELECT wsi_path, note, labels FROM wsi WHERE wsi_path > ? ORDER BY wsi_path LIMIT ?"
+DELETE_LABELS_SQL = "DELETE FROM wsi_labels WHERE wsi_path = ?"
+INSERT_LABEL_SQL = "INSERT OR IGNORE INTO wsi_labels (wsi_path, label) VALUES (?, ?)"
+DELETE_NOTE_FTS_SQL = "DELETE FROM wsi_notes_fts WHERE wsi_path = ?"
+INSERT_NOTE_FTS_SQL = "INSERT INTO wsi_notes_fts (wsi_path, note) VALUES (?, ?)"
+
+# Bumped whenever _init_db needs to migrate/backfill existing databases
+SCHEMA_VERSION = 1
+
+
 class WSI_DB:
     def __init__(self, db_dir_path: str) -> None:
         """Initialize the WSI_DB class with SQLite."""
         # Database directory
-        self.db_dir_path = db_dir_path
+        self.db_dir_path = os.path.expanduser(db_dir_path)
         self.db_path = os.path.join(self.db_dir_path, "wsi.db")
         self.log_path = os.path.join(self.db_dir_path, "wsi_db.log")
 
@@ -25,9 +47,8 @@ class WSI_DB:
         self._init_logger()
         self.logger.info("Initializing WSI_DB instance")
 
-        # Connect to database
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        self.cursor = self.conn.cursor()
+        # Per-thread connections (WAL mode) so concurrent requests never share a cursor
+        self.pool = ThreadLocalSQLite(self.db_path)
 
         # Initialize database
         self._init_db()
@@ -37,84 +58,298 @@ class WSI_DB:
         """Initialize the logger."""
         self.logger = logging.getLogger("WSI_DB")
         self.logger.setLevel(logging.INFO)
-        
+
+        # Avoid stacking file handlers when several instances are created in one process
+        if any(
+            isinstance(h, logging.FileHandler) and h.baseFilename == os.path.abspath(self.log_path)
+            for h in self.logger.handlers
+        ):
+            return
+
         file_handler = logging.FileHandler(self.log_path)
         file_handler.setLevel(logging.INFO)
-        
+
         formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
         file_handler.setFormatter(formatter)
-        
+
         self.logger.addHandler(file_handler)
 
     def _init_db(self) -> None:
-        """Ensure the WSI database table exists."""
-        self.cursor.execute("""
+        """Ensure the WSI tables exist and the label/note indexes are populated.
+
+        `wsi.labels` stays the source of truth for reads of a single entry; the
+        normalized `wsi_labels` table and the `wsi_notes_fts` full-text index are
+        kept in sync on every write and serve the search queries.
+        """
+        conn = self.pool.connection()
+        conn.executescript("""
         CREATE TABLE IF NOT EXISTS wsi (
             wsi_path TEXT PRIMARY KEY,
             note TEXT,
             labels TEXT
-        )
+        );
+        CREATE TABLE IF NOT EXISTS wsi_labels (
+            wsi_path TEXT NOT NULL,
+            label TEXT NOT NULL COLLATE NOCASE,
+            PRIMARY KEY (wsi_path, label)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_wsi_labels_label ON wsi_labels (label, wsi_path);
         """)
-        self.conn.commit()
+
+        # FTS5 is compiled into practically every sqlite build, but fall back to LIKE if not
+        try:
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS wsi_notes_fts USING fts5(wsi_path UNINDEXED, note)"
+            )
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            self.logger.warning(f"FTS5 unavailable, note search falls back to LIKE: {e}")
+            self.fts_enabled = False
+
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            self._backfill_indexes()
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
         self.logger.info("WSI table checked/created")
 
+    def _backfill_indexes(self) -> None:
+        """Populate the label table and note index from existing `wsi` rows."""
+        with self.pool.transaction() as conn:
+            rows = conn.execute("SELECT wsi_path, note, labels FROM wsi").fetchall()
+            conn.execute("DELETE FROM wsi_labels")
+            conn.executemany(INSERT_LABEL_SQL, [
+                (wsi_path, label)
+                for wsi_path, _, labels in rows if labels
+                for label in labels.split(", ")
+            ])
+            if self.fts_enabled:
+                conn.execute("DELETE FROM wsi_notes_fts")
+                conn.executemany(INSERT_NOTE_FTS_SQL, [
+                    (wsi_path, note) for wsi_path, note, _ in rows if note
+                ])
+        self.logger.info("Backfilled label/note indexes for %d WSI entries", len(rows))
+
+    @staticmethod
+    def _row_to_entry(row) -> WSI_ENTRY:
+        return WSI_ENTRY(
+            wsi_path=row[0],
+            note=row[1] if row[1] is not None else None,
+            labels=row[2].split(", ") if row[2] else []
+        )
+
     def get_wsi(self, wsi_path: str) -> WSI_ENTRY:
         """Retrieve an entry from the WSI database."""
-        self.cursor.execute("SELECT * FROM wsi WHERE wsi_path = ?", (wsi_path,))
-        row = self.cursor.fetchone()
+        row = self.pool.connection().execute(SELECT_WSI_SQL, (wsi_path,)).fetchone()
 
+        # Read path: debug level with lazy formatting so it costs nothing when disabled
         if row:
-            self.logger.info(f"Fetching WSI entry for path: {wsi_path}")
-            return WSI_ENTRY(
-                wsi_path=row[0],
-                note=row[1] if row[1] is not None else None,
-                labels=row[2].split(", ") if row[2] else []
-            )
+            self.logger.debug("Fetching WSI entry for path: %s", wsi_path)
+            return self._row_to_entry(row)
 
-        self.logger.info(f"WSI path {wsi_path} not found in database, returning new entry")
+        self.logger.debug("WSI path %s not found in database, returning new entry", wsi_path)
         return WSI_ENTRY(wsi_path=wsi_path)
-    
+
 
     def update_wsi(self, wsi_entry: WSI_ENTRY) -> bool:
         """Update, insert, or delete a WSI entry in the database."""
         try:
-            self.cursor.execute("SELECT 1 FROM wsi WHERE wsi_path = ?", (wsi_entry.wsi_path,))
-            exists = self.cursor.fetchone()
-
-            # If note is None and labels is an empty list, delete the entry
-            if wsi_entry.note is None and not wsi_entry.labels:
-                if exists:
-                    self.cursor.execute("DELETE FROM wsi WHERE wsi_path = ?", (wsi_entry.wsi_path,))
-                    self.logger.info(f"Deleted WSI entry: {wsi_entry.wsi_path}")
-                    self.conn.commit()
-                return True  # Successful deletion
-
-            labels_str = ", ".join(wsi_entry.labels)  # Convert list to comma-separated string
-
-            if exists:
-                # Update existing entry
-                self.cursor.execute("""
-                    UPDATE wsi
-                    SET note = ?, labels = ?
-                    WHERE wsi_path = ?
-                """, (wsi_entry.note, labels_str, wsi_entry.wsi_path))
-                self.logger.info(f"Updated existing WSI entry: {wsi_entry.wsi_path}")
-            else:
-                # Insert new entry
-                self.cursor.execute("""
-                    INSERT INTO wsi (wsi_path, note, labels)
-                    VALUES (?, ?, ?)
-                """, (wsi_entry.wsi_path, wsi_entry.note, labels_str))
-                self.logger.info(f"Inserted new WSI entry: {wsi_entry.wsi_path}")
-
-            self.conn.commit()
+            # If note is None and labels is an empty list, the entry is deleted
+            self._write_batch([wsi_entry])
+            self.logger.info("Updated WSI entry: %s", wsi_entry.wsi_path)
             return True
         except Exception as e:
             self.logger.error(f"Error updating WSI entry {wsi_entry.wsi_path}: {e}")
             return False
-    
+
+
+    def bulk_upsert(self, wsi_entries: Iterable[WSI_ENTRY], batch_size: int = 5_000) -> int:
+        """Upsert (or delete, for empty entries) many WSI entries.
+
+        Entries are consumed lazily and written with `executemany`, one transaction
+        per batch, so arbitrarily large imports run in bounded memory.
+
+        Returns:
+            int: Number of entries processed.
+        """
+        count = 0
+        batch: List[WSI_ENTRY] = []
+        for wsi_entry in wsi_entries:
+            batch.append(wsi_entry)
+            if len(batch) >= batch_size:
+                count += self._write_batch(batch)
+                batch = []
+        if batch:
+            count += self._write_batch(batch)
+
+        self.logger.info("Bulk upserted %d WSI entries", count)
+        return count
+
+    def _write_batch(self, batch: List[WSI_ENTRY]) -> int:
+        """Write a batch of entries (and their label/note index rows) in one transaction.
+
+        A path given more than once in the batch is written once, from its last entry.
+        """
+        paths = []
+        deletes = []
+        upserts = []
+        labels = []
+        notes = []
+        for wsi_entry in {wsi_entry.wsi_path: wsi_entry for wsi_entry in batch}.values():
+            paths.append((wsi_entry.wsi_path,))
+            if wsi_entry.note is None and not wsi_entry.labels:
+                deletes.append((wsi_entry.wsi_path,))
+                continue
+
+            # Convert list to comma-separated string
+            upserts.append((wsi_entry.wsi_path, wsi_entry.note, ", ".join(wsi_entry.labels)))
+            labels.extend((wsi_entry.wsi_path, label) for label in wsi_entry.labels)
+            if wsi_entry.note:
+                notes.append((wsi_entry.wsi_path, wsi_entry.note))
+
+        with self.pool.transaction() as conn:
+            conn.executemany(DELETE_LABELS_SQL, paths)
+            if self.fts_enabled:
+                conn.executemany(DELETE_NOTE_FTS_SQL, paths)
+            if deletes:
+                conn.executemany(DELETE_WSI_SQL, deletes)
+            if upserts:
+                conn.executemany(UPSERT_WSI_SQL, upserts)
+            if labels:
+                conn.executemany(INSERT_LABEL_SQL, labels)
+            if notes and self.fts_enabled:
+                conn.executemany(INSERT_NOTE_FTS_SQL, notes)
+        return len(batch)
+
+    def bulk_export(
+        self,
+        wsi_paths: Iterable[str] | None = None,
+        batch_size: int = 5_000,
+    ) -> Iterator[WSI_ENTRY]:
+        """Stream WSI entries, either all of them (ordered by path) or those in `wsi_paths`.
+
+        Paths without an entry are skipped. Each page is fetched completely on the
+        calling thread's connection (keyset pagination, no cursor held open between
+        pages), so the generator can be consumed from a threadpool.
+        """
+        if wsi_paths is None:
+            last_path = ""
+            while True:
+                rows = self.pool.connection().execute(EXPORT_WSI_SQL, (last_path, batch_size)).fetchall()
+                for row in rows:
+                    yield self._row_to_entry(row)
+                if len(rows) < batch_size:
+                    return
+                last_path = rows[-1][0]
+
+        batch: List[str] = []
+        for wsi_path in wsi_paths:
+            batch.append(wsi_path)
+            if len(batch) >= 500:  # stay well under SQLite's bound-parameter limit
+                yield from self._export_paths(batch)
+                batch = []
+        if batch:
+            yield from self._export_paths(batch)
+
+    def _export_paths(self, wsi_paths: List[str]) -> List[WSI_ENTRY]:
+        placeholders = ", ".join("?" for _ in wsi_paths)
+        rows = self.pool.connection().execute(
+            f"SELECT wsi_path, note, labels FROM wsi WHERE wsi_path IN ({placeholders})",
+            wsi_paths,
+        ).fetchall()
+        return [self._row_to_entry(row) for row in rows]
+
+
+    def get_labels(self) -> List[Tuple[str, int]]:
+        """Return every distinct label with the number of slides carrying it."""
+        return self.pool.connection().execute(
+            "SELECT label, COUNT(*) FROM wsi_labels GROUP BY label ORDER BY label"
+        ).fetchall()
+
+    def _search_query(
+        self,
+        labels: List[str] | None,
+        match_all: bool,
+        note_query: str | None,
+    ) -> Tuple[str, list]:
+        """Build a `SELECT wsi_path ...` query (and its parameters) for a label/note search."""
+        subqueries = []
+        params: list = []
+
+        if labels:
+            placeholders = ", ".join("?" for _ in labels)
+            if match_all:
+                subqueries.append(
+                    f"SELECT wsi_path FROM wsi_labels WHERE label IN ({placeholders}) "
+                    f"GROUP BY wsi_path HAVING COUNT(*) = ?"
+                )
+                params.extend(labels)
+                params.append(len({label.lower() for label in labels}))
+            else:
+                subqueries.append(f"SELECT DISTINCT wsi_path FROM wsi_labels WHERE label IN ({placeholders})")
+                params.extend(labels)
+
+        if note_query and note_query.strip():
+            if self.fts_enabled:
+                fts_query = _to_fts_query(note_query)
+                # Nothing left to match (e.g. only "*"): no note condition, as for a blank query
+                if fts_query:
+                    subqueries.append("SELECT wsi_path FROM wsi_notes_fts WHERE wsi_notes_fts MATCH ?")
+                    params.append(fts_query)
+            else:
+                subqueries.append("SELECT wsi_path FROM wsi WHERE note LIKE ?")
+                params.append(f"%{note_query.strip()}%")
+
+        if not subqueries:
+            return "SELECT wsi_path FROM wsi", params
+        return " INTERSECT ".join(subqueries), params
+
+    def search_wsi(
+        self,
+        labels: List[str] | None = None,
+        match_all: bool = True,
+        note_query: str | None = None,
+        limit: int | None = 100,
+        offset: int = 0,
+    ) -> Tuple[List[str], int]:
+        """Find slides by label and/or note text.
+
+        Args:
+            labels (List[str] | None): Labels to match (case-insensitive).
+            match_all (bool): Require every label (True) or any of them (False).
+            note_query (str | None): Words that must all appear in the note. A trailing
+                `*` on a word makes it a prefix match.
+            limit (int | None): Page size, or None for all matches.
+            offset (int): Number of matches to skip.
+
+        Returns:
+            Tuple[List[str], int]: One page of matching WSI paths (sorted) and the total match count.
+        """
+        query, params = self._search_query(labels, match_all, note_query)
+        conn = self.pool.connection()
+
+        total = conn.execute(f"SELECT COUNT(*) FROM ({query})", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT wsi_path FROM ({query}) ORDER BY wsi_path LIMIT ? OFFSET ?",
+            [*params, -1 if limit is None else limit, offset],
+        ).fetchall()
+        return [row[0] for row in rows], total
+
 
     def close(self):
-        """Close the database connection."""
-        self.conn.close()
+        """Close the database connections."""
+        self.pool.close()
         self.logger.info("Database connection closed")
+
+
+def _to_fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query: every word quoted (so user input can never be
+    a syntax error) and implicitly AND-ed, keeping a trailing `*` as a prefix match.
+
+    Returns "" when no word is left (e.g. "*"); callers must not MATCH that."""
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
@@ -0,0 +1,146 @@
+import io
+import csv
+from typing import Iterable, Iterator, List
+
+from src.data_models import WSI_ENTRY
+
+CSV_COLUMNS = ["wsi_path", "note", "labels"]
+# Same separator the `wsi.labels` column uses
+LABEL_SEPARATOR = ", "
+
+
+def _parse_labels(value) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [label.strip() for label in value.split(",") if label.strip()]
+    return [str(label) for label in value]
+
+
+def _to_entry(wsi_path, note, labels) -> WSI_ENTRY:
+    return WSI_ENTRY(
+        wsi_path=str(wsi_path),
+        note=note if note not in ("", None) else None,
+        labels=_parse_labels(labels),
+    )
+
+
+def read_wsi_entries(
+    path: str,
+    wsi_path_column: str = "wsi_path",
+    note_column: str = "note",
+    labels_column: str = "labels",
+    batch_size: int = 10_000,
+) -> Iterator[WSI_ENTRY]:
+    """Stream WSI entries from a CSV or Parquet file without loading it into memory.
+
+    Labels may be a comma-separated string or (Parquet only) a list column.
+    Missing note/labels columns are treated as empty.
+    """
+    if path.lower().endswith(".parquet"):
+        yield from _read_parquet(path, wsi_path_column, note_column, labels_column, batch_size)
+    else:
+        yield from _read_csv(path, wsi_path_column, note_column, labels_column)
+
+
+def _read_csv(path, wsi_path_column, note_column, labels_column) -> Iterator[WSI_ENTRY]:
+    with open(path, "r", newline="") as f:
+        for row in csv.DictReader(f):
+            yield _to_entry(row[wsi_path_column], row.get(note_column), row.get(labels_column))
+
+
+def _read_parquet(path, wsi_path_column, note_column, labels_column, batch_size) -> Iterator[WSI_ENTRY]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Reading Parquet files requires `pyarrow` (pip install pyarrow)")
+
+    parquet_file = pq.ParquetFile(path)
+    available = set(parquet_file.schema_arrow.names)
+    columns = [c for c in (wsi_path_column, note_column, labels_column) if c in available]
+
+    for record_batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        for row in record_batch.to_pylist():
+            yield _to_entry(row[wsi_path_column], row.get(note_column), row.get(labels_column))
+
+
+def _csv_row(wsi_entry: WSI_ENTRY) -> List[str]:
+    return [wsi_entry.wsi_path, wsi_entry.note or "", LABEL_SEPARATOR.join(wsi_entry.labels)]
+
+
+def iter_csv_lines(wsi_entries: Iterable[WSI_ENTRY], chunk_size: int = 1_000) -> Iterator[str]:
+    """Encode WSI entries as CSV text, yielding one chunk per `chunk_size` rows (header first)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+
+    n_rows = 0
+    for wsi_entry in wsi_entries:
+        writer.writerow(_csv_row(wsi_entry))
+        n_rows += 1
+        if n_rows % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue()
+
+
+def write_wsi_entries(wsi_entries: Iterable[WSI_ENTRY], path: str, batch_size: int = 10_000) -> int:
+    """Write WSI entries to a CSV or Parquet file, streaming in batches.
+
+    Returns:
+        int: Number of entries written.
+    """
+    if path.lower().endswith(".parquet"):
+        return _write_parquet(wsi_entries, path, batch_size)
+
+    count = 0
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for wsi_entry in wsi_entries:
+            writer.writerow(_csv_row(wsi_entry))
+            count += 1
+    return count
+
+
+def _write_parquet(wsi_entries: Iterable[WSI_ENTRY], path: str, batch_size: int) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Writing Parquet files requires `pyarrow` (pip install pyarrow)")
+
+    schema = pa.schema([
+        ("wsi_path", pa.string()),
+        ("note", pa.string()),
+        ("labels", pa.list_(pa.string())),
+    ])
+
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        batch: List[WSI_ENTRY] = []
+        for wsi_entry in wsi_entries:
+            batch.append(wsi_entry)
+            if len(batch) >= batch_size:
+                writer.write_batch(_to_record_batch(batch, schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_batch(_to_record_batch(batch, schema))
+            count += len(batch)
+    return count
+
+
+def _to_record_batch(batch: List[WSI_ENTRY], schema):
+    import pyarrow as pa
+
+    return pa.RecordBatch.from_pydict(
+        {
+            "wsi_path": [e.wsi_path for e in batch],
+            "note": [e.note for e in batch],
+            "labels": [e.labels for e in batch],
+        },
+        schema=schema,
+    )
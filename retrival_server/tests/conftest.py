@@ -0,0 +1,24 @@
+import sys
+from pathlib import Path
+
+# Tests import the server modules as `src.*`, like the scripts do
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+
+def write_test_slide(path: str, side: int = 1024) -> str:
+    """Two-level tiled generic TIFF (side x side at level 0) that OpenSlide can open."""
+    import numpy as np
+    import pytest
+
+    tifffile = pytest.importorskip("tifffile")
+    pytest.importorskip("openslide")
+    with tifffile.TiffWriter(path) as tif:
+        for level, level_side in enumerate([side, side // 2]):
+            tif.write(
+                np.full((level_side, level_side, 3), 200, dtype=np.uint8),
+                tile=(256, 256),
+                photometric="rgb",
+                subfiletype=1 if level else 0,
+            )
+    return path
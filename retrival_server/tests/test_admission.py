@@ -0,0 +1,41 @@
+import asyncio
+
+from src.admission import AdmissionController, ClassPolicy, client_key
+
+
+def test_low_priority_burst_leaves_room_for_tiles():
+    async def run():
+        policies = {
+            "tile": ClassPolicy(priority=0, max_concurrency=8),
+            "thumbnail": ClassPolicy(priority=1, max_concurrency=8, max_queue=64),
+            "query": ClassPolicy(priority=2, max_concurrency=8, max_queue=64),
+        }
+        controller = AdmissionController(policies, total_slots=8, reserved_slots=2)
+
+        # Saturate the lower classes: only total - reserved of them may run
+        waiters = [
+            asyncio.create_task(controller.acquire(name, f"client-{i}"))
+            for i in range(12) for name in ("thumbnail", "query")
+        ]
+        await asyncio.sleep(0)
+        assert controller.running_lower == 6
+        assert controller.running_total == 6
+
+        # A tile is still admitted immediately
+        await asyncio.wait_for(controller.acquire("tile", "viewer"), timeout=0.1)
+        assert controller.running["tile"] == 1
+
+        for task in waiters:
+            task.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+def test_client_key_ignores_forwarded_for_from_untrusted_peers():
+    scope = {"client": ("10.0.0.5", 1234), "headers": [(b"x-forwarded-for", b"1.2.3.4")]}
+    assert client_key(scope) == "10.0.0.5"
+    assert client_key(scope, trusted_proxies={"10.0.0.5"}) == "1.2.3.4"
+
+    spoofed = {"client": ("10.0.0.5", 1234), "headers": [(b"x-forwarded-for", b"6.6.6.6, 1.2.3.4")]}
+    assert client_key(spoofed, trusted_proxies={"10.0.0.5"}) == "1.2.3.4"
@@ -0,0 +1,97 @@
+import asyncio
+import uuid
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+from src.collection_registry import CollectionRegistry, CollectionSearch, merge_groups
+from src.data_models import CollectionEntry, GROUP_BY_FIELDS, WSITilePayload
+from src.qdrant_db import AsyncTileVectorDB
+
+
+def tile_payload(tile_uuid: str, i: int) -> dict:
+    return dict(
+        uuid=tile_uuid, patient_id=f"p{i % 5}", wsi_path=f"/slides/s{i % 7}.svs", dataset="DFCI",
+        magnification="20x", stain="H&E", x=i * 224, y=0, size=224,
+    )
+
+
+async def build_search(n_points: int = 200) -> tuple[CollectionSearch, AsyncTileVectorDB, list[str]]:
+    rng = np.random.default_rng(0)
+    client = AsyncQdrantClient(":memory:")
+    await client.create_collection("primary", vectors_config=VectorParams(size=16, distance=Distance.COSINE))
+    ids = [str(uuid.UUID(int=i + 1)) for i in range(n_points)]
+    await client.upsert("primary", [
+        PointStruct(id=tile_uuid, vector=rng.normal(size=16).tolist(), payload=tile_payload(tile_uuid, i))
+        for i, tile_uuid in enumerate(ids)
+    ])
+    db = AsyncTileVectorDB(":memory:", "primary", qdrant_client=client)
+    search = await CollectionSearch.create(CollectionRegistry([], primary="primary"), db, ":memory:")
+    return search, db, ids
+
+
+def test_fan_out_matches_single_collection_query():
+    async def run():
+        search, db, ids = await build_search()
+        for tile_uuid in ids[:5]:
+            single = await db.run_query(tile_uuid, max_hits=10, min_similarity=None)
+            fanned, status = await search.run_query(
+                tile_uuid, search.registry.select(), max_hits=10, min_similarity=None,
+            )
+            assert status == {"primary": "ok"}
+            assert tile_uuid not in [hit.uuid for hit in fanned]
+            assert [hit.uuid for hit in fanned] == [hit.uuid for hit in single]
+            assert np.allclose([hit.score for hit in fanned], [hit.score for hit in single], atol=1e-5)
+
+    asyncio.run(run())
+
+
+def test_fan_out_skips_other_embedding_models():
+    async def run():
+        search, _, ids = await build_search()
+        other = CollectionEntry(name="other", embedding_model="conch")
+        _, status = await search.run_query(
+            ids[0], search.registry.select() + [other], max_hits=5, min_similarity=None,
+        )
+        assert status["primary"] == "ok"
+        assert status["other"].startswith("skipped")
+
+    asyncio.run(run())
+
+
+def test_unavailable_collections_are_retried():
+    async def run():
+        search, db, ids = await build_search()
+        registry = CollectionRegistry([CollectionEntry(name="late")], primary="primary")
+        # "late" is registered on the same node but not created yet
+        search = await CollectionSearch.create(registry, db, ":memory:")
+        assert "late" in search.status()["unavailable"]
+
+        _, status = await search.run_query(ids[0], registry.select(), max_hits=5, min_similarity=None)
+        assert status["late"].startswith("skipped: unavailable")
+
+        await db.qdrant_client.create_collection("late", vectors_config=VectorParams(size=16, distance=Distance.COSINE))
+        # Still backing off: not retried yet
+        _, status = await search.run_query(ids[0], registry.select(), max_hits=5, min_similarity=None)
+        assert status["late"].startswith("skipped")
+
+        error, _, delay = search.unavailable["late"]
+        search.unavailable["late"] = (error, 0.0, delay)
+        _, status = await search.run_query(ids[0], registry.select(), max_hits=5, min_similarity=None)
+        assert status == {"primary": "ok", "late": "ok"}
+        assert search.status()["unavailable"] == {}
+
+    asyncio.run(run())
+
+
+def test_merge_groups_regroups_across_collections():
+    def hit(tile_uuid: str, slide: str, score: float) -> WSITilePayload:
+        return WSITilePayload(**{**tile_payload(tile_uuid, 0), "wsi_path": slide}, score=score)
+
+    first = [hit("a1", "/a.svs", 0.9), hit("a2", "/a.svs", 0.5), hit("b1", "/b.svs", 0.8)]
+    # "a1" is stored in both collections and counts once
+    second = [hit("c1", "/c.svs", 0.95), hit("a1", "/a.svs", 0.9), hit("a3", "/a.svs", 0.7)]
+
+    merged = merge_groups([first, second], GROUP_BY_FIELDS.WSI_PATH, max_groups=2, group_size=2)
+    assert [h.uuid for h in merged] == ["c1", "a1", "a3"]
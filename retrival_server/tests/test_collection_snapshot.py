@@ -0,0 +1,53 @@
+import uuid
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+from src.collection_snapshot import export_collection, import_collection, read_manifest, snapshot_filter
+from src.qdrant_db import TileVectorDB
+
+
+def make_db(client: QdrantClient, name: str) -> TileVectorDB:
+    client.create_collection(name, vectors_config=VectorParams(size=8, distance=Distance.COSINE))
+    return TileVectorDB(":memory:", name, qdrant_client=client)
+
+
+def test_export_import_round_trip(tmp_path):
+    client = QdrantClient(":memory:")
+    source = make_db(client, "source")
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(25, 8)).astype(np.float32)
+    ids = [str(uuid.UUID(int=i + 1)) for i in range(25)]
+    client.upsert("source", [
+        PointStruct(id=point_id, vector=vector.tolist(), payload={
+            "uuid": point_id, "wsi_path": f"/slides/s{i % 3}.svs", "x": i * 256, "tags": ["rare"] if i % 2 else [],
+        })
+        for i, (point_id, vector) in enumerate(zip(ids, vectors))
+    ])
+
+    manifest = export_collection(source, str(tmp_path), shard_size=10)
+    assert manifest["n_points"] == 25
+    assert [shard["n_points"] for shard in read_manifest(str(tmp_path))["shards"]] == [10, 10, 5]
+
+    target = make_db(client, "target")
+    assert import_collection(target, str(tmp_path), parallel=1) == 25
+
+    restored = {str(point.id): point for point in client.retrieve("target", ids, with_vectors=True)}
+    for i, point_id in enumerate(ids):
+        original = client.retrieve("source", [point_id])[0]
+        assert restored[point_id].payload == original.payload
+        # float16 storage: cosine vectors come back normalized, to ~3 decimals
+        expected = vectors[i] / np.linalg.norm(vectors[i])
+        assert np.allclose(restored[point_id].vector, expected, atol=2e-3)
+
+
+def test_export_of_a_filtered_subset(tmp_path):
+    client = QdrantClient(":memory:")
+    source = make_db(client, "source")
+    client.upsert("source", [
+        PointStruct(id=i + 1, vector=[1.0] * 8, payload={"wsi_path": f"/slides/s{i % 2}.svs"})
+        for i in range(10)
+    ])
+    manifest = export_collection(source, str(tmp_path), scroll_filter=snapshot_filter(wsi_paths=["/slides/s0.svs"]))
+    assert manifest["n_points"] == 5
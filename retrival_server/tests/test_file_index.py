@@ -0,0 +1,28 @@
+from src.file_index import DirectoryIndex
+
+
+def test_pages_follow_the_cursor_with_directories_first(tmp_path):
+    for name in ["b_dir", "a_dir"]:
+        (tmp_path / name).mkdir()
+    for name in ["s3.svs", "s1.svs", "notes.txt", "s2.ndpi"]:
+        (tmp_path / name).write_bytes(b"")
+    index = DirectoryIndex()
+
+    dirs, files, cursor = index.page(str(tmp_path), limit=3)
+    assert (dirs, files) == (["a_dir", "b_dir"], ["s1.svs"])
+    dirs, files, cursor = index.page(str(tmp_path), cursor=cursor, limit=3)
+    assert (dirs, files, cursor) == ([], ["s2.ndpi", "s3.svs"], None)
+
+    assert index.page(str(tmp_path), prefix="s2") == ([], ["s2.ndpi"], None)
+
+
+def test_readable_cache_is_bounded(tmp_path):
+    index = DirectoryIndex(max_readable=3)
+    paths = []
+    for i in range(10):
+        path = tmp_path / f"s{i}.svs"
+        path.write_bytes(b"not a slide")
+        paths.append(str(path))
+        assert not index.is_readable(str(path))
+
+    assert list(index._readable) == paths[-3:]
@@ -0,0 +1,56 @@
+import asyncio
+import io
+
+import numpy as np
+from PIL import Image
+
+from src.data_models import DATASETS, MAGNIFICATIONS, STAINS, WSITilePayload
+from src.heatmap import HeatmapCache, HeatmapRaster, score_colormap
+
+
+def tile(uuid: str, x: int, y: int, score: float | None) -> WSITilePayload:
+    return WSITilePayload(
+        uuid=uuid, patient_id="p", wsi_path="/slides/a.svs", dataset=DATASETS.DFCI,
+        magnification=MAGNIFICATIONS.X20, stain=STAINS.HE, x=x, y=y, size=256, score=score,
+    )
+
+
+def decode(data: bytes) -> np.ndarray:
+    return np.asarray(Image.open(io.BytesIO(data)).convert("RGBA"))
+
+
+def test_raster_renders_scores_at_their_tiles():
+    raster = HeatmapRaster(
+        [tile("a", 0, 0, 1.0), tile("b", 256, 0, -1.0), tile("c", 0, 256, None)],
+        slide_width=512, slide_height=512,
+    )
+    assert raster.scores == {"a": 1.0, "b": -1.0}
+
+    # Level 0 of a 2-level pyramid is downsampled twice: the whole slide is one 256 px tile
+    pixels = decode(raster.render_tile(z=0, x=0, y=0, level_count=2))
+    assert pixels.shape == (256, 256, 4)
+    assert tuple(pixels[10, 10]) == tuple(score_colormap()[255])
+    assert tuple(pixels[10, 200]) == tuple(score_colormap()[0])
+    # Unscored tile and tiles past the slide are transparent
+    assert pixels[200, 10, 3] == 0
+
+    assert decode(raster.render_tile(z=1, x=5, y=5, level_count=2))[..., 3].max() == 0
+
+
+def test_concurrent_requests_share_one_raster_build():
+    async def run():
+        cache = HeatmapCache(max_rasters=2)
+        builds = []
+
+        async def build():
+            builds.append(1)
+            await asyncio.sleep(0.01)
+            return "raster"
+
+        results = await asyncio.gather(*[cache.get_raster("key", build) for _ in range(5)])
+        assert results == ["raster"] * 5
+        assert len(builds) == 1
+        assert await cache.get_raster("key", build) == "raster"
+        assert len(builds) == 1
+
+    asyncio.run(run())
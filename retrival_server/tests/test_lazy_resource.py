@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from src.lazy_resource import LazyResource, ResourceUnavailable
+
+
+class Client:
+    def __init__(self) -> None:
+        self.alive = True
+        self.closed = False
+
+    def ping(self) -> str:
+        return "pong"
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_factory_is_retried_until_it_succeeds():
+    async def run():
+        attempts = []
+
+        def factory():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ConnectionError("not up yet")
+            return Client()
+
+        resource = LazyResource("client", factory, retry_interval=0.01)
+        with pytest.raises(ResourceUnavailable):
+            resource.ping()
+
+        await asyncio.wait_for(resource.run(), timeout=5)
+        assert resource.ready
+        assert resource.ping() == "pong"
+        assert resource.status()["attempts"] == 3
+
+        await resource.shutdown()
+        assert resource.get_instance().closed
+
+    asyncio.run(run())
+
+
+def test_health_check_drives_readiness():
+    async def run():
+        client = Client()
+        resource = LazyResource(
+            "client", lambda: client, health_check=lambda c: c.alive, check_interval=0.01,
+        )
+        task = asyncio.create_task(resource.run())
+        await asyncio.sleep(0.05)
+        assert resource.ready
+
+        client.alive = False
+        await asyncio.sleep(0.05)
+        assert not resource.ready
+        with pytest.raises(ResourceUnavailable, match="health check failed"):
+            resource.ping()
+
+        client.alive = True
+        await asyncio.sleep(0.05)
+        assert resource.ready
+        task.cancel()
+
+    asyncio.run(run())
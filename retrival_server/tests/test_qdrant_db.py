@@ -0,0 +1,61 @@
+import asyncio
+import uuid
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+from src.qdrant_db import AsyncTileVectorDB
+
+
+async def build_db(n_points: int = 120) -> tuple[AsyncTileVectorDB, list[str]]:
+    rng = np.random.default_rng(0)
+    client = AsyncQdrantClient(":memory:")
+    await client.create_collection("tiles", vectors_config=VectorParams(size=16, distance=Distance.COSINE))
+    ids = [str(uuid.UUID(int=i + 1)) for i in range(n_points)]
+    await client.upsert("tiles", [
+        PointStruct(id=tile_uuid, vector=rng.normal(size=16).tolist(), payload=dict(
+            uuid=tile_uuid, patient_id=f"p{i % 5}", wsi_path=f"/slides/s{i % 7}.svs", dataset="DFCI",
+            magnification="20x", stain="H&E", x=i * 224, y=0, size=224,
+        ))
+        for i, tile_uuid in enumerate(ids)
+    ])
+    return AsyncTileVectorDB(":memory:", "tiles", qdrant_client=client), ids
+
+
+def test_iter_query_pages_match_run_query():
+    async def run():
+        db, ids = await build_db()
+        expected = await db.run_query(ids[0], max_hits=50, min_similarity=None, offset=10)
+
+        pages = await db.iter_query(ids[0], max_hits=50, min_similarity=None, offset=10, page_size=16)
+        sizes, hits = [], []
+        async for page in pages:
+            sizes.append(len(page))
+            hits.extend(page)
+
+        assert sizes == [16, 16, 16, 2]
+        assert [hit["uuid"] for hit in hits] == [tile.uuid for tile in expected]
+
+    asyncio.run(run())
+
+
+def test_iter_query_fetches_pages_lazily():
+    async def run():
+        db, ids = await build_db()
+        calls = []
+        query_points = db.qdrant_client.query_points
+
+        async def counting_query_points(**kwargs):
+            calls.append(kwargs["limit"])
+            return await query_points(**kwargs)
+
+        db.qdrant_client.query_points = counting_query_points
+        pages = await db.iter_query(ids[0], max_hits=100, min_similarity=None, page_size=10, payload_fields=["uuid"])
+        first = await pages.__anext__()
+
+        assert calls == [10]
+        assert set(first[0]) == {"uuid", "score"}
+        await pages.aclose()
+
+    asyncio.run(run())
@@ -0,0 +1,21 @@
+import pytest
+
+from conftest import write_test_slide
+from src import region_export
+from src.region_export import read_regions
+
+
+@pytest.fixture
+def slide_path(tmp_path):
+    return write_test_slide(str(tmp_path / "slide.tif"))
+
+
+def test_regions_too_large_for_their_level_are_reported(slide_path, monkeypatch):
+    monkeypatch.setattr(region_export, "MAX_REGION_SIZE", 256)
+    results = read_regions(slide_path, [(0, 0, 0, 256, 0), (1, 0, 0, 512, 0), (2, 0, 0, 512, 1)], "png")
+
+    by_index = {index: (data, error) for index, data, error in results}
+    assert by_index[0][0] is not None and by_index[0][1] is None
+    assert by_index[1][0] is None and "at most 256px" in by_index[1][1]
+    # Same region read at level 1 is 256 px wide
+    assert by_index[2][0] is not None
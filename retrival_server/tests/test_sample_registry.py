@@ -0,0 +1,41 @@
+import json
+import os
+
+import pytest
+
+from src.sample_registry import SampleRegistry
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "samples.json"
+    path.write_text(json.dumps({"s1": "/slides/1.svs", "s2": "/slides/2.svs"}))
+    return path
+
+
+def test_reimport_drops_ids_removed_from_the_source(tmp_path, source):
+    registry = SampleRegistry(str(tmp_path / "db"), source_paths=[str(source)])
+    assert registry.get_wsi_path("s2") == "/slides/2.svs"
+    registry.close()
+
+    source.write_text(json.dumps({"s1": "/slides/1b.svs", "s3": "/slides/3.svs"}))
+    os.utime(source, (os.path.getmtime(source) + 10,) * 2)
+
+    registry = SampleRegistry(str(tmp_path / "db"), source_paths=[str(source)])
+    assert registry.get_wsi_path("s1") == "/slides/1b.svs"
+    assert registry.get_wsi_path("s2") is None
+    assert registry.get_wsi_path("s3") == "/slides/3.svs"
+    assert list(registry.iter_wsi_paths()) == ["/slides/1b.svs", "/slides/3.svs"]
+    registry.close()
+
+
+def test_resolve_finds_a_file_created_after_a_miss(tmp_path):
+    registry = SampleRegistry(str(tmp_path / "db"))
+    slide = tmp_path / "new.svs"
+
+    assert registry.resolve(str(slide)) is None
+    slide.write_bytes(b"")
+    assert registry.resolve(str(slide)) == str(slide)
+    # Raw paths are served, not registered
+    assert registry.get_wsi_path(str(slide)) is None
+    registry.close()
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from conftest import write_test_slide
+from src.slide_descriptor_cache import SlideDescriptorCache
+
+
+def test_descriptors_persist_until_the_slide_changes(tmp_path):
+    slide = write_test_slide(str(tmp_path / "slide.tif"))
+    cache = SlideDescriptorCache(str(tmp_path / "db"))
+    descriptor = cache.get(slide)
+    assert descriptor.slide_dimensions == [(1024, 1024), (512, 512)]
+    assert descriptor.level_tiles[-1] == (4, 4)
+    cache.close()
+
+    # A fresh cache (e.g. after a restart) answers from SQLite without opening the slide
+    cache = SlideDescriptorCache(str(tmp_path / "db"))
+    computed = []
+    compute = cache._compute
+    cache._compute = lambda *args: computed.append(args) or compute(*args)
+    assert cache.get(slide) == descriptor
+    assert computed == []
+
+    # A rewritten slide is opened again
+    write_test_slide(slide, side=2048)
+    os.utime(slide, (descriptor.mtime + 10,) * 2)
+    assert cache.get(slide).slide_dimensions == [(2048, 2048), (1024, 1024)]
+    assert len(computed) == 1
+    cache.close()
+
+
+def test_missing_slides_raise(tmp_path):
+    cache = SlideDescriptorCache(str(tmp_path / "db"))
+    with pytest.raises(FileNotFoundError):
+        cache.get(str(tmp_path / "missing.svs"))
+    cache.close()
@@ -0,0 +1,74 @@
+from uuid import uuid4
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.models import VectorParams
+
+from src.data_models import DATASETS, MAGNIFICATIONS, STAINS, WSITilePayload
+from src.slide_embeddings import SlideVectorDB, normalize
+
+DIM = 8
+
+
+@pytest.fixture
+def slide_db():
+    client = QdrantClient(location=":memory:")
+    client.create_collection("tiles", vectors_config=VectorParams(size=DIM, distance="Cosine"))
+    return SlideVectorDB(client, "tiles", n_centroids=2)
+
+
+def make_tiles(positions, wsi_path="/slides/a.svs"):
+    # Fresh uuid4 IDs, like the ingest script
+    return [
+        WSITilePayload(
+            uuid=str(uuid4()),
+            patient_id="p1",
+            wsi_path=wsi_path,
+            dataset=DATASETS.DFCI,
+            magnification=MAGNIFICATIONS.X20,
+            stain=STAINS.HE,
+            x=x,
+            y=y,
+            size=256,
+        )
+        for x, y in positions
+    ]
+
+
+def test_reingesting_a_slide_counts_its_tiles_once(slide_db):
+    rng = np.random.default_rng(0)
+    positions = [(256 * i, 0) for i in range(20)]
+    vectors = rng.random((20, DIM), dtype=np.float32)
+
+    slide_db.add_tiles(make_tiles(positions), vectors)
+    slide_db.add_tiles(make_tiles(positions), vectors)
+
+    payload, embedding = slide_db.get_slide("/slides/a.svs", MAGNIFICATIONS.X20)
+    assert payload.n_tiles == 20
+    assert slide_db.qdrant_client.count("tiles").count == 20
+    np.testing.assert_allclose(embedding.mean, normalize(vectors).mean(axis=0), atol=1e-5)
+
+
+def test_new_tiles_are_folded_into_the_slide(slide_db):
+    rng = np.random.default_rng(1)
+    vectors = rng.random((30, DIM), dtype=np.float32)
+    positions = [(256 * i, 0) for i in range(30)]
+
+    slide_db.add_tiles(make_tiles(positions[:20]), vectors[:20])
+    # Overlaps the first batch by 5 tiles
+    slide_db.add_tiles(make_tiles(positions[15:]), vectors[15:])
+
+    payload, embedding = slide_db.get_slide("/slides/a.svs", MAGNIFICATIONS.X20)
+    assert payload.n_tiles == 30
+    assert slide_db.qdrant_client.count("tiles").count == 30
+    np.testing.assert_allclose(embedding.mean, normalize(vectors).mean(axis=0), atol=1e-5)
+
+    rebuilt = slide_db.rebuild_slide("/slides/a.svs", MAGNIFICATIONS.X20)
+    assert rebuilt.n_tiles == 30
+
+
+def test_tiles_of_several_slides_are_rejected(slide_db):
+    tiles = make_tiles([(0, 0)]) + make_tiles([(0, 0)], wsi_path="/slides/b.svs")
+    with pytest.raises(ValueError):
+        slide_db.add_tiles(tiles, np.ones((2, DIM), dtype=np.float32))
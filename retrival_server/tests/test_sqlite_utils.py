@@ -0,0 +1,46 @@
+import threading
+
+from src.data_models import WSI_ENTRY
+from src.sqlite_utils import ThreadLocalSQLite
+from src.wsi_db import WSI_DB
+
+
+def test_each_thread_gets_its_own_wal_connection(tmp_path):
+    pool = ThreadLocalSQLite(str(tmp_path / "test.db"))
+    main_conn = pool.connection()
+    assert pool.connection() is main_conn
+    assert main_conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(pool.connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not main_conn
+    pool.close()
+
+
+def test_concurrent_writers_from_threads(tmp_path):
+    db = WSI_DB(db_dir_path=str(tmp_path))
+    errors = []
+
+    def write(worker: int) -> None:
+        try:
+            for i in range(25):
+                entry = WSI_ENTRY(wsi_path=f"/slides/{worker}-{i}.svs", note=f"note {i}", labels=[f"w{worker}"])
+                # update_wsi logs and returns False on errors
+                assert db.update_wsi(entry)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert dict(db.get_labels()) == {f"w{worker}": 25 for worker in range(8)}
+    # Upsert replaces the entry rather than adding to it
+    db.update_wsi(WSI_ENTRY(wsi_path="/slides/0-0.svs", note="updated", labels=["other"]))
+    assert db.get_wsi("/slides/0-0.svs") == WSI_ENTRY(wsi_path="/slides/0-0.svs", note="updated", labels=["other"])
+    db.close()
@@ -0,0 +1,46 @@
+import os
+import threading
+
+from src import thumbnails
+from src.thumbnails import ThumbnailCache
+
+
+def test_thumbnails_are_rendered_once_and_written_atomically(tmp_path, monkeypatch):
+    renders = []
+    barrier = threading.Barrier(8)
+
+    def fake_render(wsi_path, size, quality):
+        renders.append(wsi_path)
+        # Every thread renders at once, so all of them write the same cache file
+        barrier.wait(timeout=5)
+        return f"{wsi_path}|{size}".encode()
+
+    monkeypatch.setattr(thumbnails, "render_thumbnail", fake_render)
+    slide = tmp_path / "a.svs"
+    slide.write_bytes(b"slide")
+    cache = ThumbnailCache(str(tmp_path / "cache"), max_workers=8)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(str(slide), 128))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [f"{slide}|128".encode()] * 8
+    cache_dir = os.path.dirname(cache.cache_path(str(slide), 128))
+    assert os.listdir(cache_dir) == [os.path.basename(cache.cache_path(str(slide), 128))]
+
+    # Cached from now on
+    assert cache.get(str(slide), 128) == f"{slide}|128".encode()
+    assert len(renders) == 8
+
+
+def test_get_many_maps_unreadable_slides_to_none(tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbnails, "render_thumbnail", lambda wsi_path, size, quality: b"jpeg")
+    slide = tmp_path / "a.svs"
+    slide.write_bytes(b"slide")
+    cache = ThumbnailCache(str(tmp_path / "cache"))
+
+    missing = str(tmp_path / "missing.svs")
+    assert cache.get_many([str(slide), missing, str(slide)]) == {str(slide): b"jpeg", missing: None}
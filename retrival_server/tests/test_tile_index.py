@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from src.data_models import DATASETS, MAGNIFICATIONS, STAINS, WSITilePayload
+from src.tile_index import TileGridIndex, TileIndexCache
+
+
+def make_tiles(n: int, seed: int = 0) -> list[WSITilePayload]:
+    rng = np.random.default_rng(seed)
+    magnifications = [MAGNIFICATIONS.X20, MAGNIFICATIONS.X10]
+    return [
+        WSITilePayload(
+            uuid=str(i), patient_id="p", wsi_path="/slides/a.svs", dataset=DATASETS.DFCI,
+            magnification=magnifications[i % 2], stain=STAINS.HE,
+            x=int(rng.integers(0, 50_000)), y=int(rng.integers(0, 50_000)), size=256 * (1 + i % 2),
+        )
+        for i in range(n)
+    ]
+
+
+def brute_force(tiles, x0, y0, x1, y1, magnification=None):
+    return [
+        tile for tile in tiles
+        if tile.x < x1 and tile.x + tile.size > x0 and tile.y < y1 and tile.y + tile.size > y0
+        and (magnification is None or tile.magnification == magnification)
+    ]
+
+
+def test_query_matches_brute_force():
+    tiles = make_tiles(2_000)
+    index = TileGridIndex(tiles)
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        x0, y0 = rng.uniform(-5_000, 55_000, size=2)
+        width, height = rng.uniform(1, 20_000, size=2)
+        magnification = [None, MAGNIFICATIONS.X20, MAGNIFICATIONS.X10][int(rng.integers(0, 3))]
+        expected = brute_force(tiles, x0, y0, x0 + width, y0 + height, magnification)
+        assert index.query(x0, y0, x0 + width, y0 + height, magnification) == expected
+
+
+def test_query_outside_or_huge_boxes():
+    tiles = make_tiles(500)
+    index = TileGridIndex(tiles)
+    assert index.query(-1e6, -1e6, -1e5, -1e5) == []
+    assert index.query(-1e12, -1e12, 1e12, 1e12) == tiles
+    assert index.query(0, 0, 1e12, 1e12, MAGNIFICATIONS.X5) == []
+    with pytest.raises(ValueError):
+        index.query(0, 0, float("inf"), 100)
+
+
+def test_cached_index_is_rebuilt_when_the_slide_gains_tiles():
+    stored = {"/slides/a.svs": make_tiles(10)}
+    loads = []
+
+    def load_tiles(wsi_path):
+        loads.append(wsi_path)
+        return list(stored[wsi_path])
+
+    cache = TileIndexCache(load_tiles, lambda wsi_path: len(stored[wsi_path]), ttl=0)
+    assert len(cache.get("/slides/a.svs").tiles) == 10
+    # Unchanged count: the cached index is reused
+    assert len(cache.get("/slides/a.svs").tiles) == 10
+    assert len(loads) == 1
+
+    stored["/slides/a.svs"] = make_tiles(15)
+    assert len(cache.get("/slides/a.svs").tiles) == 15
+    assert len(loads) == 2
@@ -0,0 +1,68 @@
+import time
+
+from src.tissue_mask import TissueMaskCache
+
+
+def wait_for_builds(cache: TissueMaskCache) -> None:
+    # One worker: anything submitted after the builds runs after them
+    cache._executor.submit(lambda: None).result()
+
+
+def test_failed_masks_are_retried_after_a_while(tmp_path):
+    slide = tmp_path / "broken.svs"
+    slide.write_bytes(b"not a slide")
+    cache = TissueMaskCache(str(tmp_path / "masks"), max_workers=1, retry_after=0.2)
+
+    assert cache.get(str(slide)) is None
+    wait_for_builds(cache)
+    assert len(cache._failed) == 1
+
+    # Within retry_after: not rescheduled
+    assert cache.get(str(slide)) is None
+    assert not cache._pending
+
+    time.sleep(0.25)
+    assert cache.get(str(slide)) is None
+    assert cache._pending or cache._failed
+    wait_for_builds(cache)
+    (failed_at,) = cache._failed.values()
+    assert time.monotonic() - failed_at < 0.2
+    cache.close()
+
+
+def slide_descriptor():
+    from src.data_models import SlideDescriptor
+
+    # 2048 x 2048 slide: DeepZoom levels 0..11, the last one 8 x 8 tiles of 256 px
+    return SlideDescriptor(
+        wsi_path="/slides/a.svs", mtime=0.0, size=0, level_count=12,
+        level_dimensions=[(2048 >> (11 - z), 2048 >> (11 - z)) for z in range(12)],
+        level_tiles=[(max((2048 >> (11 - z)) // 256, 1), max((2048 >> (11 - z)) // 256, 1)) for z in range(12)],
+        slide_dimensions=[(2048, 2048)], slide_downsamples=[1.0],
+    )
+
+
+def test_blank_tiles_are_out_of_range_or_glass():
+    import numpy as np
+    from main import is_blank_tile
+    from src.tissue_mask import TissueMask
+
+    # Tissue only in the top-left quarter of the slide
+    mask_pixels = np.zeros((64, 64), dtype=bool)
+    mask_pixels[:32, :32] = True
+    mask = TissueMask(mask_pixels, 2048, 2048)
+    descriptor = slide_descriptor()
+
+    assert not is_blank_tile(descriptor, mask, 11, 0, 0)
+    assert is_blank_tile(descriptor, mask, 11, 7, 7)
+    # Tile straddling the tissue border counts as tissue
+    assert not is_blank_tile(descriptor, mask, 11, 3, 3)
+    assert is_blank_tile(descriptor, mask, 11, 8, 0)
+    assert is_blank_tile(descriptor, mask, 12, 0, 0)
+    # Whole slide in one tile at level 8
+    assert not is_blank_tile(descriptor, mask, 8, 0, 0)
+
+    # Without a mask only the bounds are known
+    assert not is_blank_tile(descriptor, None, 11, 7, 7)
+    assert is_blank_tile(descriptor, None, 11, 8, 0)
+    assert not is_blank_tile(None, mask, 11, 8, 0)
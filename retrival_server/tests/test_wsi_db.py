@@ -0,0 +1,40 @@
+import pytest
+
+from src.data_models import WSI_ENTRY
+from src.wsi_db import WSI_DB
+
+
+@pytest.fixture
+def wsi_db(tmp_path):
+    db = WSI_DB(db_dir_path=str(tmp_path))
+    db.update_wsi(WSI_ENTRY(wsi_path="/slides/a.svs", note="adenocarcinoma, solid pattern", labels=["tumor"]))
+    db.update_wsi(WSI_ENTRY(wsi_path="/slides/b.svs", note="normal lung", labels=[]))
+    yield db
+    db.close()
+
+
+def test_note_search_prefix(wsi_db):
+    assert wsi_db.search_wsi(note_query="adeno*") == (["/slides/a.svs"], 1)
+
+
+@pytest.mark.parametrize("note_query", ["*", "** *"])
+def test_note_search_without_words_does_not_filter(wsi_db, note_query):
+    paths, total = wsi_db.search_wsi(note_query=note_query)
+    assert total == 2
+    assert paths == ["/slides/a.svs", "/slides/b.svs"]
+
+    paths, total = wsi_db.search_wsi(labels=["tumor"], note_query=note_query)
+    assert paths == ["/slides/a.svs"]
+
+
+def test_bulk_upsert_keeps_the_last_entry_of_a_repeated_path(wsi_db):
+    count = wsi_db.bulk_upsert([
+        WSI_ENTRY(wsi_path="/slides/c.svs", note="first squamous note", labels=["old"]),
+        WSI_ENTRY(wsi_path="/slides/c.svs", note="second squamous note", labels=["new"]),
+    ])
+    assert count == 2
+
+    assert [entry.labels for entry in wsi_db.bulk_export(["/slides/c.svs"])] == [["new"]]
+    assert wsi_db.search_wsi(labels=["old"]) == ([], 0)
+    assert wsi_db.search_wsi(note_query="first") == ([], 0)
+    assert wsi_db.search_wsi(note_query="squamous") == (["/slides/c.svs"], 1)